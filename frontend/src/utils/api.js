@@ -40,7 +40,8 @@ export async function apiFetch(path, options = {}) {
   const contentType = resp.headers.get('content-type') || ''
   const body = contentType.includes('application/json') ? await resp.json().catch(() => ({})) : await resp.text()
   if (!resp.ok) {
-    const msg = typeof body === 'string' ? body : body?.message || `HTTP ${resp.status}`
+    const detail = typeof body?.detail === 'string' ? body.detail : undefined
+    const msg = typeof body === 'string' ? body : body?.message || detail || `HTTP ${resp.status}`
     const err = new Error(msg)
     err.status = resp.status
     err.body = body
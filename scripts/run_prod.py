@@ -17,5 +17,12 @@ if __name__ == "__main__":
         port=8000,
         reload=False,
         log_level="info",
-        workers=1
+        # Per-request access lines cost more than they tell at production volume
+        access_log=False,
+        # uvloop/httptools where installed (uvicorn[standard]), asyncio/h11 otherwise
+        loop="auto",
+        http="auto",
+        # Worker processes share the file-backed prompt cache and the SQLite
+        # knowledge base, so responses cached by one are served by the others
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
     )
@@ -226,7 +226,7 @@ class TaskExecutor:
                 mermaid_diagram = ""
             
             # Use AI client to analyze structure with diagram context
-            analysis = self.ai_client.analyze_repository(repo_data, mermaid_diagram)
+            analysis = await self.ai_client.analyze_repository(repo_data, mermaid_diagram)
             
             # Extract components and patterns
             components = analysis.get('components', [])
@@ -3,7 +3,6 @@ Main Agentic Orchestrator - Autonomous decision-making workflows
 """
 import logging
 import time
-import traceback
 from typing import List, Dict, Any, Optional, Set
 from datetime import datetime, timedelta
 
@@ -107,8 +106,7 @@ class AgenticOrchestrator:
             )
             
         except Exception as e:
-            logger.error(f"❌ Autonomous analysis failed: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Autonomous analysis failed: %s", e)
             
             execution_time = (datetime.now() - start_time).total_seconds()
             
@@ -508,7 +506,7 @@ class AgenticOrchestrator:
         
         # Calculate organizational metrics
         context["organizational_metrics"] = {
-            "repos_in_knowledge_base": len(self.knowledge_base.list_repositories()),
+            "repos_in_knowledge_base": self.knowledge_base.count_repositories(),
             "avg_repo_complexity": self._calculate_avg_complexity(target_repos),
             "dominant_languages": self._get_dominant_languages(target_repos)
         }
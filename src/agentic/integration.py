@@ -99,6 +99,8 @@ class AgenticIntegrationAdapter:
         class MockKnowledgeBase:
             def list_repositories(self):
                 return []
+            def count_repositories(self):
+                return 0
             def get_repository_knowledge(self, repo_name):
                 return {}
             def get_all_repositories_knowledge(self):
@@ -111,7 +113,7 @@ class AgenticIntegrationAdapter:
     def _create_mock_ai_client(self):
         """Create a mock AI client for testing"""
         class MockAIClient:
-            def analyze_repository(self, repo_data, mermaid_diagram):
+            async def analyze_repository(self, repo_data, mermaid_diagram):
                 return {
                     "components": [],
                     "architecture_patterns": [],
@@ -3,6 +3,7 @@ Tool registry for dynamic tool selection and management
 """
 from typing import Dict, List, Callable, Any, Optional
 from dataclasses import dataclass
+from datetime import datetime
 import inspect
 import logging
 
@@ -96,7 +97,6 @@ class ToolRegistry:
             / perf["usage_count"]
         )
         
-        from datetime import datetime
         perf["last_used"] = datetime.now()
         
     def get_tool_stats(self) -> Dict[str, Dict[str, Any]]:
@@ -1,3 +1,5 @@
+from collections import deque
+from itertools import count, islice
 from typing import List, Dict, Optional
 from datetime import datetime
 from .memory_manager import MemoryManager
@@ -8,10 +10,16 @@ import uuid
 
 logger = logging.getLogger(__name__)
 
+# Latest messages kept in memory per repository; older ones stay in the chat_history
+# table. At least the 100 that the history endpoints return.
+MAX_CACHED_MESSAGES = 128
+
 
 class ConversationManager:
     def __init__(self):
         self.conversations = {}  # repo_name -> conversation history (in-memory cache)
+        # Source of conversation versions; every change to a conversation takes the next one
+        self._versions = count(1)
         self.knowledge_base = KnowledgeBase()  # Database storage
         
         # Initialize memory manager
@@ -27,10 +35,15 @@ class ConversationManager:
     def start_conversation(self, repo_name: str, repo_context: Dict = None):
         """Start a new conversation for a repository"""
         session_id = str(uuid.uuid4())
+        version = next(self._versions)
         
         self.conversations[repo_name] = {
             'session_id': session_id,
-            'messages': [],
+            'messages': deque(maxlen=MAX_CACHED_MESSAGES),
+            'message_count': 0,
+            'version': version,
+            # The repo context is only replaced along with the whole conversation
+            'context_version': version,
             'repo_context': repo_context,
             'created_at': datetime.now().isoformat()
         }
@@ -40,10 +53,12 @@ class ConversationManager:
     def add_message(self, repo_name: str, role: str, content: str,
                     metadata: Dict = None, session_id: str = None):
         """Add a message to the conversation history"""
-        if repo_name not in self.conversations:
+        conversation = self.conversations.get(repo_name)
+        if conversation is None:
             session_id = self.start_conversation(repo_name)
+            conversation = self.conversations[repo_name]
         else:
-            session_id = session_id or self.conversations[repo_name].get('session_id', str(uuid.uuid4()))
+            session_id = session_id or conversation.get('session_id') or str(uuid.uuid4())
 
         message_id = str(uuid.uuid4())
         message = {
@@ -54,8 +69,10 @@ class ConversationManager:
             'metadata': metadata or {}
         }
 
-        # Add to in-memory cache
-        self.conversations[repo_name]['messages'].append(message)
+        # Add to in-memory cache; the oldest message drops out once it is full
+        conversation['messages'].append(message)
+        conversation['message_count'] += 1
+        conversation['version'] = next(self._versions)
         
         # Store in database
         self.knowledge_base.store_chat_message(
@@ -81,21 +98,27 @@ class ConversationManager:
     def load_conversation_from_db(self, repo_name: str, session_id: str = None):
         """Load conversation history from database"""
         try:
-            messages = self.knowledge_base.get_chat_history(repo_name, session_id)
+            # Only the tail that fits in memory is read; the rest stays in the database
+            messages = self.knowledge_base.get_chat_history(repo_name, session_id, limit=MAX_CACHED_MESSAGES)
             
             # Load into in-memory cache
             if messages:
+                message_count, created_at = self.knowledge_base.get_chat_summary(repo_name, session_id)
                 # Use the session_id from the first message or create new one
                 actual_session_id = session_id or str(uuid.uuid4())
+                version = next(self._versions)
                 
                 self.conversations[repo_name] = {
                     'session_id': actual_session_id,
-                    'messages': messages,
+                    'messages': deque(messages, maxlen=MAX_CACHED_MESSAGES),
+                    'message_count': message_count,
+                    'version': version,
+                    'context_version': version,
                     'repo_context': {},
-                    'created_at': messages[0]['timestamp'] if messages else datetime.now().isoformat()
+                    'created_at': created_at or messages[0]['timestamp']
                 }
                 
-                logger.info(f"Loaded {len(messages)} messages for {repo_name}")
+                logger.info(f"Loaded {len(messages)} of {message_count} messages for {repo_name}")
                 return messages
             else:
                 # No messages found, start new conversation
@@ -111,13 +134,14 @@ class ConversationManager:
         try:
             # Load conversation from database
             messages = self.load_conversation_from_db(repo_name, session_id)
+            conversation = self.conversations.get(repo_name, {})
             
             return {
                 'success': True,
                 'repo_name': repo_name,
-                'session_id': self.conversations.get(repo_name, {}).get('session_id'),
+                'session_id': conversation.get('session_id'),
                 'messages': messages,
-                'message_count': len(messages)
+                'message_count': conversation.get('message_count', len(messages))
             }
         except Exception as e:
             logger.error(f"Error switching conversation: {e}")
@@ -127,18 +151,26 @@ class ConversationManager:
                 'repo_name': repo_name
             }
 
+    def version(self, repo_name: str) -> int:
+        """Number that changes whenever the repository's conversation changes; 0 if there is none"""
+        conversation = self.conversations.get(repo_name)
+        return conversation['version'] if conversation else 0
+
+    def context_version(self, repo_name: str) -> int:
+        """Number that changes whenever the repository's context is replaced; 0 if there is none"""
+        conversation = self.conversations.get(repo_name)
+        return conversation['context_version'] if conversation else 0
+
     def get_conversation_history(self, repo_name: str,
                                  max_messages: int = 10) -> List[Dict]:
         """Get conversation history for a repository"""
-        if repo_name not in self.conversations:
+        conversation = self.conversations.get(repo_name)
+        if conversation is None or max_messages <= 0:
             return []
 
-        messages = self.conversations[repo_name]['messages']
+        messages = conversation['messages']
         # Return last max_messages messages
-        if len(messages) > max_messages:
-            return messages[-max_messages:]
-        else:
-            return messages
+        return list(islice(messages, max(0, len(messages) - max_messages), None))
 
     def format_conversation_for_ai(self, repo_name: str,
                                    max_messages: int = 10) -> str:
@@ -160,9 +192,8 @@ class ConversationManager:
 
     def get_repo_context(self, repo_name: str) -> Optional[Dict]:
         """Get repository context"""
-        if repo_name in self.conversations:
-            return self.conversations[repo_name].get('repo_context')
-        return None
+        conversation = self.conversations.get(repo_name)
+        return conversation.get('repo_context') if conversation else None
 
     def chat_with_memory(self, repo_name: str, message: str,
                          user_id: str = None) -> str:
@@ -5,11 +5,45 @@ from typing import List, Dict
 from google import genai
 from mem0 import Memory
 import os
+import functools
 import logging
 import json
+import re
+import heapq
+from collections import Counter
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Texts whose mem0 embeddings are kept in memory, so repeated searches for the
+# same question (and its key terms) skip the embedding model
+EMBEDDING_CACHE_SIZE = 2048
+
+
+def _memoize_embeddings(embed):
+    """Wrap a mem0 embedder's embed(text, memory_action) with an LRU cache"""
+    @functools.lru_cache(maxsize=EMBEDDING_CACHE_SIZE)
+    def cached(text, memory_action):
+        return tuple(embed(text, memory_action))
+
+    @functools.wraps(embed)
+    def memoized(text, memory_action=None):
+        if not isinstance(text, str):
+            return embed(text, memory_action)
+        # A fresh list each call, since callers may hand it on to the vector store
+        return list(cached(text, memory_action))
+
+    memoized.cache_info = cached.cache_info
+    return memoized
+
+
+def _can_overlap(term: str, other: str) -> bool:
+    """Whether an occurrence of term can share characters with one of other"""
+    if term in other or other in term:
+        return True
+    return any(term.endswith(other[:k]) or other.endswith(term[:k])
+               for k in range(1, min(len(term), len(other))))
+
 
 class MemoryManager:
     def __init__(self, api_key: str = None):
@@ -19,7 +53,7 @@ class MemoryManager:
         
         # Initialize enhanced local memory
         self.local_memory = {}  # user_id -> list of memories
-        self.memory_index = {}  # user_id -> search index
+        self.memory_index = {}  # user_id -> {word: positions in local_memory[user_id]}
         
         # Try to initialize mem0 as optional enhancement
         self.memory = None
@@ -57,6 +91,9 @@ class MemoryManager:
                 }
 
                 self.memory = Memory.from_config(config)
+                embedder = getattr(self.memory, 'embedding_model', None)
+                if embedder is not None:
+                    embedder.embed = _memoize_embeddings(embedder.embed)
                 logger.info("Memory system initialized with mem0 enhancement")
                 
             except Exception as e:
@@ -75,12 +112,25 @@ class MemoryManager:
         # Try mem0 first
         if self.memory:
             try:
-                # Add individual messages as separate memories for better search
-                for msg in messages:
+                # Pair each user question with the assistant response that
+                # follows it so one turn is stored as a single memory
+                i = 0
+                while i < len(messages):
+                    msg = messages[i]
                     content = msg.get("content", "")
                     role = msg.get("role", "user")
+                    next_msg = messages[i + 1] if i + 1 < len(messages) else None
+                    i += 1
                     
-                    if role == "user":
+                    if role == "user" and next_msg and next_msg.get("role") == "assistant":
+                        answer = next_msg.get("content", "")[:1000]  # Limit length
+                        self.memory.add(
+                            f"Q: {content}\nA: {answer}",
+                            user_id=user_id,
+                            metadata={"type": "qa", "timestamp": self._get_timestamp()}
+                        )
+                        i += 1
+                    elif role == "user":
                         # Add user questions as searchable memories
                         self.memory.add(
                             f"User asked: {content}",
@@ -107,14 +157,21 @@ class MemoryManager:
             if user_id not in self.local_memory:
                 self.local_memory[user_id] = []
             
+            user_memories = self.local_memory[user_id]
+            user_index = self.memory_index.setdefault(user_id, {})
             for msg in messages:
+                content = msg.get("content", "")
+                content_lower = content.lower()
                 memory_entry = {
                     "role": msg.get("role", "user"),
-                    "content": msg.get("content", ""),
+                    "content": content,
+                    "content_lower": content_lower,  # Cached for search
                     "timestamp": self._get_timestamp(),
                     "metadata": msg.get("metadata", {})
                 }
-                self.local_memory[user_id].append(memory_entry)
+                for word in set(content_lower.split()):
+                    user_index.setdefault(word, []).append(len(user_memories))
+                user_memories.append(memory_entry)
             
             logger.info(f"Added conversation to local memory for user {user_id}")
             success = True
@@ -138,26 +195,31 @@ class MemoryManager:
                 
                 results = related_memories.get("results", [])
                 
-                # If we don't have enough results, try broader searches
-                if len(results) < limit:
-                    # Extract key terms from the query for expanded search
-                    key_terms = self._extract_key_terms(query)
-                    
-                    for term in key_terms:
-                        if len(results) >= limit:
-                            break
-                            
-                        additional_memories = self.memory.search(
-                            query=term,
-                            user_id=user_id,
-                            limit=limit - len(results)
-                        )
+                # Primary search already satisfied the limit, skip expansion
+                if len(results) >= limit:
+                    logger.info(f"Found {len(results)} relevant memories from mem0 for query: {query}")
+                    return results
+                
+                # Not enough results, try broader searches on key terms
+                key_terms = self._extract_key_terms(query)
+                existing_memories = {r.get('memory', '') for r in results}
+                
+                for term in key_terms:
+                    if len(results) >= limit:
+                        break
                         
-                        # Add new memories (avoid duplicates)
-                        existing_memories = {r.get('memory', '') for r in results}
-                        for mem in additional_memories.get("results", []):
-                            if mem.get('memory', '') not in existing_memories:
-                                results.append(mem)
+                    additional_memories = self.memory.search(
+                        query=term,
+                        user_id=user_id,
+                        limit=limit - len(results)
+                    )
+                    
+                    # Add new memories (avoid duplicates)
+                    for mem in additional_memories.get("results", []):
+                        memory_text = mem.get('memory', '')
+                        if memory_text not in existing_memories:
+                            existing_memories.add(memory_text)
+                            results.append(mem)
                 
                 if results:
                     logger.info(f"Found {len(results)} relevant memories from mem0 for query: {query}")
@@ -169,35 +231,59 @@ class MemoryManager:
         # Fallback to enhanced local memory search
         if user_id in self.local_memory:
             local_memories = self.local_memory[user_id]
-            query_terms = query.lower().split()
+            query_lower = query.lower()
+            # Term -> how often it appears in the query; each occurrence scores once
+            term_weights = Counter(query_lower.split())
+            query_terms = set(term_weights)
+            # The scan finds non-overlapping matches, so a term that can overlap
+            # another (inside it, or sharing an edge like "auth"/"the") gets its own check
+            shadowed_terms = [term for term in query_terms
+                              if any(other != term and _can_overlap(term, other) for other in query_terms)]
             scored_memories = []
             
+            # Single alternation of all query terms, compiled once per query.
+            # Longest terms first so a term isn't shadowed by its own prefix.
+            term_pattern = None
+            if query_terms:
+                term_pattern = re.compile('|'.join(
+                    map(re.escape, sorted(query_terms, key=len, reverse=True))
+                ))
+            
+            # Query terms contain no whitespace, so any match lies inside one indexed
+            # word; only memories holding such a word can score
+            user_index = self.memory_index.get(user_id)
+            if query_terms and user_index is not None:
+                positions = set()
+                for word, word_positions in user_index.items():
+                    if term_pattern.search(word):
+                        positions.update(word_positions)
+                local_memories = [local_memories[i] for i in sorted(positions)]
+            
             # Enhanced text matching with scoring
             for memory in local_memories:
-                content = memory.get('content', '').lower()
+                content = memory.get('content_lower')
+                if content is None:
+                    content = memory.get('content', '').lower()
                 score = 0
                 
                 # Exact phrase match gets highest score
-                if query.lower() in content:
+                if query_lower in content:
                     score += 10
                 
-                # Individual word matches
-                for term in query_terms:
-                    if term in content:
-                        score += 1
-                
-                # Partial word matches
-                for term in query_terms:
-                    if any(term in word for word in content.split()):
-                        score += 0.5
+                # 1 per query term present plus 0.5 for it lying inside a word, which
+                # always holds for whitespace-free terms; distinct terms found in one scan
+                if term_pattern is not None:
+                    matched = set(term_pattern.findall(content))
+                    matched.update(term for term in shadowed_terms if term in content)
+                    score += 1.5 * sum(term_weights[term] for term in matched)
                 
                 if score > 0:
                     scored_memories.append((score, memory))
             
-            # Sort by score and return top results
-            scored_memories.sort(key=lambda x: x[0], reverse=True)
+            # Select top results with a bounded heap instead of a full sort
+            top_memories = heapq.nlargest(limit, scored_memories, key=lambda x: x[0])
             
-            for score, memory in scored_memories[:limit]:
+            for score, memory in top_memories:
                 results.append({
                     'memory': memory.get('content', ''),
                     'score': score,
@@ -389,7 +475,6 @@ class MemoryManager:
 
     def _get_timestamp(self) -> str:
         """Get current timestamp for memory metadata"""
-        from datetime import datetime
         return datetime.now().isoformat()
 
     def debug_memory_status(self, user_id: str) -> Dict:
@@ -3,11 +3,184 @@ Multi-Model AI Client
 Tries different AI models when one fails (Gemini, OpenAI, etc.)
 """
 import os
-from typing import Dict, Any, Optional
-import google.generativeai as genai
-from openai import OpenAI
+import asyncio
+import random
+import hashlib
+import heapq
+import io
+import logging
+import re
+from collections import OrderedDict
+from itertools import chain, islice
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple, AsyncIterator, Sequence
+import httpx
+import orjson
 from ..utils.prompt_cache import PromptCache
 from ..utils.model_error_handler import ModelErrorHandler
+from ..utils.circuit_breaker import CircuitBreaker
+from ..utils.rate_limiter import TokenBucket
+from ..utils.bulkhead import Bulkhead, BulkheadFull
+from ..utils.semantic_cache import SemanticCache
+from ..utils.token_budget import truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+
+# Static instructions are kept free of interpolation and always sent first, so
+# every request shares an identical prefix that providers can cache
+# (OpenAI automatic prompt caching, Gemini implicit caching). Per-request
+# repository data follows as separate content parts, most stable part first.
+ANALYZE_SYSTEM_PREFIX = """You are an expert software architect analyzing an ALREADY UPLOADED repository. Analyze ONLY the provided files.
+
+You will receive, after these instructions:
+- SUMMARY CONTEXT: existing knowledge about the repository (may be empty)
+- ARCHITECTURE DIAGRAM: a Mermaid diagram of the system
+- CURATED FILE LIST: the most important files, ranked by importance
+- ACTUAL CODE SAMPLES: excerpts from key files
+
+TASK: Provide:
+1) Architecture summary with file references
+2) Data flow/API structure citing files/functions
+3) Integration points and dependencies
+4) Specific recommendations with exact file paths
+
+Only use the provided context. Do not suggest accessing external repositories."""
+
+FEATURE_SYSTEM_PREFIX = """You are an expert software architect with COMPLETE ACCESS to the full codebase.
+
+IMPORTANT: You are NOT working with a "high-level description" - you have the COMPLETE source code, provided after these instructions.
+
+TASK: Analyze the COMPLETE codebase and provide SPECIFIC, actionable recommendations for implementing the FEATURE REQUEST given with it.
+
+The codebase analysis contains the full repository structure, key component files, configuration files, the architecture diagram, existing analysis and actual source code from the repository.
+This is NOT a high-level description - you have full access to the implementation details.
+
+Based on the COMPLETE codebase analysis, provide SPECIFIC recommendations:
+
+1. EXACT FILE PATHS where code should be added/modified (reference actual files you see)
+2. SPECIFIC FUNCTIONS/CLASSES to modify (look at the actual code samples provided)
+3. NEW FILES to create with exact paths and purposes
+4. INTEGRATION POINTS with existing code patterns (reference the actual code you see)
+5. DEPENDENCIES that might need to be added
+6. STEP-BY-STEP implementation plan with specific code changes
+
+Be extremely specific and reference the actual files, functions, and patterns you see in the codebase.
+Do NOT give generic responses - you have the full codebase context."""
+
+# How long the current provider gets before the next one is started alongside it
+HEDGE_DELAY_SECONDS = 2.0
+
+# Number of assembled analysis prompts kept in memory
+PROMPT_MEMO_SIZE = 64
+
+# Number of scanned repositories kept in memory
+SUMMARY_MEMO_SIZE = 8
+
+# Timeout retries back off exponentially from RETRY_BASE_DELAY seconds, capped at
+# RETRY_MAX_DELAY, and sleep a random fraction of that (full jitter)
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 8.0
+
+# OpenAI model routing by estimated input size, unless OPENAI_MODEL pins one
+SMALL_INPUT_TOKENS = 4000
+OPENAI_SMALL_MODEL = 'gpt-4o-mini'
+OPENAI_LARGE_MODEL = 'gpt-4o'
+
+# How often expired prompt cache files are removed in the background
+CACHE_JANITOR_INTERVAL_SECONDS = 60.0
+
+# Cached analyses older than this are still served but refreshed in the background
+CACHE_SOFT_TTL_HOURS = 6
+
+# Answers cached per question and context, reused without building the prompt
+ANSWER_CACHE_TTL_HOURS = 1
+
+# Cosine similarity at which a differently worded question about the same
+# context reuses an earlier answer
+ANSWER_SIMILARITY_THRESHOLD = 0.95
+
+# Sampling temperature of chat responses
+CHAT_TEMPERATURE = 0.7
+
+# Above this temperature an answer is one sample among many, so a merely similar
+# prompt's answer is not reused; only the exact-match tier is consulted
+SEMANTIC_CACHE_MAX_TEMPERATURE = 0.3
+
+# Language and framework markers for the offline fallback analysis
+_LANG_RE = re.compile(r'\.(js|jsx|ts|tsx|py|java|go)(?:$|[/\s])')
+_FRAMEWORK_RE = re.compile(r'(?:^|/)(package\.json|requirements\.txt|pyproject\.toml|dockerfile)', re.M)
+_LANG_LABELS = [
+    ({'js', 'jsx', 'ts', 'tsx'}, 'JavaScript/TypeScript'),
+    ({'py'}, 'Python'),
+    ({'java'}, 'Java'),
+    ({'go'}, 'Go'),
+]
+
+# Path keywords used to categorize files for feature placement
+_COMPONENT_PATH_RE = re.compile(r'component|page|view|controller', re.I)
+_CONFIG_PATH_RE = re.compile(r'config|env|setting|package\.json', re.I)
+
+# Importance signals for ranking files in the analysis prompt, one regex per weight
+_RANK_PATTERNS = [
+    (re.compile(r'main\.py|app\.py|server|api/|routes|controllers|views|pages|handler', re.I), 5),
+    (re.compile(r'model|schema|entity|dto', re.I), 3),
+    (re.compile(r'service|usecase|repository/', re.I), 3),
+    (re.compile(r'config|settings|env|docker|compose|requirements\.txt|package\.json', re.I), 2),
+    (re.compile(r'\.(?:py|ts|tsx|js|jsx)$', re.I), 1),
+]
+
+# Requests per minute each provider type is paced to, overridable with <TYPE>_RPM
+PROVIDER_RPM = {'gemini': 60, 'openai': 60, 'azure_openai': 60, 'anthropic': 50}
+
+# Concurrent calls allowed per provider type, overridable with <TYPE>_MAX_CONCURRENT;
+# calls queued longer than BULKHEAD_MAX_WAIT_SECONDS are shed to the next provider
+PROVIDER_MAX_CONCURRENT = {'gemini': 8, 'openai': 8, 'azure_openai': 8, 'anthropic': 4}
+BULKHEAD_MAX_WAIT_SECONDS = 5.0
+
+# Connection pool shared by all OpenAI-compatible clients
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=300)
+
+# Hard limits per provider call, set a little above observed p95 latency so a hung
+# connection fails over instead of waiting out the SDK default
+PROVIDER_HTTP_TIMEOUT = httpx.Timeout(25.0, connect=5.0)
+GEMINI_TIMEOUT_SECONDS = 20.0
+PROVIDER_CALL_TIMEOUT_SECONDS = 30.0
+
+# Breaker weight of a timeout relative to other errors
+TIMEOUT_FAILURE_WEIGHT = 2
+
+# Token budgets for the analysis code samples, per file and across all files
+SNIPPET_MAX_TOKENS = 300
+SNIPPETS_MAX_TOKENS = 3000
+
+
+def _file_rank(path: str) -> int:
+    """Sort key putting entry points, models, services and config files first"""
+    return -sum(weight for pattern, weight in _RANK_PATTERNS if pattern.search(path))
+
+
+@dataclass(frozen=True, slots=True)
+class ModelEntry:
+    """A configured provider model; its SDK clients are built on first use"""
+    name: str
+    type: str
+    api_key: Optional[str] = None
+    model_id: Optional[str] = None
+    endpoint: Optional[str] = None
+
+
+@dataclass(slots=True)
+class _RepoSummary:
+    """One scan of a repository, shared by the analysis and feature placement prompts"""
+    fingerprint: str
+    content_sizes: Dict[str, int]
+    file_details: str  # "- path (type, N chars)" line per file
+    file_count: int
+    component_files: list
+    config_files: list
+    ranked_files: list  # top paths by _file_rank
+    total_files: int
 
 
 class MultiModelClient:
@@ -17,66 +190,523 @@ class MultiModelClient:
     
     def __init__(self):
         self.models = []
-        self.cache = PromptCache()
+        self.cache = PromptCache(soft_ttl_hours=CACHE_SOFT_TTL_HOURS)
+        self.cache.start_janitor(CACHE_JANITOR_INTERVAL_SECONDS)
+        self.answer_cache = PromptCache(ttl_hours=ANSWER_CACHE_TTL_HOURS)
+        self.semantic_cache = SemanticCache()
+        # Questions, not prompts: /ask-question prompts are far longer than the
+        # embedding model reads, so the prompt-level tier never sees them
+        self.answer_semantic_cache = SemanticCache(threshold=ANSWER_SIMILARITY_THRESHOLD,
+                                                   ttl_hours=ANSWER_CACHE_TTL_HOURS)
         self.error_handler = ModelErrorHandler()
-        self._initialize_models()
+        self._prompt_memo = OrderedDict()  # analysis content key / feature context key -> prompt parts
+        self._summary_memo = OrderedDict()  # repo fingerprint -> _RepoSummary
+        self._in_flight = {}  # request key -> task shared by identical concurrent requests
+        self._async_http_client = self._create_http_client()
+        self._clients = {}  # model name -> (client, async client), filled by _get_clients
+        self._register_models()
+        self._breakers = {model.name: CircuitBreaker() for model in self.models}
+        self._buckets = {
+            model.name: TokenBucket.per_minute(
+                float(os.getenv(f"{model.type.upper()}_RPM", PROVIDER_RPM.get(model.type, 60)))
+            )
+            for model in self.models
+        }
+        self._bulkheads = {
+            model_type: Bulkhead(
+                model_type,
+                int(os.getenv(f"{model_type.upper()}_MAX_CONCURRENT", PROVIDER_MAX_CONCURRENT.get(model_type, 8))),
+                BULKHEAD_MAX_WAIT_SECONDS
+            )
+            for model_type in {model.type for model in self.models}
+        }
+    
+    def _create_http_client(self) -> httpx.AsyncClient:
+        """Create a pooled HTTP/2 client, falling back to HTTP/1.1 if h2 is missing"""
+        try:
+            return httpx.AsyncClient(http2=True, limits=HTTP_POOL_LIMITS)
+        except ImportError:
+            logger.warning("⚠️ h2 not installed, using HTTP/1.1 connection pool")
+            return httpx.AsyncClient(limits=HTTP_POOL_LIMITS)
+    
+    def circuit_states(self) -> Dict[str, str]:
+        """Current circuit breaker state per model name"""
+        return {name: breaker.state for name, breaker in self._breakers.items()}
     
-    def _initialize_models(self):
-        """Initialize available AI models"""
+    async def close(self):
+        """Close the shared HTTP connection pool"""
+        await self._async_http_client.aclose()
+    
+    def _register_models(self):
+        """Register providers that have credentials; SDK clients are created lazily"""
         
         # Gemini - prioritize GOOGLE_API_KEY since it's more reliable
         gemini_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
         if gemini_key and gemini_key != "your_gemini_api_key_here":
-            try:
-                # Store the API key and configure
-                genai.configure(api_key=gemini_key)
-                self.models.append({
-                    'name': 'Gemini',
-                    'client': genai.GenerativeModel('gemini-1.5-flash'),
-                    'type': 'gemini',
-                    'api_key': gemini_key  # Store the key for later use
-                })
-                print("✅ Gemini model initialized")
-            except Exception as e:
-                print(f"⚠️ Gemini initialization failed: {e}")
+            self.models.append(ModelEntry(
+                name='Gemini',
+                type='gemini',
+                api_key=gemini_key,
+                model_id='gemini-1.5-flash'
+            ))
+            logger.info("✅ Gemini model registered")
         
         # OpenAI
         openai_key = os.getenv("OPENAI_API_KEY")
         if openai_key and openai_key != "your_openai_key_here":
-            try:
-                openai_client = OpenAI(api_key=openai_key)
-                self.models.append({
-                    'name': 'OpenAI',
-                    'client': openai_client,
-                    'type': 'openai'
-                })
-                print("✅ OpenAI model initialized")
-            except Exception as e:
-                print(f"⚠️ OpenAI initialization failed: {e}")
+            self.models.append(ModelEntry(
+                name='OpenAI',
+                type='openai',
+                api_key=openai_key,
+                model_id=os.getenv("OPENAI_MODEL")
+            ))
+            logger.info("✅ OpenAI model registered")
         
         # Azure OpenAI
         azure_key = os.getenv("AZURE_OPENAI_KEY")
         azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
         if azure_key and azure_key != "your_azure_key_here" and azure_endpoint:
-            try:
-                azure_client = OpenAI(
-                    api_key=azure_key,
-                    azure_endpoint=azure_endpoint,
-                    api_version="2024-02-01"
-                )
-                self.models.append({
-                    'name': 'Azure OpenAI',
-                    'client': azure_client,
-                    'type': 'azure_openai'
-                })
-                print("✅ Azure OpenAI model initialized")
-            except Exception as e:
-                print(f"⚠️ Azure OpenAI initialization failed: {e}")
+            self.models.append(ModelEntry(
+                name='Azure OpenAI',
+                type='azure_openai',
+                api_key=azure_key,
+                endpoint=azure_endpoint,
+                model_id=os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-3.5-turbo")
+            ))
+            logger.info("✅ Azure OpenAI model registered")
+        
+        # Anthropic
+        anthropic_key = os.getenv("ANTHROPIC_API_KEY")
+        if anthropic_key and anthropic_key != "your_anthropic_key_here":
+            self.models.append(ModelEntry(
+                name='Anthropic',
+                type='anthropic',
+                api_key=anthropic_key,
+                model_id=os.getenv("ANTHROPIC_MODEL", "claude-3-5-sonnet-latest")
+            ))
+            logger.info("✅ Anthropic model registered")
         
         if not self.models:
-            print("⚠️ No AI models available - will use mock responses")
+            logger.warning("⚠️ No AI models available - will use mock responses")
     
-    def analyze_repository(self, repo_knowledge: Dict, mermaid_diagram: str) -> Dict:
+    def _get_clients(self, model_info: ModelEntry) -> Tuple[Any, Any]:
+        """
+        Return the (client, async client) pair for a model, importing its SDK and
+        constructing the clients the first time the model is used
+        """
+        clients = self._clients.get(model_info.name)
+        if clients is not None:
+            return clients
+        
+        match model_info.type:
+            case 'gemini':
+                import google.generativeai as genai
+                # Module-global configuration, done once when the model is first used
+                genai.configure(api_key=model_info.api_key)
+                clients = (genai.GenerativeModel(model_info.model_id), None)
+            
+            # Only async clients are built; SDK retries are off since failover and
+            # backoff are handled here
+            case 'openai':
+                from openai import AsyncOpenAI
+                clients = (None, AsyncOpenAI(
+                    api_key=model_info.api_key,
+                    http_client=self._async_http_client,
+                    timeout=PROVIDER_HTTP_TIMEOUT,
+                    max_retries=0
+                ))
+            
+            case 'azure_openai':
+                from openai import AsyncAzureOpenAI
+                clients = (None, AsyncAzureOpenAI(
+                    api_key=model_info.api_key,
+                    azure_endpoint=model_info.endpoint,
+                    api_version="2024-02-01",
+                    http_client=self._async_http_client,
+                    timeout=PROVIDER_HTTP_TIMEOUT,
+                    max_retries=0
+                ))
+            
+            case 'anthropic':
+                import anthropic
+                clients = (None, anthropic.AsyncAnthropic(
+                    api_key=model_info.api_key,
+                    timeout=PROVIDER_HTTP_TIMEOUT,
+                    max_retries=0
+                ))
+            
+            case _:
+                raise ValueError(f"Unsupported model type: {model_info.type}")
+        
+        self._clients[model_info.name] = clients
+        logger.info("✅ %s client initialized", model_info.name)
+        return clients
+    
+    async def _anthropic_complete(self, model_info: ModelEntry, system_prefix: str, parts: Sequence[str],
+                            max_tokens: int, temperature: float, tail: Optional[str] = None) -> str:
+        """
+        Call Anthropic with cache breakpoints on the static prefix and the last stable
+        content part; the per-request tail goes after the breakpoint
+        """
+        content = [{"type": "text", "text": part} for part in parts]
+        content[-1]["cache_control"] = {"type": "ephemeral"}
+        if tail:
+            content.append({"type": "text", "text": tail})
+        system = [{
+            "type": "text",
+            "text": system_prefix,
+            "cache_control": {"type": "ephemeral"}
+        }] if system_prefix else []
+        _, async_client = self._get_clients(model_info)
+        response = await async_client.messages.create(
+            model=model_info.model_id,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            system=system,
+            messages=[{"role": "user", "content": content}]
+        )
+        
+        usage = response.usage
+        cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+        cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        logger.info("📊 %s usage: input=%s, cache_read=%s, cache_write=%s, output=%s",
+                    model_info.name, usage.input_tokens, cache_read, cache_write, usage.output_tokens)
+        
+        return "".join(block.text for block in response.content if block.type == "text")
+    
+    @staticmethod
+    def _estimate_tokens(text_length: int) -> int:
+        """Rough token count for English text and code (~4 characters per token)"""
+        return text_length // 4
+    
+    def _openai_model(self, model_info: ModelEntry, input_length: int) -> str:
+        """
+        Pick the OpenAI model for a call: the configured model or Azure deployment
+        if there is one, otherwise the small model for small inputs and the large
+        one when the input needs the extra capacity
+        """
+        if model_info.model_id:
+            return model_info.model_id
+        if self._estimate_tokens(input_length) < SMALL_INPUT_TOKENS:
+            return OPENAI_SMALL_MODEL
+        return OPENAI_LARGE_MODEL
+    
+    @staticmethod
+    def _is_timeout(error: Exception) -> bool:
+        """True for our own call timeouts and provider-side gateway/deadline errors"""
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+            return True
+        message = str(error).lower()
+        return "504" in message or "deadline" in message or "timed out" in message
+    
+    @staticmethod
+    async def _with_timeout(awaitable, seconds: float, model_info: ModelEntry):
+        """Await with a hard limit, raising a TimeoutError that names the model"""
+        try:
+            return await asyncio.wait_for(awaitable, seconds)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{model_info.name} call timed out after {seconds:g}s") from None
+    
+    def _record_failure(self, model_info: ModelEntry, error: Exception):
+        """Count a given-up call against the model's breaker, timeouts weighing more"""
+        if isinstance(error, BulkheadFull):
+            # Shed locally, the provider itself may be fine
+            return
+        weight = TIMEOUT_FAILURE_WEIGHT if self._is_timeout(error) else 1
+        self._breakers[model_info.name].record_failure(weight)
+    
+    @staticmethod
+    def _backoff_delay(attempt: int) -> float:
+        """Full-jitter exponential backoff for the given zero-based attempt"""
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    
+    async def _pace(self, model_info: ModelEntry):
+        """Wait for a rate-limit token so bursts don't turn into provider 429s"""
+        wait = self._buckets[model_info.name].take()
+        if wait:
+            logger.info("⏳ Pacing %s for %.2fs", model_info.name, wait)
+            await asyncio.sleep(wait)
+    
+    async def _complete(self, model_info: ModelEntry, system_prefix: str, parts: Sequence[str],
+                        max_tokens: int, temperature: float, max_retries: int = 1,
+                        cache_key: Optional[str] = None, tail: Optional[str] = None) -> str:
+        """
+        Run one provider call for a static prefix followed by dynamic content parts.
+        An empty system_prefix sends the parts alone. tail is a final part that
+        changes per request and is kept out of provider cache breakpoints.
+        cache_key, when given, is sent to OpenAI as prompt_cache_key so calls
+        sharing a prefix hit the same cache.
+        """
+        await self._pace(model_info)
+        all_parts = (*parts, tail) if tail else parts
+        async with self._bulkheads[model_info.type].slot():
+            match model_info.type:
+                case 'gemini':
+                    client, _ = self._get_clients(model_info)
+                    contents = [system_prefix, *all_parts] if system_prefix else list(all_parts)
+                    for attempt in range(max_retries + 1):
+                        try:
+                            response = await self._with_timeout(
+                                client.generate_content_async(
+                                    contents, request_options={"timeout": GEMINI_TIMEOUT_SECONDS}
+                                ), GEMINI_TIMEOUT_SECONDS, model_info
+                            )
+                            return response.text
+                        except Exception as e:
+                            if attempt < max_retries and self._is_timeout(e):
+                                self.error_handler.record_error(model_info.name, e, {'attempt': attempt + 1})
+                                delay = self._backoff_delay(attempt)
+                                logger.warning("❌ %s timeout (attempt %d/%d), retrying in %.2fs...",
+                                               model_info.name, attempt + 1, max_retries + 1, delay)
+                                await asyncio.sleep(delay)
+                                continue
+                            raise
+        
+                case 'openai' | 'azure_openai':
+                    _, async_client = self._get_clients(model_info)
+                    input_length = len(system_prefix) + sum(len(part) for part in all_parts)
+                    # Sent through extra_body so older SDK versions pass it along untouched
+                    extra_body = {"prompt_cache_key": cache_key} if cache_key and model_info.type == 'openai' else None
+                    response = await self._with_timeout(async_client.chat.completions.create(
+                        model=self._openai_model(model_info, input_length),
+                        messages=[
+                            *([{"role": "system", "content": system_prefix}] if system_prefix else []),
+                            {"role": "user", "content": [{"type": "text", "text": part} for part in all_parts]}
+                        ],
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        extra_body=extra_body
+                    ), PROVIDER_CALL_TIMEOUT_SECONDS, model_info)
+                    return response.choices[0].message.content
+        
+                case 'anthropic':
+                    return await self._with_timeout(self._anthropic_complete(
+                        model_info, system_prefix, parts, max_tokens, temperature, tail
+                    ), PROVIDER_CALL_TIMEOUT_SECONDS, model_info)
+        
+                case _:
+                    raise ValueError(f"Unsupported model type: {model_info.type}")
+    
+    async def _hedged_complete(self, system_prefix: str, parts: Sequence[str], max_tokens: int,
+                               temperature: float, max_retries: int = 1, models: Optional[list] = None,
+                               cache_key: Optional[str] = None,
+                               tail: Optional[str] = None) -> Optional[Tuple[ModelEntry, str]]:
+        """
+        Race providers in priority order (self.models unless given). The next provider
+        is started when the current ones fail or are still running after
+        HEDGE_DELAY_SECONDS; the first non-empty answer wins and the remaining calls
+        are cancelled.
+        """
+        remaining = iter(self.models if models is None else models)
+        task_models = {}
+        pending = set()
+        
+        def launch_next() -> bool:
+            model_info = next(remaining, None)
+            # Skip providers whose circuit is open
+            while model_info is not None and not self._breakers[model_info.name].allow_request():
+                logger.info("⏭️ Skipping %s, circuit open", model_info.name)
+                model_info = next(remaining, None)
+            if model_info is None:
+                return False
+            logger.info("Trying %s...", model_info.name)
+            task = asyncio.create_task(
+                self._complete(model_info, system_prefix, parts, max_tokens, temperature, max_retries,
+                               cache_key, tail)
+            )
+            task_models[task] = model_info
+            pending.add(task)
+            return True
+        
+        launch_next()
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=HEDGE_DELAY_SECONDS, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Leader is slow, hedge with the next provider
+                    launch_next()
+                    continue
+                
+                for task in done:
+                    model_info = task_models[task]
+                    breaker = self._breakers[model_info.name]
+                    if task.exception() is not None:
+                        self._record_failure(model_info, task.exception())
+                        self.error_handler.record_error(model_info.name, task.exception())
+                        logger.warning("❌ %s failed: %s", model_info.name, task.exception())
+                    elif task.result():
+                        breaker.record_success()
+                        return model_info, task.result()
+                
+                if not pending:
+                    launch_next()
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        return None
+    
+    @staticmethod
+    def _content_size(info) -> int:
+        """
+        Size of a file's content, preferring the 'size' recorded by RepoHandler at
+        extraction time so the content itself is not touched
+        """
+        if isinstance(info, dict):
+            size = info.get('size')
+            if size is not None:
+                return size
+            return len(info.get('content') or '')
+        return len(str(info))
+
+    def _summarize(self, file_structure: list, file_contents: Dict) -> _RepoSummary:
+        """
+        Scan a repository once for everything the analysis and feature prompts
+        need, memoized by a fingerprint of the paths and each file's type and size.
+        Stored repositories report types and sizes without their contents being read.
+        """
+        metadata = getattr(file_contents, 'metadata', None)
+        if metadata is not None:
+            file_meta = metadata()
+        else:
+            file_meta = {
+                path: (info.get('type', 'unknown') if isinstance(info, dict) else None, self._content_size(info))
+                for path, info in file_contents.items()
+            }
+        content_sizes = {path: size for path, (_, size) in file_meta.items()}
+        # Every path with its type and size, in order: file_details lists them as
+        # they come and content_sizes must cover exactly these files
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(orjson.dumps(list(file_structure)))
+        digest.update(orjson.dumps(list(file_meta.items())))
+        fingerprint = digest.hexdigest()
+
+        summary = self._summary_memo.get(fingerprint)
+        if summary is not None:
+            self._summary_memo.move_to_end(fingerprint)
+            return summary
+
+        # Files with content first, then paths only known from the structure
+        file_details = io.StringIO()
+        component_files = []
+        config_files = []
+        file_count = 0
+        structure_only = ((path, (None, 0)) for path in file_structure if path not in file_contents)
+        for file_path, (file_type, file_size) in chain(file_meta.items(), structure_only):
+            file_count += 1
+            if file_type is not None:
+                file_details.write(f"- {file_path} ({file_type}, {file_size} chars)\n")
+            else:
+                file_details.write(f"- {file_path} ({file_size} chars)\n")
+
+            # Categorize important files
+            if _COMPONENT_PATH_RE.search(file_path):
+                component_files.append(file_path)
+            elif _CONFIG_PATH_RE.search(file_path):
+                config_files.append(file_path)
+
+        summary = _RepoSummary(
+            fingerprint=fingerprint,
+            content_sizes=content_sizes,
+            file_details=file_details.getvalue(),
+            file_count=file_count,
+            component_files=component_files,
+            config_files=config_files,
+            ranked_files=heapq.nsmallest(80, file_structure, key=_file_rank),
+            total_files=len(file_structure)
+        )
+        self._summary_memo[fingerprint] = summary
+        if len(self._summary_memo) > SUMMARY_MEMO_SIZE:
+            self._summary_memo.popitem(last=False)
+        return summary
+
+    @staticmethod
+    def _sample_snippets(summary: _RepoSummary, file_contents: Dict) -> list:
+        """Pick (path, snippet) code samples from smaller/key files, with short snippets to cut tokens"""
+        samples = [path for path in summary.ranked_files if path in file_contents]
+        if len(samples) < 15:
+            sampled = set(samples)
+            samples.extend(islice((path for path in file_contents if path not in sampled), 15 - len(samples)))
+        # Only the 12 smallest are kept, no need to sort the whole candidate list
+        samples = heapq.nsmallest(12, samples, key=summary.content_sizes.__getitem__)
+
+        snippets = []
+        tokens_left = SNIPPETS_MAX_TOKENS
+        for path in samples:
+            if tokens_left <= 0:
+                break
+            if not summary.content_sizes[path]:
+                continue
+            info = file_contents[path]
+            content = info.get('content') if isinstance(info, dict) else str(info)
+            if content:
+                snippet, tokens = truncate_to_tokens(content, min(SNIPPET_MAX_TOKENS, tokens_left))
+                snippets.append((path, snippet))
+                tokens_left -= tokens
+        return snippets
+
+    @staticmethod
+    def _analysis_key(summary: _RepoSummary, snippets: list, prev_summary: str, mermaid_diagram: str) -> str:
+        """
+        Content-addressed key over exactly what the analysis prompt is built from,
+        so an identical payload hits across processes and any changed sample misses
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for path in summary.ranked_files:
+            digest.update(path.encode())
+            digest.update(b"\0")
+        digest.update(str(summary.total_files).encode())
+        for path, snippet in snippets:
+            digest.update(b"\1")
+            digest.update(path.encode())
+            digest.update(b"\0")
+            digest.update(snippet.encode())
+        digest.update(b"\2")
+        digest.update(prev_summary.encode())
+        digest.update(b"\0")
+        digest.update(mermaid_diagram.encode())
+        return digest.hexdigest()
+
+    def _get_analyze_prompt(self, content_key: str, summary: _RepoSummary, snippets: list,
+                            prev_summary: str, mermaid_diagram: str) -> Tuple[str, ...]:
+        """Return the memoized analysis content parts, building them on first use"""
+        parts = self._prompt_memo.get(content_key)
+        if parts is not None:
+            self._prompt_memo.move_to_end(content_key)
+            return parts
+
+        parts = self._build_analyze_prompt(summary, snippets, prev_summary, mermaid_diagram)
+        self._prompt_memo[content_key] = parts
+        if len(self._prompt_memo) > PROMPT_MEMO_SIZE:
+            self._prompt_memo.popitem(last=False)
+        return parts
+
+    @staticmethod
+    def _build_analyze_prompt(summary: _RepoSummary, snippets: list,
+                              prev_summary: str, mermaid_diagram: str) -> Tuple[str, ...]:
+        """Assemble the analysis content parts from curated files and code samples"""
+        ranked_files = summary.ranked_files
+
+        files_blob = io.StringIO()
+        files_blob.write(f"CURATED FILE LIST (top {len(ranked_files)} by importance):\n")
+        files_blob.writelines(f"- {path}\n" for path in ranked_files)
+        if summary.total_files > len(ranked_files):
+            files_blob.write(f"... and {summary.total_files - len(ranked_files)} more files\n")
+
+        code_blob = io.StringIO()
+        for path, snippet in snippets:
+            code_blob.writelines(("\n--- ", path, " ---\n", snippet, "\n"))
+
+        return (
+            f"SUMMARY CONTEXT (existing knowledge):\n{prev_summary}",
+            f"ARCHITECTURE DIAGRAM (Mermaid):\n{mermaid_diagram}",
+            files_blob.getvalue(),
+            f"ACTUAL CODE SAMPLES ({len(snippets)} files):\n{code_blob.getvalue()}",
+        )
+
+    async def analyze_repository(self, repo_knowledge: Dict, mermaid_diagram: str) -> Dict:
         """Analyze repository with curated, lightweight context and caching for speed."""
 
         # Normalize inputs (support both knowledge payload and raw file map)
@@ -92,375 +722,402 @@ class MultiModelClient:
                 file_structure = list(repo_knowledge.keys())
                 file_contents = repo_knowledge
 
-        # Curate file list to reduce prompt size
-        def rank(path: str) -> int:
-            p = path.lower()
-            score = 0
-            if any(k in p for k in ["main.py", "app.py", "server", "api/", "routes", "controllers", "views", "pages", "handler"]):
-                score += 5
-            if any(k in p for k in ["model", "schema", "entity", "dto"]):
-                score += 3
-            if any(k in p for k in ["service", "usecase", "repository/"]):
-                score += 3
-            if any(k in p for k in ["config", "settings", "env", "docker", "compose", "requirements.txt", "package.json"]):
-                score += 2
-            if any(p.endswith(ext) for ext in [".py", ".ts", ".tsx", ".js", ".jsx"]):
-                score += 1
-            return -score
-
-        ranked_files = sorted(file_structure, key=rank)[:80]
-        file_list = [f"- {path}" for path in ranked_files]
-
-        # Sample code from smaller/key files with shorter snippets to cut tokens
-        def content_size(item):
-            _, info = item
-            if isinstance(info, dict):
-                return len(info.get('content', '') or '')
-            return len(str(info) or '')
-
-        samples = []
-        for path in ranked_files:
-            if path in file_contents:
-                samples.append((path, file_contents[path]))
-        if len(samples) < 15:
-            for path, info in file_contents.items():
-                if path not in dict(samples):
-                    samples.append((path, info))
-                if len(samples) >= 15:
-                    break
-        samples = sorted(samples, key=content_size)[:12]
-
-        code_snippets = []
-        for path, info in samples:
-            content = info.get('content', '') if isinstance(info, dict) else str(info)
-            snippet = (content or '')[:1200]
-            if snippet:
-                code_snippets.append(f"\n--- {path} ---\n{snippet}")
-
         prev_summary = ""
         if analysis_prev:
             tech = analysis_prev.get('tech_stack') or {}
             comps = analysis_prev.get('components') or []
             prev_summary = f"Tech stack: {tech}\nComponents (sample): {comps[:10]}\n"
 
-        more_files_text = (f"... and {max(0, len(file_structure) - len(ranked_files))} more files"
-                           if len(file_structure) > len(ranked_files) else "")
-
-        prompt = f"""
-        You are analyzing an ALREADY UPLOADED repository. Analyze ONLY the provided files.
-
-        SUMMARY CONTEXT (existing knowledge):
-        {prev_summary}
-
-        ARCHITECTURE DIAGRAM (Mermaid):
-        {mermaid_diagram}
-
-        CURATED FILE LIST (top {len(ranked_files)} by importance):
-        {chr(10).join(file_list)}
-        {more_files_text}
+        mermaid_diagram = mermaid_diagram or ""
+        summary = self._summarize(file_structure, file_contents)
+        snippets = self._sample_snippets(summary, file_contents)
+        content_key = self._analysis_key(summary, snippets, prev_summary, mermaid_diagram)
 
-        ACTUAL CODE SAMPLES ({len(code_snippets)} files):
-        {chr(10).join(code_snippets)}
-
-        TASK: Provide:
-        1) Architecture summary with file references
-        2) Data flow/API structure citing files/functions
-        3) Integration points and dependencies
-        4) Specific recommendations with exact file paths
-
-        Only use the provided context. Do not suggest accessing external repositories.
-        """
-
-        # Fast-path cache (cheap and coarse key)
-        cache_key = f"analyze::{len(file_structure)}::{bool(mermaid_diagram)}::{len(code_snippets)}"
-        cached = self.cache.get(cache_key, "summary")
+        # Fast-path cache keyed by the prompt's inputs, not the assembled prompt.
+        # A stale hit is served as is and refreshed in the background.
+        cache_key = f"analyze::{content_key}"
+        cached, stale = self.cache.lookup(cache_key, "summary")
         if cached:
+            if stale and cache_key not in self._in_flight:
+                logger.info("🔄 Refreshing stale cache entry in the background: %s", cache_key)
+                self._in_flight_task(cache_key, lambda: self._run_analysis(
+                    cache_key, content_key, summary, snippets, prev_summary, mermaid_diagram
+                ))
             return {"architecture_summary": cached, "model_used": "cache"}
 
-        # Model attempts (favor fast settings)
-        for model_info in self.models:
-            try:
-                if model_info['type'] == 'gemini':
-                    import time
-                    max_retries = 1
-                    base_delay = 1
-                    for attempt in range(max_retries + 1):
-                        try:
-                            resp = model_info['client'].generate_content(prompt)
-                            summary = resp.text
-                            if summary:
-                                self.cache.set(cache_key, summary, "summary")
-                            return {"architecture_summary": summary, "model_used": model_info['name']}
-                        except Exception as e:
-                            if attempt < max_retries and ("504" in str(e) or "deadline" in str(e).lower()):
-                                time.sleep(base_delay)
-                                continue
-                            break
-                elif model_info['type'] in ['openai', 'azure_openai']:
-                    response = model_info['client'].chat.completions.create(
-                        model="gpt-3.5-turbo",
-                        messages=[
-                            {"role": "system", "content": "You are an expert software architect."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_tokens=600,
-                        temperature=0.2
-                    )
-                    summary = response.choices[0].message.content
-                    if summary:
-                        self.cache.set(cache_key, summary, "summary")
-                    return {"architecture_summary": summary, "model_used": model_info['name']}
-            except Exception as e:
-                print(f"❌ {model_info['name']} failed: {e}")
-                continue
+        # Concurrent uploads of the same repository share one model call
+        result = await self._single_flight(cache_key, lambda: self._run_analysis(
+            cache_key, content_key, summary, snippets, prev_summary, mermaid_diagram
+        ))
+        if result:
+            return result
 
         # Fallback
         fallback = self._mock_analysis(repo_knowledge, mermaid_diagram)
         self.cache.set(cache_key, fallback.get("architecture_summary", ""), "summary")
         return fallback
+
+    async def _run_analysis(self, cache_key: str, content_key: str, summary: _RepoSummary, snippets: list,
+                            prev_summary: str, mermaid_diagram: str) -> Optional[Dict]:
+        """Call the models for an analysis and cache the answer; None if every model failed"""
+        parts = self._get_analyze_prompt(content_key, summary, snippets, prev_summary, mermaid_diagram)
+
+        # Model attempts (favor fast settings), hedged across providers
+        result = await self._hedged_complete(ANALYZE_SYSTEM_PREFIX, parts, max_tokens=600, temperature=0.2,
+                                             cache_key=f"analyze-{content_key}")
+        if not result:
+            return None
+        model_info, architecture_summary = result
+        self.cache.set(cache_key, architecture_summary, "summary")
+        return {"architecture_summary": architecture_summary, "model_used": model_info.name}
+
+    def _in_flight_task(self, key: str, start) -> asyncio.Task:
+        """
+        Return the running task for key, or start one from the start() coroutine
+        factory. The event loop is single-threaded and nothing awaits between the
+        lookup and the insert, so no lock is needed.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(start())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return task
+
+    async def _single_flight(self, key: str, start):
+        """Await the shared result for key; a cancelled caller doesn't cancel the others"""
+        return await asyncio.shield(self._in_flight_task(key, start))
     
-    def suggest_feature_placement(self, feature_description: str, knowledge_base: Dict) -> Dict:
-        """Suggest feature placement using available models"""
-        
-        # Extract detailed information from knowledge base
-        repo_structure = knowledge_base.get('file_structure', {})
-        file_contents = knowledge_base.get('file_contents', {})
-        analysis = knowledge_base.get('analysis', {})
-        mermaid_diagram = knowledge_base.get('mermaid_diagram', '')
+    def _get_feature_context(self, summary: _RepoSummary, file_contents: Dict,
+                             mermaid_diagram: str, analysis_text: str) -> Tuple[str, ...]:
+        """Return the memoized codebase context parts for feature placement"""
+        memo_key = "feature::" + hashlib.blake2b(
+            f"{summary.fingerprint}\0{mermaid_diagram}\0{analysis_text}".encode(), digest_size=16
+        ).hexdigest()
+        parts = self._prompt_memo.get(memo_key)
+        if parts is not None:
+            self._prompt_memo.move_to_end(memo_key)
+            return parts
         
-        # Create detailed file structure overview
-        file_details = []
-        component_files = []
-        config_files = []
-        
-        # Use file_contents for detailed analysis
-        all_files = {**repo_structure, **file_contents}
-        
-        for file_path, file_info in all_files.items():
-            if isinstance(file_info, dict):
-                file_type = file_info.get('type', 'unknown')
-                file_size = len(file_info.get('content', ''))
-                file_details.append(f"- {file_path} ({file_type}, {file_size} chars)")
-            else:
-                # Handle direct content
-                file_size = len(str(file_info))
-                file_details.append(f"- {file_path} ({file_size} chars)")
-            
-            # Categorize important files
-            if any(keyword in file_path.lower() for keyword in ['component', 'page', 'view', 'controller']):
-                component_files.append(file_path)
-            elif any(keyword in file_path.lower() for keyword in ['config', 'env', 'setting', 'package.json']):
-                config_files.append(file_path)
-        
-        # Include actual code samples from key files (prioritize file_contents)
-        code_examples = []
-        files_to_sample = file_contents if file_contents else repo_structure
-        
-        for file_path, file_info in list(files_to_sample.items())[:15]:  # First 15 files
-            if isinstance(file_info, dict):
-                content = file_info.get('content', '')
-            else:
-                content = str(file_info)
+        # Include actual code samples from key files
+        code_examples = io.StringIO()
+        example_count = 0
+        for file_path, file_info in islice(file_contents.items(), 15):  # First 15 files
+            # Gate on the precomputed size before touching the content
+            size = summary.content_sizes[file_path]
+            if not size:
+                continue
+            content = file_info.get('content') if isinstance(file_info, dict) else str(file_info)
+            if not content:
+                continue
                 
-            if content and len(content) < 3000:
-                code_examples.append(f"\n=== {file_path} ===\n{content[:1500]}")
-            elif content:
+            if size < 3000:
+                code_examples.writelines(("\n=== ", file_path, " ===\n", content[:1500]))
+                example_count += 1
+            else:
                 # For larger files, include more context
-                code_examples.append(f"\n=== {file_path} (excerpt) ===\n{content[:2000]}...")
-        
-        prompt = f"""
-        You are an expert software architect with COMPLETE ACCESS to the full codebase.
-        
-        IMPORTANT: You are NOT working with a "high-level description" - you have the COMPLETE source code below.
+                code_examples.writelines(("\n=== ", file_path, " (excerpt) ===\n", content[:2000], "..."))
+                example_count += 1
         
-        TASK: Analyze this COMPLETE codebase and provide SPECIFIC, actionable recommendations for implementing this feature: "{feature_description}"
-        
-        === COMPLETE CODEBASE ANALYSIS ===
-        
-        FULL REPOSITORY STRUCTURE ({len(all_files)} files):
-        {chr(10).join(file_details)}
-        
-        KEY COMPONENT FILES:
-        {chr(10).join(component_files)}
-        
-        CONFIGURATION FILES:
-        {chr(10).join(config_files)}
-        
-        ARCHITECTURE DIAGRAM:
-        {mermaid_diagram}
-        
-        EXISTING ANALYSIS:
-        {str(analysis)[:1000]}
-        
-        === ACTUAL SOURCE CODE FROM THE REPOSITORY ===
-        {''.join(code_examples)}
+        component_list = "\n".join(summary.component_files)
+        config_list = "\n".join(summary.config_files)
+        parts = (
+            f"=== COMPLETE CODEBASE ANALYSIS ===\n\n"
+            f"FULL REPOSITORY STRUCTURE ({summary.file_count} files):\n{summary.file_details}\n"
+            f"KEY COMPONENT FILES:\n{component_list}\n\n"
+            f"CONFIGURATION FILES:\n{config_list}",
+            f"ARCHITECTURE DIAGRAM:\n{mermaid_diagram}\n\n"
+            f"EXISTING ANALYSIS:\n{analysis_text}",
+            f"=== ACTUAL SOURCE CODE FROM THE REPOSITORY ({example_count} files) ===\n"
+            f"{code_examples.getvalue()}\n\n=== END OF CODEBASE ANALYSIS ===",
+        )
+        self._prompt_memo[memo_key] = parts
+        if len(self._prompt_memo) > PROMPT_MEMO_SIZE:
+            self._prompt_memo.popitem(last=False)
+        return parts
+    
+    async def suggest_feature_placement(self, feature_description: str, knowledge_base: Dict) -> Dict:
+        """Suggest feature placement using available models"""
         
-        === END OF CODEBASE ANALYSIS ===
+        # Extract detailed information from knowledge base
+        file_structure = knowledge_base.get('file_structure') or []
+        file_contents = knowledge_base.get('file_contents') or {}
+        analysis = knowledge_base.get('analysis', {})
+        mermaid_diagram = knowledge_base.get('mermaid_diagram', '')
         
-        CRITICAL: You have been provided with the COMPLETE codebase analysis above, including actual source code from {len(code_examples)} files. 
-        This is NOT a high-level description - you have full access to the implementation details.
+        # Shared with analyze_repository, so the file scan runs once per repository
+        summary = self._summarize(list(file_structure), file_contents)
         
-        Based on this COMPLETE codebase analysis, provide SPECIFIC recommendations:
+        # The codebase context is built once per repository and reused for every
+        # feature request, so providers see a byte-identical cacheable prefix
+        parts = self._get_feature_context(summary, file_contents, mermaid_diagram, str(analysis)[:1000])
+        tail = f'FEATURE REQUEST: "{feature_description}"'
         
-        1. EXACT FILE PATHS where code should be added/modified (reference actual files you see above)
-        2. SPECIFIC FUNCTIONS/CLASSES to modify (look at the actual code samples provided)
-        3. NEW FILES to create with exact paths and purposes
-        4. INTEGRATION POINTS with existing code patterns (reference the actual code you see)
-        5. DEPENDENCIES that might need to be added
-        6. STEP-BY-STEP implementation plan with specific code changes
+        # Try models, hedging across providers; identical concurrent requests share the call
+        request_key = hashlib.blake2b("\0".join((*parts, tail)).encode(), digest_size=16).hexdigest()
+        result = await self._single_flight(f"feature::{request_key}", lambda: self._hedged_complete(
+            FEATURE_SYSTEM_PREFIX, parts, max_tokens=1000, temperature=0.3, max_retries=2,
+            cache_key=f"feature-{summary.fingerprint}", tail=tail
+        ))
+        if result:
+            model_info, suggestions = result
+            return {
+                "suggestions": suggestions,
+                "model_used": model_info.name
+            }
         
-        Be extremely specific and reference the actual files, functions, and patterns you see in the codebase above.
-        Do NOT give generic responses - you have the full codebase context.
+        # All models failed
+        return {
+            "suggestions": f"Unable to analyze due to API issues. Consider adding {feature_description} to the main application files.",
+            "model_used": "fallback"
+        }
+    
+    @staticmethod
+    async def _coalesce(pieces: AsyncIterator[str]) -> AsyncIterator[str]:
         """
+        Yield text pieces, joining any that arrived while the consumer was still busy
+        with the previous one, so a fast provider doesn't cost one downstream write
+        per token. Errors from the source are re-raised in order.
+        """
+        queue = asyncio.Queue()
+        end = object()
         
-        # Try each model
-        for model_info in self.models:
+        async def pump():
             try:
-                print(f"Trying {model_info['name']} for feature placement...")
+                async for piece in pieces:
+                    queue.put_nowait(piece)
+            except Exception as e:
+                queue.put_nowait(e)
+            finally:
+                queue.put_nowait(end)
+        
+        producer = asyncio.create_task(pump())
+        try:
+            finished = False
+            while not finished:
+                batch = [await queue.get()]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
                 
-                if model_info['type'] == 'gemini':
-                    # Add timeout and retry logic for Gemini
-                    import time
-                    max_retries = 2
-                    base_delay = 1
-                    
-                    for attempt in range(max_retries + 1):
+                text = []
+                for item in batch:
+                    if item is end:
+                        finished = True
+                        break
+                    if isinstance(item, Exception):
+                        if text:
+                            yield "".join(text)
+                        raise item
+                    text.append(item)
+                if text:
+                    yield "".join(text)
+        finally:
+            producer.cancel()
+    
+    async def _stream_model(self, model_info: ModelEntry, prompt: str) -> AsyncIterator[str]:
+        """Yield response text pieces from a single model as they are generated"""
+        await self._pace(model_info)
+        async with self._bulkheads[model_info.type].slot():
+            match model_info.type:
+                case 'gemini':
+                    client, _ = self._get_clients(model_info)
+                    response = await self._with_timeout(
+                        client.generate_content_async(
+                            prompt, stream=True, request_options={"timeout": GEMINI_TIMEOUT_SECONDS}
+                        ), GEMINI_TIMEOUT_SECONDS, model_info
+                    )
+                    chunks = aiter(response)
+                    while True:
+                        # Bound the wait for each chunk, not just the first one
                         try:
-                            response = model_info['client'].generate_content(prompt)
-                            return {
-                                "suggestions": response.text,
-                                "model_used": model_info['name']
-                            }
-                        except Exception as gemini_error:
-                            if "504" in str(gemini_error) or "deadline" in str(gemini_error).lower():
-                                if attempt < max_retries:
-                                    delay = base_delay * (2 ** attempt)  # Exponential backoff
-                                    print(f"❌ {model_info['name']} timeout (attempt {attempt + 1}/{max_retries + 1}), retrying in {delay}s...")
-                                    time.sleep(delay)
-                                    continue
-                                else:
-                                    print(f"❌ {model_info['name']} failed after {max_retries + 1} attempts: {gemini_error}")
-                                    break
-                            else:
-                                print(f"❌ {model_info['name']} failed: {gemini_error}")
-                                break
-                
-                elif model_info['type'] in ['openai', 'azure_openai']:
-                    response = model_info['client'].chat.completions.create(
-                        model="gpt-3.5-turbo",
-                        messages=[
-                            {"role": "system", "content": "You are an expert software architect."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_tokens=1000,
-                        temperature=0.3
+                            chunk = await self._with_timeout(anext(chunks), GEMINI_TIMEOUT_SECONDS, model_info)
+                        except StopAsyncIteration:
+                            break
+                        if chunk.text:
+                            yield chunk.text
+        
+                case 'openai' | 'azure_openai':
+                    _, async_client = self._get_clients(model_info)
+                    stream = await async_client.chat.completions.create(
+                        model=self._openai_model(model_info, len(prompt)),
+                        messages=[{"role": "user", "content": prompt}],
+                        max_tokens=4000,
+                        temperature=CHAT_TEMPERATURE,
+                        stream=True
                     )
-                    return {
-                        "suggestions": response.choices[0].message.content,
-                        "model_used": model_info['name']
-                    }
-                    
-            except Exception as e:
-                print(f"❌ {model_info['name']} failed: {e}")
-                continue
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
         
-        # All models failed
-        return {
-            "suggestions": f"Unable to analyze due to API issues. Consider adding {feature_description} to the main application files.",
-            "model_used": "fallback"
-        }
+                case 'anthropic':
+                    _, async_client = self._get_clients(model_info)
+                    async with async_client.messages.stream(
+                        model=model_info.model_id,
+                        max_tokens=4000,
+                        temperature=CHAT_TEMPERATURE,
+                        messages=[{"role": "user", "content": prompt}]
+                    ) as stream:
+                        async for text in stream.text_stream:
+                            yield text
     
-    async def generate_response(self, prompt: str, model_preference: str = None) -> str:
+    async def generate_response_stream(self, prompt: str, model_preference: str = None) -> AsyncIterator[str]:
         """
-        Generate a response using available AI models with caching
+        Stream a response from the available AI models, caching the full text once complete
         """
-        # Check cache first
-        cached_response = self.cache.get(prompt, model_preference or "default")
+        # Check cache first, exact match then embedding similarity
+        namespace = model_preference or "default"
+        cached_response = await self._lookup_response(prompt, namespace, CHAT_TEMPERATURE)
         if cached_response:
-            return cached_response
-        
-        # Clear expired cache entries periodically
-        self.cache.clear_expired()
+            yield cached_response
+            return
         
         # Try to generate response
-        models_to_try = self.models.copy()
-        
-        # If model preference is specified, try it first
-        if model_preference:
-            preferred_models = [m for m in models_to_try if m['name'].lower() == model_preference.lower()]
-            if preferred_models:
-                models_to_try = preferred_models + [m for m in models_to_try if m not in preferred_models]
+        models_to_try = self._ordered_models(model_preference)
         
         for model_info in models_to_try:
-            try:
-                print(f"Trying {model_info['name']} model...")
-                
-                if model_info['name'] == 'Gemini':
-                    # Ensure API key is configured before making the call
-                    if 'api_key' in model_info:
-                        genai.configure(api_key=model_info['api_key'])
+            breaker = self._breakers[model_info.name]
+            if not breaker.allow_request():
+                logger.info("⏭️ Skipping %s, circuit open", model_info.name)
+                continue
+            
+            logger.info("Trying %s model...", model_info.name)
+            max_retries = 2 if model_info.type == 'gemini' else 0
+            
+            for attempt in range(max_retries + 1):
+                buffer = []
+                try:
+                    async for piece in self._coalesce(self._stream_model(model_info, prompt)):
+                        buffer.append(piece)
+                        yield piece
                     
-                    # Add timeout and retry logic for Gemini
-                    import time
-                    max_retries = 2
-                    base_delay = 1
+                    # Cache the successful response
+                    breaker.record_success()
+                    await self._store_response(prompt, "".join(buffer), model_info.name, namespace, CHAT_TEMPERATURE)
+                    logger.info("✅ %s response generated and cached", model_info.name)
+                    return
                     
-                    for attempt in range(max_retries + 1):
-                        try:
-                            response = model_info['client'].generate_content(prompt)
-                            result = response.text
-                            
-                            # Cache the successful response
-                            self.cache.set(prompt, result, model_info['name'])
-                            print(f"✅ {model_info['name']} response generated and cached")
-                            return result
-                            
-                        except Exception as gemini_error:
-                            self.error_handler.record_error(model_info['name'], gemini_error, {'attempt': attempt + 1})
-                            
-                            if "504" in str(gemini_error) or "deadline" in str(gemini_error).lower():
-                                if attempt < max_retries:
-                                    delay = base_delay * (2 ** attempt)  # Exponential backoff
-                                    print(f"❌ {model_info['name']} timeout (attempt {attempt + 1}/{max_retries + 1}), retrying in {delay}s...")
-                                    time.sleep(delay)
-                                    continue
-                                else:
-                                    print(f"❌ {model_info['name']} failed after {max_retries + 1} attempts: {gemini_error}")
-                                    
-                                    # Check if we have a recent relevant cache for this type of request
-                                    cached_response = self.cache.get(prompt, model_info['name'])
-                                    if cached_response:
-                                        print(f"🔄 Using relevant cached response due to timeout")
-                                        return cached_response
-                                    break
-                            else:
-                                print(f"❌ {model_info['name']} failed: {gemini_error}")
-                                break
-                
-                elif model_info['name'] in ['OpenAI GPT-4', 'OpenAI GPT-3.5']:
-                    response = model_info['client'].chat.completions.create(
-                        model=model_info['model_id'],
-                        messages=[{"role": "user", "content": prompt}],
-                        max_tokens=4000,
-                        temperature=0.7
-                    )
-                    result = response.choices[0].message.content
+                except Exception as e:
+                    self.error_handler.record_error(model_info.name, e, {'attempt': attempt + 1})
                     
-                    # Cache the successful response
-                    self.cache.set(prompt, result, model_info['name'])
-                    print(f"✅ {model_info['name']} response generated and cached")
-                    return result
-                else:
-                    continue
-                
-                
-            except Exception as e:
-                self.error_handler.record_error(model_info['name'], e)
-                print(f"❌ {model_info['name']} failed: {e}")
-                continue
-
+                    if buffer:
+                        # Output already reached the caller, so end the stream
+                        # rather than splice in another model's answer
+                        self._record_failure(model_info, e)
+                        logger.warning("❌ %s failed mid-stream: %s", model_info.name, e)
+                        return
+                    
+                    is_timeout = self._is_timeout(e)
+                    if is_timeout and attempt < max_retries:
+                        delay = self._backoff_delay(attempt)
+                        logger.warning("❌ %s timeout (attempt %d/%d), retrying in %.2fs...",
+                                       model_info.name, attempt + 1, max_retries + 1, delay)
+                        await asyncio.sleep(delay)
+                        continue
+                    
+                    # Giving up on this model for this request
+                    self._record_failure(model_info, e)
+                    if is_timeout:
+                        logger.warning("❌ %s failed after %d attempts: %s", model_info.name, attempt + 1, e)
+                        
+                        # Check if we have a recent relevant cache for this type of request
+                        cached_response = self.cache.get(prompt, model_info.name)
+                        if cached_response:
+                            logger.info("🔄 Using relevant cached response due to timeout")
+                            yield cached_response
+                            return
+                    else:
+                        logger.warning("❌ %s failed: %s", model_info.name, e)
+                    break
+        
         # If all models fail, return a contextual fallback response
-        failed_models = [model['name'] for model in models_to_try]
+        yield self._fallback_response(prompt, models_to_try)
+    
+    @staticmethod
+    def answer_key(question: str, context: str) -> str:
+        """Answer cache key for a question, ignoring case and whitespace, within a context"""
+        return f"{context}\n{' '.join(question.lower().split())}"
+    
+    @staticmethod
+    def _split_answer_key(answer_key: str) -> Tuple[str, str]:
+        """Context and normalized question of an answer key; neither contains a newline"""
+        context, _, question = answer_key.partition("\n")
+        return context, question
+    
+    async def lookup_answer(self, answer_key: str) -> Optional[str]:
+        """
+        Answer stored by generate_response under answer_key, if still fresh, else
+        the answer to the most similar earlier question in the same context
+        """
+        answer = self.answer_cache.get(answer_key, "answer")
+        if not answer:
+            context, question = self._split_answer_key(answer_key)
+            answer = await asyncio.to_thread(self.answer_semantic_cache.get, question, context)
+        return answer
+    
+    async def generate_response(self, prompt: str, model_preference: str = None,
+                                answer_key: Optional[str] = None, use_cache: bool = True) -> str:
+        """
+        Generate a response using available AI models with caching, racing
+        providers instead of waiting out each one's failure in turn. A generated
+        (not fallback) response is also stored under answer_key when given.
+        use_cache=False skips cache lookups but still stores the new response.
+        """
+        namespace = model_preference or "default"
+        if use_cache:
+            cached_response = await self._lookup_response(prompt, namespace, CHAT_TEMPERATURE)
+            if cached_response:
+                return cached_response
+        
+        models_to_try = self._ordered_models(model_preference)
+        request_key = hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+        result = await self._single_flight(f"chat::{namespace}::{request_key}", lambda: self._hedged_complete(
+            "", (prompt,), max_tokens=4000, temperature=CHAT_TEMPERATURE, max_retries=2, models=models_to_try
+        ))
+        if result:
+            model_info, response = result
+            await self._store_response(prompt, response, model_info.name, namespace, CHAT_TEMPERATURE)
+            if answer_key:
+                self.answer_cache.set(answer_key, response, "answer")
+                context, question = self._split_answer_key(answer_key)
+                await asyncio.to_thread(self.answer_semantic_cache.set, question, response, context)
+            logger.info("✅ %s response generated and cached", model_info.name)
+            return response
+        
+        # A response cached earlier under a model's name beats the generic fallback
+        for model_info in models_to_try:
+            cached_response = self.cache.get(prompt, model_info.name)
+            if cached_response:
+                logger.info("🔄 Using relevant cached response from %s", model_info.name)
+                return cached_response
+        
+        return self._fallback_response(prompt, models_to_try)
+    
+    def _ordered_models(self, model_preference: Optional[str]) -> list:
+        """Configured models with the preferred one, if any, moved to the front"""
+        models_to_try = self.models.copy()
+        if model_preference:
+            preferred_models = [m for m in models_to_try if m.name.lower() == model_preference.lower()]
+            if preferred_models:
+                models_to_try = preferred_models + [m for m in models_to_try if m not in preferred_models]
+        return models_to_try
+    
+    async def _lookup_response(self, prompt: str, namespace: str, temperature: float) -> Optional[str]:
+        """Exact cache lookup, then embedding similarity for low-temperature calls"""
+        cached_response = self.cache.get(prompt, namespace)
+        if not cached_response and temperature <= SEMANTIC_CACHE_MAX_TEMPERATURE:
+            cached_response = await asyncio.to_thread(self.semantic_cache.get, prompt, namespace)
+        return cached_response
+    
+    async def _store_response(self, prompt: str, response: str, model_name: str, namespace: str,
+                              temperature: float):
+        """Store a generated response in the exact tier, and the similarity tier for low-temperature calls"""
+        self.cache.set(prompt, response, model_name)
+        if temperature <= SEMANTIC_CACHE_MAX_TEMPERATURE:
+            await asyncio.to_thread(self.semantic_cache.set, prompt, response, namespace)
+    
+    def _fallback_response(self, prompt: str, models_tried: list) -> str:
+        """Contextual fallback once every model has failed"""
+        failed_models = [model.name for model in models_tried]
         fallback_response = self.error_handler.generate_contextual_fallback(prompt, failed_models)
         self.cache.set(prompt, fallback_response, "enhanced_fallback")
         return fallback_response
@@ -576,28 +1233,23 @@ Please try your request again later."""
         """Generate mock analysis when all AI models fail"""
         file_count = len(repo_data)
         
-        # Identify tech stack from files
-        tech_stack = []
-        js_files = any('.js' in f or '.jsx' in f or '.ts' in f or '.tsx' in f
-                       for f in repo_data.keys())
-        if js_files:
-            tech_stack.append('JavaScript/TypeScript')
-        if any('.py' in f for f in repo_data.keys()):
-            tech_stack.append('Python')
-        if any('.java' in f for f in repo_data.keys()):
-            tech_stack.append('Java')
-        if any('.go' in f for f in repo_data.keys()):
-            tech_stack.append('Go')
+        # Identify tech stack and frameworks from one scan over all file names
+        joined = '\n'.join(repo_data.keys()).lower()
+        langs_found = {m.group(1) for m in _LANG_RE.finditer(joined)}
+        tech_stack = [label for exts, label in _LANG_LABELS if langs_found & exts]
         
         # Look for common framework files
+        markers_found = set(_FRAMEWORK_RE.findall(joined))
         frameworks = []
-        if 'package.json' in repo_data:
+        if 'package.json' in markers_found:
             frameworks.append('Node.js project')
-        if 'requirements.txt' in repo_data or 'pyproject.toml' in repo_data:
+        if 'requirements.txt' in markers_found or 'pyproject.toml' in markers_found:
             frameworks.append('Python project')
-        if any('dockerfile' in f.lower() for f in repo_data.keys()):
+        if 'dockerfile' in markers_found:
             frameworks.append('Containerized application')
         
+        key_files = "\n".join(f'• {file}' for file in islice(repo_data, 10))
+        
         return {
             "architecture_summary": f"""
 ## Repository Analysis (Based on Available Files)
@@ -611,7 +1263,7 @@ Please try your request again later."""
 This appears to be a {frameworks[0] if frameworks else 'software'} project with the following structure:
 
 **Key Components Identified:**
-{chr(10).join(f'• {file}' for file in list(repo_data.keys())[:10])}
+{key_files}
 {'• ... and more files' if file_count > 10 else ''}
 
 **Recommendations for Feature Development:**
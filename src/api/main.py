@@ -1,16 +1,25 @@
 import asyncio
+import base64
+import functools
+import io
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from itertools import islice
 import logging
-import traceback
 from datetime import datetime
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
+import anyio
 import uvicorn
+import orjson
 from src.core.repo_handler import RepoHandler
 from src.core.diagram_generator import DiagramGenerator
 from src.ai.multi_model_client import MultiModelClient
-from src.data.knowledge_base import KnowledgeBase
+from src.data.knowledge_base import KnowledgeBase, RepositoryFiles, quote_identifier, select_files_context
 from src.ai.conversation_manager import ConversationManager
 # Import new agentic system
 from src.agentic.integration import AgenticIntegrationAdapter, create_agentic_endpoints
@@ -18,10 +27,11 @@ from src.agentic.core.orchestrator import AgenticOrchestrator
 from src.agentic.core.models import Goal, TaskType
 import os
 from dotenv import load_dotenv
-import sqlite3
-import json
-from typing import Dict, Any, Optional, List
-import re
+from typing import Dict, Any, Optional, List, Tuple
+import shutil
+import tempfile
+import threading
+import time
 
 load_dotenv()
 
@@ -36,7 +46,66 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AI Code Architecture Agent")
+# Uploaded repository zips are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Bump when the /ask-question prompt templates change, so answers cached for the
+# old prompts are not reused
+ASK_PROMPT_VERSION = 2
+
+# /ask-question prompt for several repositories, filled in with str.format
+MULTI_REPO_PROMPT_TEMPLATE = """
+You are analyzing a user question across multiple related repositories in the same organization.
+
+Repositories involved: {repos}
+
+Question:
+{question}
+
+ORGANIZATION-WIDE CONTEXT:
+- Total repositories: {repo_count}
+{org_patterns}
+
+CONVERSATION HISTORY:
+{conversations}
+
+MEMORY CONTEXT:
+{memories}
+
+REPOSITORY CONTEXTS (files and structure):
+{files}
+
+DIAGRAMS:
+{diagrams}
+
+Instructions:
+1. Provide a unified answer that references the specific repositories by name where relevant.
+2. Call out integration points between these repos (APIs, events, contracts, shared types).
+3. When suggesting implementation, indicate exact files and locations per repo following their patterns.
+4. Note differences in stack or conventions and recommend consistent org-wide patterns where helpful.
+5. Keep it concise, structured, and avoid repeating the same info for each repo unless necessary.
+"""
+
+# Responses smaller than GZIP_MIN_BYTES are sent uncompressed; level 5 trades a
+# little ratio for much less CPU than the default 9
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+
+# Brotli quality 4 compresses conversation JSON better than gzip at similar CPU
+BROTLI_QUALITY = 4
+
+# Worker threads for blocking handler work (zip extraction, GitHub fetches, SQLite)
+THREADPOOL_SIZE = 64
+
+
+class _ORJSONResponse(ORJSONResponse):
+    """orjson responses that, like the stdlib encoder, accept non-string dict keys"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+app = FastAPI(title="AI Code Architecture Agent", default_response_class=_ORJSONResponse)
 
 # Add CORS middleware for frontend (driven by env)
 _default_origins = [
@@ -46,7 +115,8 @@ _default_origins = [
 ]
 _frontend_url = os.getenv("FRONTEND_URL")
 _extra_origins = [o.strip() for o in os.getenv("ALLOWED_ORIGINS", "").split(",") if o.strip()]
-_allow_origins = _default_origins + ([_frontend_url] if _frontend_url else []) + _extra_origins
+# Deduplicated set, so the middleware's per-request Origin check is a hash lookup
+_allow_origins = frozenset(_default_origins + ([_frontend_url] if _frontend_url else []) + _extra_origins)
 
 app.add_middleware(
     CORSMiddleware,
@@ -56,6 +126,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress analysis answers, conversation payloads and the interface page;
+# small bodies like health checks aren't worth the CPU. Brotli is used for
+# clients that accept it when brotli-asgi is installed, gzip otherwise
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, quality=BROTLI_QUALITY, minimum_size=GZIP_MIN_BYTES,
+                       gzip_fallback=True)
+except ImportError:
+    logger.info("brotli-asgi not installed, compressing responses with gzip only")
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=GZIP_LEVEL)
+
 # Create static directory if it doesn't exist
 os.makedirs("static", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -74,6 +155,10 @@ agentic_adapter = AgenticIntegrationAdapter()
 
 async def startup_event():
     """Initialize agentic orchestrator on startup"""
+    # uvicorn picks uvloop and httptools automatically when uvicorn[standard] is installed
+    loop = asyncio.get_running_loop()
+    logger.info("Event loop: %s.%s", type(loop).__module__, type(loop).__name__)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
     logger.info("Initializing agentic orchestrator...")
     success = await agentic_adapter.initialize()
     if success:
@@ -81,84 +166,115 @@ async def startup_event():
     else:
         logger.warning("⚠️ Agentic orchestrator initialization failed, falling back to basic mode")
 
-# Add startup event
+async def shutdown_event():
+    """Release shared AI client connection pools on shutdown"""
+    await ai_client.close()
+
+# Add startup and shutdown events
 app.add_event_handler("startup", startup_event)
+app.add_event_handler("shutdown", shutdown_event)
+
+
+def _render_fallback_interface(active: bool) -> str:
+    """Endpoint overview served when static/index.html is missing"""
+    agentic_status = "✅ Active" if active else "⚠️ Not Available"
+    return f"""
+    <html>
+        <head>
+            <title>AI Code Architecture Agent</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 40px; }}
+                .status {{ padding: 10px; border-radius: 5px; margin: 10px 0; }}
+                .active {{ background-color: #d4edda; border: 1px solid #c3e6cb; }}
+                .inactive {{ background-color: #f8d7da; border: 1px solid #f5c6cb; }}
+                .endpoint {{ background-color: #f8f9fa; padding: 15px; margin: 10px 0; border-radius: 5px; }}
+            </style>
+        </head>
+        <body>
+            <h1>AI Code Architecture Agent</h1>
+            <div class="status {'active' if active else 'inactive'}">
+                <strong>Agentic Orchestrator Status:</strong> {agentic_status}
+            </div>
+            
+            <h2>Available Endpoints:</h2>
+            
+            <div class="endpoint">
+                <h3>Repository Analysis</h3>
+                <ul>
+                    <li><strong>POST /analyze-repo</strong> - Analyze a repository (enhanced with agentic capabilities)</li>
+                    <li><strong>POST /api/agentic/analyze/repository/{{repo_name}}</strong> - Full autonomous repository analysis</li>
+                    <li><strong>POST /api/agentic/analyze/organization/{{organization}}</strong> - Autonomous organization-wide analysis</li>
+                </ul>
+            </div>
+            
+            <div class="endpoint">
+                <h3>Feature Suggestions</h3>
+                <ul>
+                    <li><strong>POST /suggest-feature</strong> - Get feature placement suggestions (enhanced with agentic capabilities)</li>
+                    <li><strong>POST /api/agentic/suggest/feature</strong> - Autonomous feature implementation suggestions</li>
+                </ul>
+            </div>
+            
+            <div class="endpoint">
+                <h3>Smart Analysis</h3>
+                <ul>
+                    <li><strong>POST /api/agentic/analyze/smart</strong> - Smart analysis with automatic approach selection</li>
+                    <li><strong>GET /api/agentic/status</strong> - Get agentic orchestrator status and metrics</li>
+                </ul>
+            </div>
+            
+            <div class="endpoint">
+                <h3>Repository Management</h3>
+                <ul>
+                    <li><strong>GET /repositories</strong> - List analyzed repositories</li>
+                    <li><strong>POST /ask-question</strong> - Ask questions about repositories</li>
+                    <li><strong>GET /health</strong> - Health check</li>
+                </ul>
+            </div>
+            
+            <h2>Agentic Capabilities:</h2>
+            <ul>
+                <li>🤖 <strong>Autonomous Planning</strong> - Breaks down complex tasks automatically</li>
+                <li>🔧 <strong>Self-Correction</strong> - Detects and fixes errors during analysis</li>
+                <li>🧠 <strong>Multi-Step Reasoning</strong> - Iterative problem solving</li>
+                <li>⚡ <strong>Dynamic Tool Selection</strong> - Chooses optimal tools for each task</li>
+                <li>🎯 <strong>Goal-Oriented Behavior</strong> - Works towards specific objectives</li>
+                <li>🏢 <strong>Organizational Analysis</strong> - Cross-repository insights</li>
+            </ul>
+        </body>
+    </html>
+    """
+
+
+def _load_index_html() -> Optional[bytes]:
+    """Read the interface page once, or None to serve the fallback overview"""
+    try:
+        with open("static/index.html", "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+# Page served at "/", read at import instead of on every request
+_INDEX_HTML = _load_index_html()
+
+# Fallback overview for each agentic orchestrator state, encoded once so
+# responses send the bytes as they are
+_FALLBACK_INTERFACE = {active: _render_fallback_interface(active).encode() for active in (True, False)}
 
 
 @app.get("/", response_class=HTMLResponse)
 async def get_interface():
     """Serve the main interface"""
-    try:
-        with open("static/index.html", "r", encoding="utf-8") as f:
-            return HTMLResponse(content=f.read())
-    except FileNotFoundError:
-        agentic_status = "✅ Active" if agentic_adapter._initialized else "⚠️ Not Available"
-        return HTMLResponse(content=f"""
-        <html>
-            <head>
-                <title>AI Code Architecture Agent</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; margin: 40px; }}
-                    .status {{ padding: 10px; border-radius: 5px; margin: 10px 0; }}
-                    .active {{ background-color: #d4edda; border: 1px solid #c3e6cb; }}
-                    .inactive {{ background-color: #f8d7da; border: 1px solid #f5c6cb; }}
-                    .endpoint {{ background-color: #f8f9fa; padding: 15px; margin: 10px 0; border-radius: 5px; }}
-                </style>
-            </head>
-            <body>
-                <h1>AI Code Architecture Agent</h1>
-                <div class="status {'active' if agentic_adapter._initialized else 'inactive'}">
-                    <strong>Agentic Orchestrator Status:</strong> {agentic_status}
-                </div>
-                
-                <h2>Available Endpoints:</h2>
-                
-                <div class="endpoint">
-                    <h3>Repository Analysis</h3>
-                    <ul>
-                        <li><strong>POST /analyze-repo</strong> - Analyze a repository (enhanced with agentic capabilities)</li>
-                        <li><strong>POST /api/agentic/analyze/repository/{{repo_name}}</strong> - Full autonomous repository analysis</li>
-                        <li><strong>POST /api/agentic/analyze/organization/{{organization}}</strong> - Autonomous organization-wide analysis</li>
-                    </ul>
-                </div>
-                
-                <div class="endpoint">
-                    <h3>Feature Suggestions</h3>
-                    <ul>
-                        <li><strong>POST /suggest-feature</strong> - Get feature placement suggestions (enhanced with agentic capabilities)</li>
-                        <li><strong>POST /api/agentic/suggest/feature</strong> - Autonomous feature implementation suggestions</li>
-                    </ul>
-                </div>
-                
-                <div class="endpoint">
-                    <h3>Smart Analysis</h3>
-                    <ul>
-                        <li><strong>POST /api/agentic/analyze/smart</strong> - Smart analysis with automatic approach selection</li>
-                        <li><strong>GET /api/agentic/status</strong> - Get agentic orchestrator status and metrics</li>
-                    </ul>
-                </div>
-                
-                <div class="endpoint">
-                    <h3>Repository Management</h3>
-                    <ul>
-                        <li><strong>GET /repositories</strong> - List analyzed repositories</li>
-                        <li><strong>POST /ask-question</strong> - Ask questions about repositories</li>
-                        <li><strong>GET /health</strong> - Health check</li>
-                    </ul>
-                </div>
-                
-                <h2>Agentic Capabilities:</h2>
-                <ul>
-                    <li>🤖 <strong>Autonomous Planning</strong> - Breaks down complex tasks automatically</li>
-                    <li>🔧 <strong>Self-Correction</strong> - Detects and fixes errors during analysis</li>
-                    <li>🧠 <strong>Multi-Step Reasoning</strong> - Iterative problem solving</li>
-                    <li>⚡ <strong>Dynamic Tool Selection</strong> - Chooses optimal tools for each task</li>
-                    <li>🎯 <strong>Goal-Oriented Behavior</strong> - Works towards specific objectives</li>
-                    <li>🏢 <strong>Organizational Analysis</strong> - Cross-repository insights</li>
-                </ul>
-            </body>
-        </html>
-        """)
+    if _INDEX_HTML is not None:
+        return HTMLResponse(content=_INDEX_HTML)
+    return HTMLResponse(content=_FALLBACK_INTERFACE[agentic_adapter._initialized])
+
+
+def _save_upload(source, file_path: str) -> None:
+    """Copy an uploaded file to disk chunk by chunk instead of reading it whole"""
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer, UPLOAD_CHUNK_SIZE)
 
 
 @app.post("/analyze-repo")
@@ -171,21 +287,23 @@ async def analyze_repository(
     
     try:
         # Debug: Print what we received
-        logger.info(f"Received file: {file.filename if file else None}")
-        logger.info(f"Received repo_url: {repo_url}")
-        logger.info(f"Received repo_name: {repo_name}")
+        logger.info("Received file: %s", file.filename if file else None)
+        logger.info("Received repo_url: %s", repo_url)
+        logger.info("Received repo_name: %s", repo_name)
         
         # Process repository
         if file and file.filename:
-            # Save uploaded file
-            file_path = f"temp_{file.filename}"
-            with open(file_path, "wb") as buffer:
-                buffer.write(await file.read())
-            
-            repo_data = repo_handler.process_repo_zip(file_path)
-            os.remove(file_path)
+            # Save uploaded file, streamed to disk in chunks; blocking work runs
+            # in the threadpool so other requests keep being served
+            fd, file_path = tempfile.mkstemp(prefix="temp_", suffix=".zip")
+            os.close(fd)
+            try:
+                await run_in_threadpool(_save_upload, file.file, file_path)
+                repo_data = await run_in_threadpool(repo_handler.process_repo_zip, file_path)
+            finally:
+                os.remove(file_path)
         elif repo_url and repo_url.strip():
-            repo_data = repo_handler.fetch_github_repo(repo_url)
+            repo_data = await run_in_threadpool(repo_handler.fetch_github_repo, repo_url)
         else:
             logger.error("No file or repo_url provided")
             return {"error": "Either file or repo_url must be provided"}
@@ -200,7 +318,7 @@ async def analyze_repository(
         
         try:
             if agentic_adapter.orchestrator:
-                logger.info(f"🤖 Using agentic analysis for {repo_name}")
+                logger.info("🤖 Using agentic analysis for %s", repo_name)
                 agentic_result = await agentic_adapter.analyze_repository_autonomous(repo_name, {
                     "repo_data": repo_data,
                     "include_diagram": True
@@ -213,15 +331,15 @@ async def analyze_repository(
                 else:
                     logger.warning("⚠️ Agentic analysis failed, falling back to regular analysis")
         except Exception as e:
-            logger.warning(f"⚠️ Agentic analysis error, falling back: {e}")
+            logger.warning("⚠️ Agentic analysis error, falling back: %s", e)
         
         # Fallback to regular AI analysis if agentic failed
         if not agentic_success:
             try:
-                logger.info(f"🔄 Using regular AI analysis for {repo_name}")
-                analysis = ai_client.analyze_repository(repo_data, optimized_diagram)
+                logger.info("🔄 Using regular AI analysis for %s", repo_name)
+                analysis = await ai_client.analyze_repository(repo_data, optimized_diagram)
             except Exception as e:
-                logger.error(f"AI analysis error: {e}")
+                logger.error("AI analysis error: %s", e)
                 # Handle errors gracefully
                 analysis = {
                     "architecture_summary": "Analysis failed due to an error.",
@@ -229,7 +347,11 @@ async def analyze_repository(
                 }
         
         # Store in knowledge base
-        knowledge_base.store_repository(repo_name, repo_data, analysis, optimized_diagram)
+        await run_in_threadpool(knowledge_base.store_repository, repo_name, repo_data, analysis, optimized_diagram)
+        # Embedded once here so each question only embeds itself to pick files
+        embedded = await run_in_threadpool(knowledge_base.embed_repository_files, repo_name)
+        if embedded:
+            logger.info("🧮 Embedded %d files of %s", embedded, repo_name)
         
         # Initialize conversation for this repository
         conversation_manager.start_conversation(repo_name, {
@@ -246,7 +368,7 @@ async def analyze_repository(
             {'type': 'initial_analysis'}
         )
         
-        logger.info(f"Repository {repo_name} analyzed and stored successfully")
+        logger.info("Repository %s analyzed and stored successfully", repo_name)
         
         return {
             "success": True,
@@ -256,8 +378,7 @@ async def analyze_repository(
         }
         
     except Exception as e:
-        logger.error(f"Error in analyze_repository: {e}")
-        logger.debug(traceback.format_exc())
+        logger.error("Error in analyze_repository: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
         return {"error": str(e)}
 
 
@@ -270,10 +391,10 @@ async def suggest_feature_placement(
     
     try:
         # Get repository knowledge
-        knowledge = knowledge_base.get_repository_knowledge(repo_name)
+        knowledge = await run_in_threadpool(knowledge_base.get_repository_knowledge, repo_name)
         
         if not knowledge:
-            logger.warning(f"Repository {repo_name} not found in knowledge base")
+            logger.warning("Repository %s not found in knowledge base", repo_name)
             return {"error": f"Repository {repo_name} not found in knowledge base"}
         
         # Try agentic feature suggestion first
@@ -282,7 +403,7 @@ async def suggest_feature_placement(
         
         try:
             if agentic_adapter.orchestrator:
-                logger.info(f"🤖 Using agentic feature suggestion for {repo_name}")
+                logger.info("🤖 Using agentic feature suggestion for %s", repo_name)
                 agentic_result = await agentic_adapter.suggest_feature_implementation(
                     feature_description, repo_name
                 )
@@ -292,16 +413,16 @@ async def suggest_feature_placement(
                     agentic_success = True
                     logger.info("✅ Agentic feature suggestion completed")
         except Exception as e:
-            logger.warning(f"⚠️ Agentic feature suggestion failed, falling back: {e}")
+            logger.warning("⚠️ Agentic feature suggestion failed, falling back: %s", e)
         
         # Fallback to regular AI suggestions
         if not agentic_success:
-            logger.info(f"🔄 Using regular AI feature suggestion for {repo_name}")
-            suggestions = ai_client.suggest_feature_placement(
+            logger.info("🔄 Using regular AI feature suggestion for %s", repo_name)
+            suggestions = await ai_client.suggest_feature_placement(
                 feature_description, knowledge
             )
         
-        logger.info(f"Feature placement suggestions for {repo_name}: {suggestions}")
+        logger.info("Feature placement suggestions for %s: %s", repo_name, suggestions)
         
         return {
             "success": True,
@@ -311,8 +432,7 @@ async def suggest_feature_placement(
         }
         
     except Exception as e:
-        logger.error(f"Error in suggest_feature_placement: {e}")
-        logger.debug(traceback.format_exc())
+        logger.error("Error in suggest_feature_placement: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
         return {"error": str(e)}
 
 
@@ -320,7 +440,7 @@ async def suggest_feature_placement(
 async def list_repositories():
     """List all analyzed repositories"""
     repos = knowledge_base.list_repositories()
-    logger.info(f"Listing analyzed repositories: {repos}")
+    logger.debug("Listing analyzed repositories: %s", repos)
     return {"repositories": repos}
 
 
@@ -330,11 +450,11 @@ async def list_repositories():
 async def autonomous_analyze_organization(organization: str, options: Optional[Dict[str, Any]] = None):
     """Autonomously analyze an entire organization using agentic workflow"""
     try:
-        logger.info(f"🚀 Starting autonomous organization analysis for: {organization}")
+        logger.info("🚀 Starting autonomous organization analysis for: %s", organization)
         result = await agentic_adapter.analyze_organization_autonomous(organization, options)
         return {"status": "success", "data": result}
     except Exception as e:
-        logger.error(f"Autonomous organization analysis failed: {e}")
+        logger.error("Autonomous organization analysis failed: %s", e)
         return {"status": "error", "message": str(e)}
 
 
@@ -342,11 +462,11 @@ async def autonomous_analyze_organization(organization: str, options: Optional[D
 async def autonomous_analyze_repository(repo_name: str, options: Optional[Dict[str, Any]] = None):
     """Autonomously analyze a single repository using agentic workflow"""
     try:
-        logger.info(f"🔍 Starting autonomous repository analysis for: {repo_name}")
+        logger.info("🔍 Starting autonomous repository analysis for: %s", repo_name)
         result = await agentic_adapter.analyze_repository_autonomous(repo_name, options)
         return {"status": "success", "data": result}
     except Exception as e:
-        logger.error(f"Autonomous repository analysis failed: {e}")
+        logger.error("Autonomous repository analysis failed: %s", e)
         return {"status": "error", "message": str(e)}
 
 
@@ -360,11 +480,11 @@ async def autonomous_suggest_feature(request: Dict[str, Any]):
         if not feature_request:
             return {"status": "error", "message": "feature_request is required"}
             
-        logger.info(f"🎯 Starting autonomous feature suggestion: {feature_request}")
+        logger.info("🎯 Starting autonomous feature suggestion: %s", feature_request)
         result = await agentic_adapter.suggest_feature_implementation(feature_request, repo_name)
         return {"status": "success", "data": result}
     except Exception as e:
-        logger.error(f"Autonomous feature suggestion failed: {e}")
+        logger.error("Autonomous feature suggestion failed: %s", e)
         return {"status": "error", "message": str(e)}
 
 
@@ -375,7 +495,7 @@ async def get_agentic_status():
         status = await agentic_adapter.get_orchestrator_status()
         return {"status": "success", "data": status}
     except Exception as e:
-        logger.error(f"Failed to get agentic status: {e}")
+        logger.error("Failed to get agentic status: %s", e)
         return {"status": "error", "message": str(e)}
 
 
@@ -387,10 +507,10 @@ async def smart_analyze_with_context(
 ):
     """Smart analysis that automatically selects the best approach using agentic workflow"""
     try:
-        logger.info(f"🧠 Starting smart agentic analysis for {repo_name}")
+        logger.info("🧠 Starting smart agentic analysis for %s", repo_name)
         
         # Get repository data
-        repo_data = knowledge_base.get_repository_knowledge(repo_name)
+        repo_data = await run_in_threadpool(knowledge_base.get_repository_knowledge, repo_name)
         if not repo_data:
             return {"status": "error", "message": f"Repository {repo_name} not found"}
         
@@ -438,12 +558,12 @@ async def smart_analyze_with_context(
             # Fallback to regular analysis
             # Include diagram context if available in knowledge base
             kb_mermaid = repo_data.get('mermaid_diagram') if isinstance(repo_data, dict) else None
-            result = ai_client.analyze_repository(repo_data, kb_mermaid or (user_request or ""))
+            result = await ai_client.analyze_repository(repo_data, kb_mermaid or (user_request or ""))
             
         return {"status": "success", "data": result}
         
     except Exception as e:
-        logger.error(f"Smart agentic analysis failed: {e}")
+        logger.error("Smart agentic analysis failed: %s", e)
         return {"status": "error", "message": str(e)}
 
 
@@ -453,22 +573,33 @@ async def smart_analyze_with_context(
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    logger.info("Health check performed")
+    logger.debug("Health check performed")
     return {"status": "healthy", "message": "AI Code Architecture Agent is running"}
 
 
+# /api/model-health response reused for HEALTH_SNAPSHOT_SECONDS, as (monotonic time, response)
+HEALTH_SNAPSHOT_SECONDS = 1.0
+_health_snapshot: Optional[Tuple[float, Dict]] = None
+
+
 @app.get("/api/model-health")
 async def get_model_health():
     """Get the current health status of AI models"""
+    global _health_snapshot
     try:
+        # Dashboards poll faster than model health changes, and the cache
+        # stats scan the whole cache directory
+        if _health_snapshot is not None and time.monotonic() - _health_snapshot[0] < HEALTH_SNAPSHOT_SECONDS:
+            return _health_snapshot[1]
+        
         # Get model availability
-        available_models = []
-        for model_info in ai_client.models:
-            available_models.append({
-                'name': model_info['name'],
-                'type': model_info['type'],
-                'healthy': ai_client.error_handler.is_model_healthy(model_info['name'])
-            })
+        circuit_states = ai_client.circuit_states()
+        available_models = [{
+            'name': model_info.name,
+            'type': model_info.type,
+            'healthy': ai_client.error_handler.is_model_healthy(model_info.name),
+            'circuit': circuit_states.get(model_info.name, 'closed')
+        } for model_info in ai_client.models]
         
         # Get error summary
         error_summary = ai_client.error_handler.get_error_summary()
@@ -476,15 +607,17 @@ async def get_model_health():
         # Get cache stats
         cache_stats = ai_client.cache.get_stats()
         
-        return {
+        health = {
             'success': True,
             'models': available_models,
             'total_models': len(available_models),
-            'healthy_models': len([m for m in available_models if m['healthy']]),
+            'healthy_models': sum(m['healthy'] for m in available_models),
             'error_summary': error_summary,
             'cache_stats': cache_stats,
             'recommendations': _get_health_recommendations(available_models, error_summary)
         }
+        _health_snapshot = (time.monotonic(), health)
+        return health
         
     except Exception as e:
         return {
@@ -499,9 +632,10 @@ async def get_model_health():
 @app.post("/api/clear-model-errors")
 async def clear_model_errors():
     """Clear recorded model errors (admin endpoint)"""
+    global _health_snapshot
     try:
-        ai_client.error_handler.error_count.clear()
-        ai_client.error_handler.last_errors.clear()
+        ai_client.error_handler.clear()
+        _health_snapshot = None
         
         return {
             'success': True,
@@ -518,8 +652,10 @@ async def clear_model_errors():
 @app.post("/api/clear-cache")
 async def clear_cache():
     """Clear the response cache (admin endpoint)"""
+    global _health_snapshot
     try:
         cleared_count = ai_client.cache.clear_all()
+        _health_snapshot = None
         
         return {
             'success': True,
@@ -568,213 +704,147 @@ def _get_health_recommendations(models: list, error_summary: dict) -> list:
     return recommendations
 
 
-@app.post("/ask-question")
-async def ask_question(
-    question: str = Form(...),
-    repo_context: str = Form(None),
-    repo_contexts: str = Form(None)
-):
-    """
-    Ask a question about a previously analyzed repository
-    """
-    try:
-        logger.info(f"Received question: {question}")
-        logger.info(f"Received repository context: {repo_context}")
-        logger.info(f"Received repository contexts: {repo_contexts}")
+def _search_repo_memories(question: str, repo_name: str, limit: int) -> List[Dict]:
+    """Memories related to a question in a repository's conversation, [] without a memory manager"""
+    if not conversation_manager.memory_manager:
+        return []
+    return conversation_manager.memory_manager.search_memories(
+        query=question,
+        user_id=f"repo_{repo_name}",
+        limit=limit
+    )
 
-        # Parse multi-repo contexts if provided
-        contexts: List[str] = []
-        if repo_contexts:
-            try:
-                parsed = json.loads(repo_contexts)
-                if isinstance(parsed, list):
-                    contexts = [str(x) for x in parsed]
-            except Exception:
-                # Fallback: comma or space separated
-                contexts = [c for c in re.split(r"[,\s]+", repo_contexts) if c]
-
-        if not contexts and repo_context:
-            contexts = [repo_context]
 
-        valid_repos: List[str] = [r for r in contexts if knowledge_base.has_repository(r)]
-
-        # If multiple valid repos provided, build a blended context
-        if len(valid_repos) > 1:
-            all_repos_knowledge = knowledge_base.get_all_repositories_knowledge()
-            org_patterns = knowledge_base.get_organization_patterns()
-
-            # Collect conversation and memory per repo
-            conversation_sections = []
-            memory_sections = []
-            files_sections = []
-            diagrams_sections = []
-
-            # Limit total files across repos to avoid token blow-up
-            max_total_files = 40
-            per_repo_limit = max(8, max_total_files // len(valid_repos))
-            important_extensions = ('.js', '.ts', '.jsx', '.tsx', '.py', '.java', '.go', '.rs', '.php', '.rb', '.json', '.yaml', '.yml', '.toml', '.md', '.txt', '.html', '.css', '.scss', '.sql')
-            config_files = ('package.json', 'requirements.txt', 'Cargo.toml', 'go.mod', 'pom.xml', 'build.gradle', 'tsconfig.json', 'dockerfile', 'docker-compose.yml', '.env.example', 'readme.md', 'license', 'makefile')
-
-            for rname in valid_repos:
-                repo_knowledge = knowledge_base.get_repository_knowledge(rname)
-                # Conversation history
-                conv = conversation_manager.format_conversation_for_ai(rname)
-                if conv:
-                    conversation_sections.append(f"**Conversation ({rname}):**\n{conv}")
-
-                # Memory context
-                mem_section = ""
-                if conversation_manager.memory_manager:
-                    related_memories = conversation_manager.memory_manager.search_memories(
-                        query=question,
-                        user_id=f"repo_{rname}",
-                        limit=6
-                    )
-                    if related_memories:
-                        mem_section = "\n".join([f"- {m.get('memory','')}" for m in related_memories if m.get('memory')])
-                if mem_section:
-                    memory_sections.append(f"**Memories ({rname}):**\n{mem_section}")
-
-                # Files and structure
-                file_contents = repo_knowledge.get('file_contents', {})
-                file_structure = repo_knowledge.get('file_structure', [])
-                files_block = ["**File Tree:**"] + [f"- {p}" for p in sorted(file_structure)[:200]]
-                files_block.append("\n**File Contents (important excerpts):**")
-                selected = 0
-                for fpath, finfo in file_contents.items():
-                    if selected >= per_repo_limit:
-                        break
-                    if (fpath.lower().endswith(important_extensions) or any(cfg.lower() in fpath.lower() for cfg in config_files)):
-                        content = finfo.get('content', '')[:1500]
-                        ftype = finfo.get('type', 'unknown')
-                        files_block.append(f"\n--- {fpath} ({ftype}) ---\n{content}")
-                        selected += 1
-                files_sections.append(f"**Repository ({rname}) Files:**\n" + "\n".join(files_block))
-
-                # Diagrams
-                diag = repo_knowledge.get('mermaid_diagram') or ''
-                if diag:
-                    diagrams_sections.append(f"**System Diagram ({rname}):**\n```mermaid\n{diag}\n```")
-
-            prompt = f"""
-You are analyzing a user question across multiple related repositories in the same organization.
+async def _record_exchanges(repo_names: List[str], question: str, answer: str) -> None:
+    """Add a question and its answer to each repository's conversation, repositories in parallel"""
+    def record(repo_name: str):
+        conversation_manager.add_message(repo_name, 'user', question)
+        conversation_manager.add_message(repo_name, 'assistant', answer)
 
-Repositories involved: {', '.join(valid_repos)}
+    await asyncio.gather(*(run_in_threadpool(record, repo_name) for repo_name in repo_names))
 
-Question:
-{question}
 
-ORGANIZATION-WIDE CONTEXT:
-- Total repositories: {len(all_repos_knowledge)}
-- Common Languages: {', '.join([f"{lang} ({count} repos)" for lang, count in list(org_patterns['languages'].items())[:5]])}
-- Common Frameworks: {', '.join([f"{fw} ({count} repos)" for fw, count in list(org_patterns['frameworks'].items())[:5]])}
-- File Extensions Used: {', '.join([f".{ext} ({count} files)" for ext, count in list(org_patterns['file_patterns'].items())[:10]])}
+# /ask-question answers being generated, by answer key
+_pending_answers: Dict[str, asyncio.Future] = {}
 
-CONVERSATION HISTORY:
-{chr(10).join(conversation_sections) if conversation_sections else 'None'}
 
-MEMORY CONTEXT:
-{chr(10).join(memory_sections) if memory_sections else 'None'}
+async def _answer_question(question: str, contexts: List[str], valid_repos: List[str], answer_key: str,
+                           use_cache: bool = True) -> Dict:
+    """Build the prompt for a question from its repositories' context and answer it"""
+    # If multiple valid repos provided, build a blended context
+    if len(valid_repos) > 1:
+        # Limit total files across repos to avoid token blow-up
+        max_total_files = 40
+        per_repo_limit = max(8, max_total_files // len(valid_repos))
 
-REPOSITORY CONTEXTS (files and structure):
-{chr(10).join(files_sections)}
+        async def build_sections(rname: str) -> Tuple[str, str, str, str]:
+            """Conversation, memory, files and diagram sections for one repo, '' when empty"""
+            # File tree and excerpts were built when the repository was stored
+            fragments, related_memories = await asyncio.gather(
+                run_in_threadpool(knowledge_base.get_prompt_fragments, rname),
+                run_in_threadpool(_search_repo_memories, question, rname, 6)
+            )
 
-DIAGRAMS:
-{chr(10).join(diagrams_sections) if diagrams_sections else 'None'}
+            # Conversation history
+            conv = conversation_manager.format_conversation_for_ai(rname)
+            conv_section = f"**Conversation ({rname}):**\n{conv}" if conv else ""
+
+            # Memory context
+            mem_section = "\n".join(f"- {m['memory']}" for m in related_memories if m.get('memory'))
+            if mem_section:
+                mem_section = f"**Memories ({rname}):**\n{mem_section}"
+
+            # Files and structure
+            files_buffer = io.StringIO()
+            files_buffer.writelines((
+                f"**Repository ({rname}) Files:**\n",
+                fragments.get('file_tree', ''),
+                "\n\n**File Contents (important excerpts):**"
+            ))
+            for excerpt in fragments.get('excerpts', [])[:per_repo_limit]:
+                files_buffer.writelines(("\n", excerpt))
+            files_section = files_buffer.getvalue()
+
+            # Diagrams
+            diag = fragments.get('mermaid_diagram') or ''
+            diag_section = f"**System Diagram ({rname}):**\n```mermaid\n{diag}\n```" if diag else ""
+
+            return conv_section, mem_section, files_section, diag_section
+
+        # Repositories are independent, so their storage and memory lookups run concurrently
+        repo_sections = await asyncio.gather(*(build_sections(rname) for rname in valid_repos))
+
+        # Collect conversation and memory per repo
+        conversation_sections, memory_sections, files_sections, diagrams_sections = (
+            [section for section in column if section] for column in zip(*repo_sections)
+        )
 
-Instructions:
-1. Provide a unified answer that references the specific repositories by name where relevant.
-2. Call out integration points between these repos (APIs, events, contracts, shared types).
-3. When suggesting implementation, indicate exact files and locations per repo following their patterns.
-4. Note differences in stack or conventions and recommend consistent org-wide patterns where helpful.
-5. Keep it concise, structured, and avoid repeating the same info for each repo unless necessary.
-"""
+        # Organization aggregates are formatted once per change to the repositories table
+        org_context = await run_in_threadpool(knowledge_base.get_org_context)
+        prompt = MULTI_REPO_PROMPT_TEMPLATE.format(
+            repos=', '.join(valid_repos),
+            question=question,
+            repo_count=org_context['repo_count'],
+            org_patterns=org_context['pattern_lines'],
+            conversations="\n".join(conversation_sections) or 'None',
+            memories="\n".join(memory_sections) or 'None',
+            files="\n".join(files_sections),
+            diagrams="\n".join(diagrams_sections) or 'None'
+        )
 
-            response = await ai_client.generate_response(prompt)
+        response = await ai_client.generate_response(prompt, answer_key=answer_key, use_cache=use_cache)
 
-            # Add messages to each involved repo conversation
-            for rname in valid_repos:
-                conversation_manager.add_message(rname, 'user', question)
-                conversation_manager.add_message(rname, 'assistant', response)
+        # Add messages to each involved repo conversation
+        await _record_exchanges(valid_repos, question, response)
 
-            logger.info(f"Question answered with multi-repo context for {', '.join(valid_repos)}")
+        logger.info("Question answered with multi-repo context for %s", ', '.join(valid_repos))
 
-            return {
-                "success": True,
-                "message": "Question answered with multi-repo context",
-                "analysis_summary": response,
-                "repo_contexts": valid_repos
-            }
+        return {
+            "success": True,
+            "message": "Question answered with multi-repo context",
+            "analysis_summary": response,
+            "repo_contexts": valid_repos
+        }
 
-        # Single repository path (backward-compatible)
-        if contexts and len(valid_repos) == 1:
-            repo_context = valid_repos[0]
-            repo_knowledge = knowledge_base.get_repository_knowledge(repo_context)
-            # ALSO get all repositories for cross-repo context
-            all_repos_knowledge = knowledge_base.get_all_repositories_knowledge()
-            org_patterns = knowledge_base.get_organization_patterns()
-            
-            # Get conversation history
-            conversation_history = conversation_manager.format_conversation_for_ai(repo_context)
-            
-            # **ENHANCED MEMORY INTEGRATION - Search for relevant memories**
-            memory_context = ""
-            if conversation_manager.memory_manager:
-                # Search for memories related to the current question
-                related_memories = conversation_manager.memory_manager.search_memories(
-                    query=question,
-                    user_id=f"repo_{repo_context}",
-                    limit=10
-                )
-                
-                if related_memories:
-                    memory_context = "\n**RELEVANT CONVERSATION HISTORY:**\n"
-                    for memory in related_memories:
-                        memory_text = memory.get('memory', '')
-                        if memory_text:
-                            memory_context += f"- {memory_text}\n"
-                    memory_context += "\n"
-                    logger.info(f"Found {len(related_memories)} relevant memories for context")
-                else:
-                    logger.info("No relevant memories found")
-            
-            # Add user question to conversation
-            conversation_manager.add_message(repo_context, 'user', question)
-            
-            # Build comprehensive context with file structure and contents
-            file_contents = repo_knowledge.get('file_contents', {})
-            file_structure = repo_knowledge.get('file_structure', [])
-            
-            # Create detailed file tree with contents
-            files_context = "**COMPLETE FILE STRUCTURE AND CONTENTS:**\n\n"
-            
-            # Add file tree
-            files_context += "**File Tree:**\n"
-            for file_path in sorted(file_structure):
-                files_context += f"- {file_path}\n"
-            
-            files_context += "\n**File Contents:**\n"
-            
-            # Add file contents (limit to important files to avoid token limits)
-            important_extensions = ('.js', '.ts', '.jsx', '.tsx', '.py', '.java', '.go', '.rs', '.php', '.rb', '.json', '.yaml', '.yml', '.toml', '.md', '.txt', '.html', '.css', '.scss', '.sql')
-            config_files = ('package.json', 'requirements.txt', 'Cargo.toml', 'go.mod', 'pom.xml', 'build.gradle', 'tsconfig.json', 'dockerfile', 'docker-compose.yml', '.env.example', 'readme.md', 'license', 'makefile')
-            
-            for file_path, file_info in file_contents.items():
-                # Include file if it's an important extension or config file
-                if (file_path.lower().endswith(important_extensions) or 
-                    any(config.lower() in file_path.lower() for config in config_files)):
-                    
-                    content = file_info.get('content', '')[:2000]  # Limit content size
-                    file_type = file_info.get('type', 'unknown')
-                    
-                    files_context += f"\n--- {file_path} ({file_type}) ---\n"
-                    files_context += content
-                    if len(file_info.get('content', '')) > 2000:
-                        files_context += "\n... (content truncated)"
-                    files_context += "\n"
-            
-            # Use the AI client to answer the question with context
-            prompt = f"""
+    # Single repository path (backward-compatible)
+    if contexts and len(valid_repos) == 1:
+        repo_context = valid_repos[0]
+        # Repository, organization-wide context (for cross-repo answers), memories
+        # and files related to the question are independent, so they load concurrently
+        repo_knowledge, org_context, related_memories, ranked_files = await asyncio.gather(
+            run_in_threadpool(knowledge_base.get_prompt_fragments, repo_context),
+            run_in_threadpool(knowledge_base.get_org_context),
+            run_in_threadpool(_search_repo_memories, question, repo_context, 10),
+            run_in_threadpool(knowledge_base.rank_files, repo_context, question)
+        )
+        
+        # Get conversation history
+        conversation_history = conversation_manager.format_conversation_for_ai(repo_context)
+        
+        # **ENHANCED MEMORY INTEGRATION - Relevant memories found above**
+        memory_context = ""
+        if related_memories:
+            memory_lines = "".join(
+                f"- {memory_text}\n" for memory_text in (m.get('memory', '') for m in related_memories) if memory_text
+            )
+            memory_context = f"\n**RELEVANT CONVERSATION HISTORY:**\n{memory_lines}\n"
+            logger.info("Found %d relevant memories for context", len(related_memories))
+        elif conversation_manager.memory_manager:
+            logger.info("No relevant memories found")
+        
+        # Add user question to conversation; this writes to SQLite and the memory store
+        await run_in_threadpool(conversation_manager.add_message, repo_context, 'user', question)
+        
+        # File tree and token-capped file sections were rendered when the repository
+        # was stored; the sections most relevant to the question fill the token budget
+        files_context = select_files_context(repo_knowledge, question, ranked_paths=ranked_files)
+        
+        other_repos = "\n".join(
+            f"- {name}: {summary}..." for name, summary in org_context['summaries'] if name != repo_context
+        )
+        
+        # Use the AI client to answer the question with context
+        prompt = f"""
 Based on the previously analyzed repository '{repo_context}', please answer this question:
 
 {conversation_history}
@@ -786,15 +856,13 @@ Based on the previously analyzed repository '{repo_context}', please answer this
 {files_context}
 
 **ORGANIZATION-WIDE CONTEXT:**
-This organization has {len(all_repos_knowledge)} repositories total.
+This organization has {org_context['repo_count']} repositories total.
 
 **Organization Patterns:**
-- Common Languages: {', '.join([f"{lang} ({count} repos)" for lang, count in list(org_patterns['languages'].items())[:5]])}
-- Common Frameworks: {', '.join([f"{fw} ({count} repos)" for fw, count in list(org_patterns['frameworks'].items())[:5]])}
-- File Extensions Used: {', '.join([f".{ext} ({count} files)" for ext, count in list(org_patterns['file_patterns'].items())[:10]])}
+{org_context['pattern_lines']}
 
 **Other Repositories in Organization:**
-{chr(10).join([f"- {name}: {data['analysis'].get('architecture_summary', 'No summary')[:100]}..." for name, data in list(all_repos_knowledge.items())[:5] if name != repo_context])}
+{other_repos}
 
 **Architecture Analysis:**
 {repo_knowledge.get('analysis', {}).get('architecture_summary', 'No analysis available')}
@@ -806,7 +874,7 @@ This organization has {len(all_repos_knowledge)} repositories total.
 
 IMPORTANT: Use the relevant conversation history above to maintain context and avoid repeating information. Build upon previous discussions and reference earlier conversations when relevant.
 
-You now have access to the COMPLETE codebase structure and file contents PLUS context from {len(all_repos_knowledge)} other repositories in this organization PLUS relevant conversation history.
+You now have access to the COMPLETE codebase structure and file contents PLUS context from {org_context['repo_count']} other repositories in this organization PLUS relevant conversation history.
 
 When answering:
 1. **Reference previous conversations** and build upon them
@@ -825,23 +893,23 @@ When suggesting where to add new features:
 
 Consider the conversation history when answering to maintain context and avoid repeating information already provided.
 """
-            
-            response = await ai_client.generate_response(prompt)
-            
-            # Add AI response to conversation
-            conversation_manager.add_message(repo_context, 'assistant', response)
-            
-            logger.info(f"Question answered with repository context for {repo_context}")
-            
-            return {
-                "success": True,
-                "message": "Question answered with repository context",
-                "analysis_summary": response,
-                "repo_context": repo_context
-            }
-        else:
-            # No repository context available
-            general_prompt = f"""
+        
+        response = await ai_client.generate_response(prompt, answer_key=answer_key, use_cache=use_cache)
+        
+        # Add AI response to conversation
+        await run_in_threadpool(conversation_manager.add_message, repo_context, 'assistant', response)
+        
+        logger.info("Question answered with repository context for %s", repo_context)
+        
+        return {
+            "success": True,
+            "message": "Question answered with repository context",
+            "analysis_summary": response,
+            "repo_context": repo_context
+        }
+    else:
+        # No repository context available
+        general_prompt = f"""
 The user is asking: {question}
 
 Since no specific codebase context is available, provide general guidance about:
@@ -852,21 +920,93 @@ Since no specific codebase context is available, provide general guidance about:
 
 Be helpful but explain that specific codebase analysis would provide better recommendations.
 """
-            
-            response = await ai_client.generate_response(general_prompt)
-            
-            logger.info("General guidance provided due to lack of specific context")
-            
-            return {
+        
+        response = await ai_client.generate_response(general_prompt, answer_key=answer_key, use_cache=use_cache)
+        
+        logger.info("General guidance provided due to lack of specific context")
+        
+        return {
+            "success": True,
+            "message": "General guidance provided",
+            "analysis_summary": response,
+            "repo_context": None
+        }
+
+
+@app.post("/ask-question")
+async def ask_question(
+    question: str = Form(...),
+    repo_context: str = Form(None),
+    repo_contexts: str = Form(None),
+    no_cache: bool = Form(False)
+):
+    """
+    Ask a question about a previously analyzed repository. no_cache forces a
+    freshly generated answer, which then replaces the cached one.
+    """
+    try:
+        logger.info("Received question: %s", question)
+        logger.info("Received repository context: %s", repo_context)
+        logger.info("Received repository contexts: %s", repo_contexts)
+
+        # Parse multi-repo contexts if provided
+        contexts: List[str] = []
+        repo_contexts = repo_contexts.strip() if repo_contexts else ''
+        if repo_contexts:
+            try:
+                parsed = orjson.loads(repo_contexts)
+                if isinstance(parsed, list):
+                    contexts = [str(x) for x in parsed]
+            except orjson.JSONDecodeError:
+                # Fallback: comma or space separated
+                contexts = repo_contexts.replace(',', ' ').split()
+
+        if not contexts and repo_context:
+            contexts = [repo_context]
+
+        # One query both checks which repositories exist and fetches their content hashes
+        repo_hashes = await run_in_threadpool(knowledge_base.get_repository_hashes, contexts)
+        valid_repos: List[str] = [r for r in contexts if r in repo_hashes]
+
+        # Same question about the same repository contents: reuse the answer
+        # without rebuilding the prompt or calling a model
+        answer_context = f"ask-v{ASK_PROMPT_VERSION}::" + ",".join(
+            f"{name}@{repo_hashes.get(name, '')}" for name in sorted(set(valid_repos))
+        )
+        answer_key = ai_client.answer_key(question, answer_context)
+        cached_answer = None if no_cache else await ai_client.lookup_answer(answer_key)
+        if cached_answer:
+            await _record_exchanges(valid_repos, question, cached_answer)
+            logger.info("💾 Question answered from cache")
+            result = {
                 "success": True,
-                "message": "General guidance provided",
-                "analysis_summary": response,
-                "repo_context": None
+                "message": "Question answered from cache",
+                "analysis_summary": cached_answer
             }
+            if len(valid_repos) > 1:
+                result["repo_contexts"] = valid_repos
+            else:
+                result["repo_context"] = valid_repos[0] if valid_repos else None
+            return result
+
+        # An identical question already being answered: share its answer
+        # instead of building the same prompt and calling a model again
+        pending = _pending_answers.get(answer_key)
+        if pending is not None:
+            result = dict(await asyncio.shield(pending))
+            await _record_exchanges(valid_repos, question, result["analysis_summary"])
+            logger.info("🔗 Question answered alongside an identical in-flight request")
+            return result
+
+        pending = asyncio.ensure_future(_answer_question(question, contexts, valid_repos, answer_key,
+                                                          use_cache=not no_cache))
+        _pending_answers[answer_key] = pending
+        pending.add_done_callback(lambda _: _pending_answers.pop(answer_key, None))
+        # A disconnecting caller doesn't cancel the answer others are waiting on
+        return await asyncio.shield(pending)
             
     except Exception as e:
-        logger.error(f"Error in ask_question: {e}")
-        logger.debug(traceback.format_exc())
+        logger.error("Error in ask_question: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
         return {
             "success": False,
             "message": f"Error processing question: {str(e)}"
@@ -878,13 +1018,13 @@ async def get_conversation_history(repo_name: str):
     """Get conversation history for a repository"""
     try:
         history = conversation_manager.get_conversation_history(repo_name)
-        return {
+        return Response(content=_encode_response({
             "success": True,
             "repo_name": repo_name,
             "conversation_history": history
-        }
+        }), media_type="application/json")
     except Exception as e:
-        logger.error(f"Error getting conversation history: {e}")
+        logger.error("Error getting conversation history: %s", e)
         return {"error": str(e)}
 
 
@@ -898,7 +1038,7 @@ async def clear_conversation_history(repo_name: str):
             "message": f"Conversation history cleared for {repo_name}"
         }
     except Exception as e:
-        logger.error(f"Error clearing conversation history: {e}")
+        logger.error("Error clearing conversation history: %s", e)
         return {"error": str(e)}
 
 
@@ -918,7 +1058,7 @@ async def chat_with_memory(
             repo_name, message, user_id
         )
         
-        logger.info(f"Memory chat for {repo_name}: {message[:100]}...")
+        logger.info("Memory chat for %s: %s...", repo_name, message[:100])
         
         return {
             "success": True,
@@ -928,8 +1068,7 @@ async def chat_with_memory(
         }
         
     except Exception as e:
-        logger.error(f"Error in chat_with_memory: {e}")
-        logger.debug(traceback.format_exc())
+        logger.error("Error in chat_with_memory: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
         return {"error": str(e)}
 
 
@@ -952,7 +1091,7 @@ async def analyze_repository_with_memory(
             return regular_result
         
         # Get repository data and diagram for memory analysis
-        repo_knowledge = knowledge_base.get_repository_knowledge(repo_name)
+        repo_knowledge = await run_in_threadpool(knowledge_base.get_repository_knowledge, repo_name)
         if not repo_knowledge:
             return {"error": "Repository analysis failed"}
         
@@ -969,13 +1108,12 @@ async def analyze_repository_with_memory(
         result["memory_analysis"] = memory_analysis
         result["user_id"] = user_id
         
-        logger.info(f"Memory-enabled analysis completed for {repo_name}")
+        logger.info("Memory-enabled analysis completed for %s", repo_name)
         
         return result
         
     except Exception as e:
-        logger.error(f"Error in analyze_repository_with_memory: {e}")
-        logger.debug(traceback.format_exc())
+        logger.error("Error in analyze_repository_with_memory: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
         return {"error": str(e)}
 
 
@@ -991,7 +1129,7 @@ async def suggest_feature_with_memory(
             user_id = f"repo_{repo_name}"
         
         # Get repository knowledge
-        knowledge = knowledge_base.get_repository_knowledge(repo_name)
+        knowledge = await run_in_threadpool(knowledge_base.get_repository_knowledge, repo_name)
         
         if not knowledge:
             return {"error": f"Repository {repo_name} not found in knowledge base"}
@@ -1001,7 +1139,7 @@ async def suggest_feature_with_memory(
             repo_name, feature_description, knowledge, user_id
         )
         
-        logger.info(f"Memory-enabled feature suggestions for {repo_name}")
+        logger.info("Memory-enabled feature suggestions for %s", repo_name)
         
         return {
             "success": True,
@@ -1011,8 +1149,7 @@ async def suggest_feature_with_memory(
         }
         
     except Exception as e:
-        logger.error(f"Error in suggest_feature_with_memory: {e}")
-        logger.debug(traceback.format_exc())
+        logger.error("Error in suggest_feature_with_memory: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
         return {"error": str(e)}
 
 
@@ -1045,12 +1182,14 @@ async def search_memories(
             return {"error": "Memory system not available"}
         
     except Exception as e:
-        logger.error(f"Error in memory search: {e}")
+        logger.error("Error in memory search: %s", e)
         return {"error": str(e)}
 
 
+# Endpoints from here on that only query SQLite are plain functions, so FastAPI runs
+# them in its threadpool instead of blocking the event loop for each query
 @app.get("/debug/repository/{repo_name}")
-async def debug_repository_knowledge(repo_name: str):
+def debug_repository_knowledge(repo_name: str):
     """Debug endpoint to inspect what knowledge is stored for a repository"""
     try:
         knowledge = knowledge_base.get_repository_knowledge(repo_name)
@@ -1067,7 +1206,7 @@ async def debug_repository_knowledge(repo_name: str):
             "has_mermaid_diagram": bool(knowledge.get('mermaid_diagram')),
             "file_structure_count": len(knowledge.get('file_structure', [])),
             "file_contents_count": len(knowledge.get('file_contents', {})),
-            "sample_files": list(knowledge.get('file_contents', {}).keys())[:10],
+            "sample_files": list(islice(knowledge.get('file_contents', {}), 10)),
             "analysis_keys": list(knowledge.get('analysis', {}).keys()) if isinstance(knowledge.get('analysis'), dict) else [],
             "mermaid_diagram_length": len(knowledge.get('mermaid_diagram', '')),
         }
@@ -1077,96 +1216,124 @@ async def debug_repository_knowledge(repo_name: str):
             "summary": summary,
             "sample_file_content": {
                 file_path: str(content)[:200] + "..." if len(str(content)) > 200 else str(content)
-                for file_path, content in list(knowledge.get('file_contents', {}).items())[:3]
+                for file_path, content in islice(knowledge.get('file_contents', {}).items(), 3)
             }
         }
         
     except Exception as e:
-        logger.error(f"Error in debug repository knowledge: {e}")
+        logger.error("Error in debug repository knowledge: %s", e)
         return {"error": str(e)}
 
 
+# table name -> (PRAGMA table_info rows, fixed statements), built on first use so the
+# statement text is identical across calls and sqlite3's statement cache reuses it
+_table_statements: Dict[str, Tuple[list, Dict[str, str]]] = {}
+
+
+def _get_table_statements(table_name: str) -> Optional[Tuple[list, Dict[str, str]]]:
+    """Columns and fixed SQL for a knowledge-base table, or None if it doesn't exist"""
+    cached = _table_statements.get(table_name)
+    if cached is None:
+        columns_info = knowledge_base.table_columns(table_name)
+        if columns_info is None:
+            return None
+        table = quote_identifier(table_name)
+        cached = (columns_info, {
+            'count': f"SELECT COUNT(*) FROM {table}",
+            'page': f"SELECT * FROM {table} LIMIT ? OFFSET ?",
+            'all': f"SELECT * FROM {table}",
+            'delete': f"DELETE FROM {table} WHERE id = ?",
+        })
+        _table_statements[table_name] = cached
+    return cached
+
+
+# Table browser cells longer than this are summarized or cut
+PREVIEW_CHARS = 500
+# Longest JSON cell parsed for a "{...} (N keys)" summary; longer ones are cut instead
+PREVIEW_PARSE_CHARS = 1 << 20
+
+
+def _preview_cell(value):
+    """Display value for a table browser cell: short values as they are, long JSON as a summary"""
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    if not isinstance(value, str) or len(value) <= PREVIEW_CHARS:
+        return value
+    # Only text that starts like a JSON object or array is worth parsing
+    if value.lstrip()[:1] in ('{', '[') and len(value) <= PREVIEW_PARSE_CHARS:
+        try:
+            parsed = orjson.loads(value)
+        except orjson.JSONDecodeError:
+            parsed = None
+        if isinstance(parsed, dict):
+            return f"{{...}} ({len(parsed)} keys)"
+        if isinstance(parsed, list):
+            return f"[...] ({len(parsed)} items)"
+    return value[:PREVIEW_CHARS] + "..."
+
+
 @app.get("/api/knowledge-base/tables")
-async def get_knowledge_base_tables():
+def get_knowledge_base_tables():
     """Get all tables and their structure from the knowledge base"""
     try:
-        conn = sqlite3.connect(knowledge_base.db_path)
-        cursor = conn.cursor()
-        
-        # Get all tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        
-        table_info = {}
-        for table in tables:
-            table_name = table[0]
+        with knowledge_base.connection() as conn:
+            cursor = conn.cursor()
             
-            # Get table schema
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = cursor.fetchall()
+            # Get all tables
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            tables = cursor.fetchall()
             
-            # Get row count
-            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-            row_count = cursor.fetchone()[0]
+            table_info = {}
+            for table in tables:
+                table_name = table[0]
+                
+                # Get table schema
+                columns, statements = _get_table_statements(table_name)
+                
+                # Get row count
+                cursor.execute(statements['count'])
+                row_count = cursor.fetchone()[0]
+                
+                table_info[table_name] = {
+                    "columns": [{"name": col[1], "type": col[2], "pk": bool(col[5])} for col in columns],
+                    "row_count": row_count
+                }
             
-            table_info[table_name] = {
-                "columns": [{"name": col[1], "type": col[2], "pk": bool(col[5])} for col in columns],
-                "row_count": row_count
-            }
-        
-        conn.close()
         return {"success": True, "tables": table_info}
         
     except Exception as e:
-        logger.error(f"Error getting knowledge base tables: {e}")
+        logger.error("Error getting knowledge base tables: %s", e)
         return {"error": str(e)}
 
 
 @app.get("/api/knowledge-base/table/{table_name}")
-async def get_table_data(table_name: str, limit: int = 100, offset: int = 0):
+def get_table_data(table_name: str, limit: int = 100, offset: int = 0):
     """Get data from a specific table with pagination"""
     try:
-        conn = sqlite3.connect(knowledge_base.db_path)
-        cursor = conn.cursor()
-        
-        # Validate table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-        if not cursor.fetchone():
-            return {"error": f"Table {table_name} not found"}
-        
-        # Get total count
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-        total_count = cursor.fetchone()[0]
-        
-        # Get column names
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [col[1] for col in cursor.fetchall()]
-        
-        # Get data with pagination
-        cursor.execute(f"SELECT * FROM {table_name} LIMIT ? OFFSET ?", (limit, offset))
-        rows = cursor.fetchall()
-        
-        # Convert to list of dictionaries
-        data = []
-        for row in rows:
-            row_dict = {}
-            for i, col in enumerate(columns):
-                value = row[i]
-                # Truncate long JSON strings for display
-                if isinstance(value, str) and len(value) > 500:
-                    try:
-                        # Try to parse as JSON and show summary
-                        parsed = json.loads(value)
-                        if isinstance(parsed, dict):
-                            value = f"{{...}} ({len(parsed)} keys)"
-                        elif isinstance(parsed, list):
-                            value = f"[...] ({len(parsed)} items)"
-                    except:
-                        value = value[:500] + "..."
-                row_dict[col] = value
-            data.append(row_dict)
-        
-        conn.close()
+        with knowledge_base.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Validate table exists
+            table = _get_table_statements(table_name)
+            if table is None:
+                return {"error": f"Table {table_name} not found"}
+            columns_info, statements = table
+            
+            # Get total count
+            cursor.execute(statements['count'])
+            total_count = cursor.fetchone()[0]
+            
+            # Get column names
+            columns = [col[1] for col in columns_info]
+            
+            # Get data with pagination
+            cursor.execute(statements['page'], (limit, offset))
+            
+            # Convert to list of dictionaries, summarizing long JSON strings and
+            # binary values for display
+            data = [dict(zip(columns, map(_preview_cell, row))) for row in cursor]
+            
         return {
             "success": True,
             "table_name": table_name,
@@ -1178,41 +1345,37 @@ async def get_table_data(table_name: str, limit: int = 100, offset: int = 0):
         }
         
     except Exception as e:
-        logger.error(f"Error getting table data: {e}")
+        logger.error("Error getting table data: %s", e)
         return {"error": str(e)}
 
 
 @app.get("/api/knowledge-base/table/{table_name}/all")
-async def get_all_table_data(table_name: str):
+def get_all_table_data(table_name: str):
     """Get ALL data from a specific table without pagination"""
     try:
-        conn = sqlite3.connect(knowledge_base.db_path)
-        cursor = conn.cursor()
-        
-        # Validate table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-        if not cursor.fetchone():
-            return {"error": f"Table {table_name} not found"}
-        
-        # Get column names
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [col[1] for col in cursor.fetchall()]
-        
-        # Get ALL data
-        cursor.execute(f"SELECT * FROM {table_name}")
-        rows = cursor.fetchall()
-        
-        # Convert to list of dictionaries
-        data = []
-        for row in rows:
-            row_dict = {}
-            for i, col in enumerate(columns):
-                value = row[i]
-                # Keep full data for editing
-                row_dict[col] = value
-            data.append(row_dict)
-        
-        conn.close()
+        with knowledge_base.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Validate table exists
+            table = _get_table_statements(table_name)
+            if table is None:
+                return {"error": f"Table {table_name} not found"}
+            columns_info, statements = table
+            
+            # Get column names
+            columns = [col[1] for col in columns_info]
+            
+            # Get ALL data
+            cursor.execute(statements['all'])
+            rows = cursor
+            
+            # Keep full data for editing; binary values (embeddings) aren't editable
+            if any(col[2] == 'BLOB' for col in columns_info):
+                rows = ([f"<{len(value)} bytes>" if isinstance(value, bytes) else value for value in row] for row in rows)
+            
+            # Convert to list of dictionaries
+            data = [dict(zip(columns, row)) for row in rows]
+            
         return {
             "success": True,
             "table_name": table_name,
@@ -1222,49 +1385,44 @@ async def get_all_table_data(table_name: str):
         }
         
     except Exception as e:
-        logger.error(f"Error getting all table data: {e}")
+        logger.error("Error getting all table data: %s", e)
         return {"error": str(e)}
 
 
 @app.post("/api/knowledge-base/table/{table_name}/row")
-async def add_table_row(table_name: str, row_data: dict):
+def add_table_row(table_name: str, row_data: dict):
     """Add a new row to a table"""
     try:
-        conn = sqlite3.connect(knowledge_base.db_path)
-        cursor = conn.cursor()
-        
-        # Validate table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-        if not cursor.fetchone():
-            return {"error": f"Table {table_name} not found"}
-        
-        # Get column info
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns_info = cursor.fetchall()
-        
-        # Filter out auto-increment primary key columns
-        columns = [col[1] for col in columns_info if not (col[5] == 1 and col[2] == 'INTEGER')]
-        
-        # Prepare data
-        values = []
-        placeholders = []
-        for col in columns:
-            if col in row_data:
-                values.append(row_data[col])
-                placeholders.append('?')
-        
-        if not values:
-            return {"error": "No valid data provided"}
-        
-        # Insert row
-        columns_str = ', '.join(columns[:len(values)])
-        placeholders_str = ', '.join(placeholders)
-        
-        cursor.execute(f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders_str})", values)
-        conn.commit()
-        
-        new_row_id = cursor.lastrowid
-        conn.close()
+        with knowledge_base.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Validate table exists
+            table = _get_table_statements(table_name)
+            if table is None:
+                return {"error": f"Table {table_name} not found"}
+            columns_info, _ = table
+            
+            # Filter out auto-increment primary key columns
+            columns = [col[1] for col in columns_info if not (col[5] == 1 and col[2] == 'INTEGER') and col[2] != 'BLOB']
+            
+            # Prepare data
+            provided = [col for col in columns if col in row_data]
+            values = [row_data[col] for col in provided]
+            placeholders = ['?'] * len(values)
+            
+            if not values:
+                return {"error": "No valid data provided"}
+            
+            # Insert row
+            columns_str = ', '.join(map(quote_identifier, provided))
+            placeholders_str = ', '.join(placeholders)
+            
+            cursor.execute(f"INSERT INTO {quote_identifier(table_name)} ({columns_str}) VALUES ({placeholders_str})", values)
+            conn.commit()
+            if table_name == 'repositories':
+                knowledge_base.forget_knowledge()
+            
+            new_row_id = cursor.lastrowid
         
         return {
             "success": True,
@@ -1273,48 +1431,45 @@ async def add_table_row(table_name: str, row_data: dict):
         }
         
     except Exception as e:
-        logger.error(f"Error adding row to table: {e}")
+        logger.error("Error adding row to table: %s", e)
         return {"error": str(e)}
 
 
 @app.put("/api/knowledge-base/table/{table_name}/row/{row_id}")
-async def update_table_row(table_name: str, row_id: int, row_data: dict):
+def update_table_row(table_name: str, row_id: int, row_data: dict):
     """Update an existing row in a table"""
     try:
-        conn = sqlite3.connect(knowledge_base.db_path)
-        cursor = conn.cursor()
-        
-        # Validate table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-        if not cursor.fetchone():
-            return {"error": f"Table {table_name} not found"}
-        
-        # Get column info
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns_info = cursor.fetchall()
-        columns = [col[1] for col in columns_info]
-        
-        # Prepare update data
-        set_clauses = []
-        values = []
-        for col in columns:
-            if col in row_data and col != 'id':  # Don't update id column
-                set_clauses.append(f"{col} = ?")
-                values.append(row_data[col])
-        
-        if not set_clauses:
-            return {"error": "No valid data provided for update"}
-        
-        values.append(row_id)
-        set_clause = ', '.join(set_clauses)
-        
-        cursor.execute(f"UPDATE {table_name} SET {set_clause} WHERE id = ?", values)
-        conn.commit()
-        
-        if cursor.rowcount == 0:
-            return {"error": f"Row with id {row_id} not found"}
-        
-        conn.close()
+        with knowledge_base.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Validate table exists
+            table = _get_table_statements(table_name)
+            if table is None:
+                return {"error": f"Table {table_name} not found"}
+            columns = [col[1] for col in table[0] if col[2] != 'BLOB']
+            
+            # Prepare update data
+            set_clauses = []
+            values = []
+            for col in columns:
+                if col in row_data and col != 'id':  # Don't update id column
+                    set_clauses.append(f"{quote_identifier(col)} = ?")
+                    values.append(row_data[col])
+            
+            if not set_clauses:
+                return {"error": "No valid data provided for update"}
+            
+            values.append(row_id)
+            set_clause = ', '.join(set_clauses)
+            
+            cursor.execute(f"UPDATE {quote_identifier(table_name)} SET {set_clause} WHERE id = ?", values)
+            conn.commit()
+            if table_name == 'repositories':
+                knowledge_base.forget_knowledge()
+            
+            if cursor.rowcount == 0:
+                return {"error": f"Row with id {row_id} not found"}
+            
         
         return {
             "success": True,
@@ -1322,29 +1477,30 @@ async def update_table_row(table_name: str, row_id: int, row_data: dict):
         }
         
     except Exception as e:
-        logger.error(f"Error updating row in table: {e}")
+        logger.error("Error updating row in table: %s", e)
         return {"error": str(e)}
 
 
 @app.delete("/api/knowledge-base/table/{table_name}/row/{row_id}")
-async def delete_table_row(table_name: str, row_id: int):
+def delete_table_row(table_name: str, row_id: int):
     """Delete a row from a table"""
     try:
-        conn = sqlite3.connect(knowledge_base.db_path)
-        cursor = conn.cursor()
-        
-        # Validate table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-        if not cursor.fetchone():
-            return {"error": f"Table {table_name} not found"}
-        
-        cursor.execute(f"DELETE FROM {table_name} WHERE id = ?", (row_id,))
-        conn.commit()
-        
-        if cursor.rowcount == 0:
-            return {"error": f"Row with id {row_id} not found"}
-        
-        conn.close()
+        with knowledge_base.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Validate table exists
+            table = _get_table_statements(table_name)
+            if table is None:
+                return {"error": f"Table {table_name} not found"}
+            
+            cursor.execute(table[1]['delete'], (row_id,))
+            conn.commit()
+            if table_name == 'repositories':
+                knowledge_base.forget_knowledge()
+            
+            if cursor.rowcount == 0:
+                return {"error": f"Row with id {row_id} not found"}
+            
         
         return {
             "success": True,
@@ -1352,143 +1508,172 @@ async def delete_table_row(table_name: str, row_id: int):
         }
         
     except Exception as e:
-        logger.error(f"Error deleting row from table: {e}")
+        logger.error("Error deleting row from table: %s", e)
         return {"error": str(e)}
 
 
+# Custom SQL queries are interrupted after this many seconds, and return at most
+# SQL_QUERY_MAX_ROWS rows
+SQL_QUERY_TIMEOUT = 5.0
+SQL_QUERY_MAX_ROWS = 5000
+# SQLite VM instructions between deadline checks
+SQL_PROGRESS_STEPS = 10000
+
+
 @app.post("/api/knowledge-base/execute-sql")
-async def execute_sql_query(request: dict):
-    """Execute a custom SQL query (SELECT only for security)"""
+def execute_sql_query(request: dict):
+    """Execute a custom read-only query (SELECT or WITH) with a time and row limit"""
     try:
         query = request.get('query', '')
         
-        # Security check - only allow SELECT queries
-        query_upper = query.upper().strip()
-        if not query_upper.startswith('SELECT'):
+        # Security check - only allow queries; the read-only connection below
+        # rejects any write that gets past this
+        keyword = query.split(None, 1)[0].upper() if query.strip() else ''
+        if keyword not in ('SELECT', 'WITH'):
             return {"error": "Only SELECT queries are allowed"}
         
-        conn = sqlite3.connect(knowledge_base.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        
-        # Get column names
-        columns = [description[0] for description in cursor.description]
-        
-        # Convert to list of dictionaries
-        data = []
-        for row in rows:
-            row_dict = {}
-            for i, col in enumerate(columns):
-                row_dict[col] = row[i]
-            data.append(row_dict)
-        
-        conn.close()
+        conn = knowledge_base.open_reader()
+        try:
+            # Returning 1 from the progress handler aborts the running statement
+            deadline = time.monotonic() + SQL_QUERY_TIMEOUT
+            conn.set_progress_handler(lambda: time.monotonic() > deadline, SQL_PROGRESS_STEPS)
+            
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query)
+                
+                # Get column names
+                columns = [description[0] for description in cursor.description]
+                
+                # Convert to list of dictionaries
+                rows = cursor.fetchmany(SQL_QUERY_MAX_ROWS + 1)
+            except Exception:
+                if time.monotonic() > deadline:
+                    return {"error": f"Query exceeded the {SQL_QUERY_TIMEOUT:g} second limit"}
+                raise
+            truncated = len(rows) > SQL_QUERY_MAX_ROWS
+            # BLOB values such as file embeddings can't go into JSON, so they're summarized
+            data = [
+                {column: f"<blob {len(value)} bytes>" if isinstance(value, bytes) else value
+                 for column, value in zip(columns, row)}
+                for row in islice(rows, SQL_QUERY_MAX_ROWS)
+            ]
+        finally:
+            conn.close()
         
         return {
             "success": True,
             "columns": columns,
             "data": data,
-            "row_count": len(data)
+            "row_count": len(data),
+            "truncated": truncated
         }
         
     except Exception as e:
-        logger.error(f"Error executing SQL query: {e}")
+        logger.error("Error executing SQL query: %s", e)
         return {"error": str(e)}
 
 
-@app.get("/api/knowledge-base/export")
-async def export_database():
-    """Export the database as JSON"""
+# Rows read per SQLite fetch, and written per chunk, while streaming an export
+EXPORT_FETCH_ROWS = 1000
+
+
+def _export_default(value):
+    """orjson fallback for BLOB columns such as file embeddings, exported as base64"""
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _export_lines(conn):
+    """
+    NDJSON chunks: an exported_at line, one {"_table": ..., column: value} line per
+    row, then {"_complete": true}. The status is already sent when a later read
+    fails, so a failure ends the stream with an {"_error": ...} line instead.
+    """
     try:
-        conn = sqlite3.connect(knowledge_base.db_path)
-        cursor = conn.cursor()
-        
-        # Get all tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        
-        export_data = {}
-        for table in tables:
-            table_name = table[0]
-            
-            # Get all data from each table
-            cursor.execute(f"SELECT * FROM {table_name}")
-            rows = cursor.fetchall()
-            
-            # Get column names
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = [col[1] for col in cursor.fetchall()]
-            
-            # Convert to list of dictionaries
-            table_data = []
-            for row in rows:
-                row_dict = {}
-                for i, col in enumerate(columns):
-                    row_dict[col] = row[i]
-                table_data.append(row_dict)
-            
-            export_data[table_name] = table_data
-        
+        yield orjson.dumps({"_exported_at": datetime.now().isoformat()}) + b"\n"
+        
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        for table_name in tables:
+            cursor = conn.cursor()
+            cursor.arraysize = EXPORT_FETCH_ROWS
+            cursor.execute(f"SELECT * FROM {quote_identifier(table_name)}")
+            columns = [description[0] for description in cursor.description]
+            while rows := cursor.fetchmany():
+                yield b"".join(
+                    orjson.dumps({"_table": table_name, **dict(zip(columns, row))}, default=_export_default) + b"\n"
+                    for row in rows
+                )
+        yield orjson.dumps({"_complete": True}) + b"\n"
+    except Exception as e:
+        logger.error("Error exporting database: %s", e)
+        yield orjson.dumps({"_error": str(e)}) + b"\n"
+    finally:
         conn.close()
-        
-        return {
-            "success": True,
-            "export_data": export_data,
-            "exported_at": datetime.now().isoformat()
-        }
-        
+
+
+@app.get("/api/knowledge-base/export")
+def export_database():
+    """Export the database as newline-delimited JSON, streamed a page of rows at a time"""
+    try:
+        # Own connection: the stream is read from whichever threadpool thread is free
+        conn = knowledge_base.open_reader()
     except Exception as e:
-        logger.error(f"Error exporting database: {e}")
+        logger.error("Error exporting database: %s", e)
         return {"error": str(e)}
+    
+    return StreamingResponse(
+        _export_lines(conn),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="knowledge_base_export.ndjson"'}
+    )
 
 
 @app.get("/api/knowledge-base/repository/{repo_name}/details")
-async def get_repository_details(repo_name: str):
+def get_repository_details(repo_name: str):
     """Get detailed information about a specific repository"""
     try:
-        conn = sqlite3.connect(knowledge_base.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, repo_name, repo_hash, file_structure, file_contents, 
-                   analysis, mermaid_diagram, created_at 
-            FROM repositories 
-            WHERE repo_name = ?
-        ''', (repo_name,))
-        
-        result = cursor.fetchone()
-        if not result:
-            return {"error": f"Repository {repo_name} not found"}
-        
-        # Parse JSON fields safely
-        try:
-            file_structure = json.loads(result[3]) if result[3] else []
-        except:
-            file_structure = []
+        with knowledge_base.connection() as conn:
+            cursor = conn.cursor()
             
-        try:
-            file_contents = json.loads(result[4]) if result[4] else {}
-        except:
-            file_contents = {}
+            # Features come back as one JSON array and the file count as a subquery,
+            # so the repository row needs a single round trip
+            cursor.execute('''
+                SELECT r.id, r.repo_name, r.repo_hash, r.file_structure, 
+                       r.analysis, r.mermaid_diagram, r.created_at,
+                       (SELECT COUNT(*) FROM repo_files WHERE repo_name = r.repo_name),
+                       (SELECT json_group_array(json_array(feature_description, suggestions, created_at))
+                        FROM (SELECT feature_description, suggestions, created_at
+                              FROM features WHERE repo_id = r.id ORDER BY created_at DESC))
+                FROM repositories r
+                WHERE r.repo_name = ?
+            ''', (repo_name,))
+            
+            result = cursor.fetchone()
+            if not result:
+                return {"error": f"Repository {repo_name} not found"}
+            
+            # Parse JSON fields safely
+            try:
+                file_structure = orjson.loads(result[3]) if result[3] else []
+            except:
+                file_structure = []
+                
+            try:
+                analysis = orjson.loads(result[4]) if result[4] else {}
+            except:
+                analysis = {}
+            
+            features = orjson.loads(result[8])
+            
+            # Only the sampled contents are read, and only their first 200 characters
+            cursor.execute('''
+                SELECT path, length(content), substr(content, 1, 200) FROM repo_files
+                WHERE repo_name = ? ORDER BY id LIMIT 5
+            ''', (repo_name,))
+            file_contents_sample = cursor.fetchall()
             
-        try:
-            analysis = json.loads(result[5]) if result[5] else {}
-        except:
-            analysis = {}
-        
-        # Get features for this repository
-        cursor.execute('''
-            SELECT feature_description, suggestions, created_at 
-            FROM features 
-            WHERE repo_id = ?
-            ORDER BY created_at DESC
-        ''', (result[0],))
-        
-        features = cursor.fetchall()
-        
-        conn.close()
         
         return {
             "success": True,
@@ -1497,33 +1682,76 @@ async def get_repository_details(repo_name: str):
                 "name": result[1],
                 "hash": result[2],
                 "file_structure": file_structure,
-                "file_contents_count": len(file_contents),
-                "file_contents_sample": {k: str(v)[:200] + "..." if len(str(v)) > 200 else str(v) 
-                                       for k, v in list(file_contents.items())[:5]},
+                "file_contents_count": result[7],
+                "file_contents_sample": {path: content + "..." if length > 200 else content
+                                       for path, length, content in file_contents_sample},
                 "analysis": analysis,
-                "mermaid_diagram": result[6],
-                "created_at": result[7],
+                "mermaid_diagram": result[5],
+                "created_at": result[6],
                 "features": [{"description": f[0], "suggestions": f[1], "created_at": f[2]} for f in features]
             }
         }
         
     except Exception as e:
-        logger.error(f"Error getting repository details: {e}")
+        logger.error("Error getting repository details: %s", e)
         return {"error": str(e)}
 
 
+@app.get("/api/knowledge-base/repository/{repo_name}/files")
+def get_repository_files(repo_name: str, limit: int = 50, offset: int = 0, preview_chars: int = 200):
+    """Page through a repository's stored files with the first preview_chars of each"""
+    try:
+        with knowledge_base.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT COUNT(*) FROM repo_files WHERE repo_name = ?", (repo_name,))
+            total_count = cursor.fetchone()[0]
+            
+            # Only the requested page is read, and only the head of each file
+            cursor.execute('''
+                SELECT path, type, size, length(content), substr(content, 1, ?) FROM repo_files
+                WHERE repo_name = ? ORDER BY id LIMIT ? OFFSET ?
+            ''', (preview_chars, repo_name, limit, offset))
+            files = [
+                {"path": path, "type": file_type, "size": size, "preview": preview,
+                 "truncated": length > preview_chars}
+                for path, file_type, size, length, preview in cursor
+            ]
+        
+        return {
+            "success": True,
+            "repo_name": repo_name,
+            "files": files,
+            "total_count": total_count,
+            "limit": limit,
+            "offset": offset
+        }
+        
+    except Exception as e:
+        logger.error("Error getting repository files: %s", e)
+        return {"error": str(e)}
+
+
+# /api/knowledge-base/debug/endpoints response, built on the first call once
+# startup has registered every route
+_routes_snapshot: Optional[Dict] = None
+
+
 @app.get("/api/knowledge-base/debug/endpoints")
 async def debug_endpoints():
     """Debug endpoint to list all available endpoints"""
-    routes = []
-    for route in app.routes:
-        if hasattr(route, 'methods') and hasattr(route, 'path'):
-            routes.append({
-                "path": route.path,
-                "methods": list(route.methods),
-                "name": getattr(route, 'name', 'N/A')
-            })
-    return {"routes": routes}
+    global _routes_snapshot
+    if _routes_snapshot is None:
+        routes = []
+        for route in app.routes:
+            if hasattr(route, 'methods') and hasattr(route, 'path'):
+                routes.append({
+                    "path": route.path,
+                    "methods": list(route.methods),
+                    "name": getattr(route, 'name', 'N/A')
+                })
+        _routes_snapshot = {"routes": routes}
+    return _routes_snapshot
 
 
 @app.get("/api/conversations")
@@ -1532,11 +1760,12 @@ async def get_all_conversations():
     try:
         conversations = []
         for repo_name, conversation_data in conversation_manager.conversations.items():
+            messages = conversation_data['messages']
             conversations.append({
                 "repo_name": repo_name,
-                "message_count": len(conversation_data.get('messages', [])),
+                "message_count": conversation_data.get('message_count', 0),
                 "created_at": conversation_data.get('created_at'),
-                "last_activity": conversation_data.get('messages', [{}])[-1].get('timestamp') if conversation_data.get('messages') else None
+                "last_activity": messages[-1].get('timestamp') if messages else None
             })
         
         return {
@@ -1544,58 +1773,223 @@ async def get_all_conversations():
             "conversations": conversations
         }
     except Exception as e:
-        logger.error(f"Error getting conversations: {e}")
+        logger.error("Error getting conversations: %s", e)
         return {"error": str(e)}
 
 
+class RepositoryNotFound(LookupError):
+    """A requested repository isn't in the knowledge base"""
+
+
+def safe_endpoint(fn):
+    """
+    Turn a handler's failures into HTTP errors: 404 for RepositoryNotFound,
+    500 with the traceback logged for anything unexpected. HTTPExceptions the
+    handler raises itself pass through unchanged.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await fn(*args, **kwargs)
+        except HTTPException:
+            raise
+        except RepositoryNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e)) from None
+        except Exception:
+            logger.exception("Error in %s", fn.__name__)
+            raise HTTPException(status_code=500, detail="Internal server error") from None
+    return wrapper
+
+
+# Encoded conversation responses kept, least recently used evicted first
+CONVERSATION_RESPONSE_CACHE_SIZE = 64
+
+# (endpoint, repo_name) -> (conversation version, encoded response body). The repo
+# context can hold a whole repository, so re-encoding it on every read is avoided
+# until the conversation changes. Only touched on the event loop.
+_conversation_responses = OrderedDict()
+
+
+def _orjson_default(value):
+    """
+    Types orjson doesn't encode natively: lazy file mappings and message deques.
+    A stored repository's files are sent as their type and size only; contents
+    are paged through /api/knowledge-base/repository/{repo_name}/files.
+    """
+    if isinstance(value, RepositoryFiles):
+        return {path: {"type": file_type, "size": size} for path, (file_type, size) in value.metadata().items()}
+    if isinstance(value, Mapping):
+        return dict(value.items())
+    if isinstance(value, (deque, set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _encode_response(content: Dict) -> bytes:
+    """
+    JSON body for content, encoded by orjson in one pass instead of converting
+    it with jsonable_encoder first
+    """
+    return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+# Encoded repo contexts kept, least recently used evicted first
+REPO_CONTEXT_CACHE_SIZE = 32
+
+# repo_name -> (context version, encoded repo context). New messages change the
+# conversation but not its context, so the context is encoded once per version.
+# Filled from the threadpool, hence the lock.
+_repo_contexts = OrderedDict()
+_repo_contexts_lock = threading.Lock()
+
+
+def _encoded_repo_context(repo_name: str) -> bytes:
+    """
+    The repository's conversation context as JSON, encoded again only when the
+    context is replaced. Blocking: stored knowledge reads its file contents from SQLite.
+    """
+    version = conversation_manager.context_version(repo_name)
+    with _repo_contexts_lock:
+        cached = _repo_contexts.get(repo_name)
+        if cached is not None and cached[0] == version:
+            _repo_contexts.move_to_end(repo_name)
+            return cached[1]
+    
+    encoded = _encode_response(conversation_manager.get_repo_context(repo_name))
+    # Version 0 means there is no conversation, and its context is just null
+    if version:
+        with _repo_contexts_lock:
+            _repo_contexts[repo_name] = (version, encoded)
+            _repo_contexts.move_to_end(repo_name)
+            while len(_repo_contexts) > REPO_CONTEXT_CACHE_SIZE:
+                _repo_contexts.popitem(last=False)
+    return encoded
+
+
+def _with_encoded_fields(body: bytes, fields: Dict[str, bytes]) -> bytes:
+    """Add already encoded values to an encoded JSON object"""
+    parts = [orjson.dumps(name) + b':' + value for name, value in fields.items()]
+    if not parts:
+        return body
+    separator = b'' if body == b'{}' else b','
+    return body[:-1] + separator + b','.join(parts) + b'}'
+
+
+async def _conversation_response(endpoint: str, repo_name: str, build) -> Response:
+    """
+    Response from build() with the repo context added as "repo_context", reused
+    while the repository's conversation is unchanged
+    """
+    key = (endpoint, repo_name)
+    version = conversation_manager.version(repo_name)
+    cached = _conversation_responses.get(key)
+    if cached is not None and cached[0] == version:
+        _conversation_responses.move_to_end(key)
+        return Response(content=cached[1], media_type="application/json")
+    
+    repo_context = await run_in_threadpool(_encoded_repo_context, repo_name)
+    body = _with_encoded_fields(_encode_response(build()), {"repo_context": repo_context})
+    # Version 0 means there is no conversation; caching those would let any name grow the cache
+    if version:
+        _conversation_responses[key] = (version, body)
+        _conversation_responses.move_to_end(key)
+        while len(_conversation_responses) > CONVERSATION_RESPONSE_CACHE_SIZE:
+            _conversation_responses.popitem(last=False)
+    return Response(content=body, media_type="application/json")
+
+
+# Most repositories one /api/conversations/batch request may ask for
+CONVERSATION_BATCH_LIMIT = 100
+
+
+@app.post("/api/conversations/batch")
+@safe_endpoint
+async def get_conversation_histories(request: dict):
+    """
+    Conversation histories of several repositories in one request, keyed by repo name.
+    Repo contexts, which can hold a whole repository, are only included on request.
+    """
+    repo_names = request.get('repo_names') or []
+    include_context = bool(request.get('include_context', False))
+    try:
+        max_messages = int(request.get('max_messages', 100))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="max_messages must be an integer")
+    
+    if not isinstance(repo_names, list):
+        raise HTTPException(status_code=400, detail="repo_names must be a list")
+    if len(repo_names) > CONVERSATION_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {CONVERSATION_BATCH_LIMIT} repositories per request")
+    
+    # A bad entry fails on its own instead of failing the whole batch
+    conversations = {}
+    for repo_name in repo_names:
+        if not isinstance(repo_name, str):
+            conversations[str(repo_name)] = {"error": "Repository name must be a string"}
+            continue
+        history = conversation_manager.get_conversation_history(repo_name, max_messages=max_messages)
+        conversations[repo_name] = {"messages": history, "message_count": len(history)}
+    
+    if not include_context:
+        return {"success": True, "conversations": conversations}
+    
+    # Repo contexts are spliced in already encoded; encoding one reads file contents from SQLite
+    contexts = await run_in_threadpool(
+        lambda: {name: _encoded_repo_context(name) for name, entry in conversations.items() if "error" not in entry}
+    )
+    encoded = {
+        name: _with_encoded_fields(_encode_response(entry), {"repo_context": contexts[name]} if name in contexts else {})
+        for name, entry in conversations.items()
+    }
+    body = _with_encoded_fields(_encode_response({"success": True}), {
+        "conversations": _with_encoded_fields(b'{}', encoded)
+    })
+    return Response(content=body, media_type="application/json")
+
+
 @app.get("/api/conversations/{repo_name}")
+@safe_endpoint
 async def get_conversation_history(repo_name: str):
     """Get conversation history for a specific repository"""
-    try:
+    def build():
         history = conversation_manager.get_conversation_history(repo_name, max_messages=100)
-        repo_context = conversation_manager.get_repo_context(repo_name)
         
         return {
             "success": True,
             "repo_name": repo_name,
             "messages": history,
-            "repo_context": repo_context,
             "message_count": len(history)
         }
-    except Exception as e:
-        logger.error(f"Error getting conversation history: {e}")
-        return {"error": str(e)}
+    
+    return await _conversation_response("history", repo_name, build)
 
 
 @app.post("/api/conversations/{repo_name}/switch")
+@safe_endpoint
 async def switch_conversation(repo_name: str):
     """Switch to a specific repository conversation"""
-    try:
-        # Check if conversation exists
-        if repo_name not in conversation_manager.conversations:
-            # Try to find the repository in knowledge base
-            if knowledge_base.has_repository(repo_name):
-                repo_knowledge = knowledge_base.get_repository_knowledge(repo_name)
-                conversation_manager.start_conversation(repo_name, {
-                    'repo_name': repo_name,
-                    'knowledge': repo_knowledge
-                })
-            else:
-                return {"error": f"Repository {repo_name} not found"}
-        
+    # Check if conversation exists
+    if conversation_manager.conversations.get(repo_name) is None:
+        # Try to find the repository in knowledge base; empty when it isn't stored
+        repo_knowledge = await run_in_threadpool(knowledge_base.get_repository_knowledge, repo_name)
+        if not repo_knowledge:
+            raise RepositoryNotFound(f"Repository {repo_name} not found")
+        conversation_manager.start_conversation(repo_name, {
+            'repo_name': repo_name,
+            'knowledge': repo_knowledge
+        })
+    
+    def build():
         history = conversation_manager.get_conversation_history(repo_name, max_messages=100)
-        repo_context = conversation_manager.get_repo_context(repo_name)
         
         return {
             "success": True,
             "repo_name": repo_name,
             "messages": history,
-            "repo_context": repo_context,
             "message": f"Switched to {repo_name} conversation"
         }
-    except Exception as e:
-        logger.error(f"Error switching conversation: {e}")
-        return {"error": str(e)}
+    
+    return await _conversation_response("switch", repo_name, build)
 
 
 if __name__ == "__main__":
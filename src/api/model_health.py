@@ -20,9 +20,9 @@ async def get_model_health() -> Dict[str, Any]:
         available_models = []
         for model_info in client.models:
             available_models.append({
-                'name': model_info['name'],
-                'type': model_info['type'],
-                'healthy': client.error_handler.is_model_healthy(model_info['name'])
+                'name': model_info.name,
+                'type': model_info.type,
+                'healthy': client.error_handler.is_model_healthy(model_info.name)
             })
         
         # Get error summary
@@ -57,8 +57,7 @@ async def clear_model_errors() -> Dict[str, Any]:
         from src.ai.multi_model_client import MultiModelClient
         
         client = MultiModelClient()
-        client.error_handler.error_count.clear()
-        client.error_handler.last_errors.clear()
+        client.error_handler.clear()
         
         return {
             'success': True,
@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 import zipfile
 import re
 import requests
@@ -11,6 +13,20 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Common source file suffixes, always ingested
+SOURCE_FILE_EXTENSIONS = (
+    '.js', '.jsx', '.ts', '.tsx', '.vue', '.svelte',
+    '.py', '.pyx', '.pyi',
+    '.java', '.scala', '.kotlin', '.groovy',
+    '.cpp', '.c', '.h', '.hpp', '.cc', '.cxx',
+    '.cs', '.vb', '.fs',
+    '.go', '.rs', '.swift', '.dart',
+    '.php', '.rb', '.pl', '.pm',
+    '.html', '.htm', '.css', '.scss', '.sass', '.less',
+    '.sql', '.graphql', '.gql',
+    '.sh', '.bash', '.zsh', '.fish', '.ps1', '.bat', '.cmd'
+)
+
 
 class RepoHandler:
     def __init__(self, github_token: str = None):
@@ -72,14 +88,15 @@ class RepoHandler:
     
     def process_repo_zip(self, zip_path: str) -> Dict:
         """Process uploaded repository zip file"""
-        import os
-        import shutil
-        
-        # Clean up any existing temp directory
-        temp_dir = './temp_repo'
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        
+        # Extract into a fresh directory per call so concurrent uploads don't collide
+        temp_dir = tempfile.mkdtemp(prefix='temp_repo_')
+        try:
+            return self._process_extracted_zip(zip_path, temp_dir)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def _process_extracted_zip(self, zip_path: str, temp_dir: str) -> Dict:
+        """Extract zip_path into temp_dir and analyze the repository inside it"""
         print(f"Extracting ZIP file: {zip_path}")
         
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
@@ -117,10 +134,6 @@ class RepoHandler:
                     relative_path = os.path.relpath(file_path, actual_repo_path)
                     print(f"  {relative_path}")
         
-        # Cleanup
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        
         return structure
     
     def _analyze_structure(self, path: str) -> Dict:
@@ -184,7 +197,9 @@ class RepoHandler:
             'schema.prisma', 'schema.graphql', '.env.schema'
         }
         
-        all_extensions = code_extensions + config_extensions + doc_extensions + web_extensions + data_extensions + build_extensions
+        # Lowercased once, so each file is matched with a single endswith call
+        all_extensions = tuple(ext.lower() for ext in
+                               code_extensions + config_extensions + doc_extensions + web_extensions + data_extensions + build_extensions)
         
         for root, dirs, files in os.walk(path):
             # Skip common directories that shouldn't be analyzed
@@ -202,8 +217,7 @@ class RepoHandler:
                 file_lower = file.lower()
                 
                 # Include file if it matches extensions or is an important file
-                file_extension_match = any(file.lower().endswith(ext.lower())
-                                          for ext in all_extensions)
+                file_extension_match = file_lower.endswith(all_extensions)
                 important_file_match = file_lower in important_files
                 env_file_match = file.startswith('.env')
                 docker_file_match = 'dockerfile' in file_lower
@@ -211,18 +225,7 @@ class RepoHandler:
                 requirements_match = 'requirements' in file_lower
                 
                 # Additional checks for common file patterns
-                is_source_file = any(file_lower.endswith(ext) for ext in [
-                    '.js', '.jsx', '.ts', '.tsx', '.vue', '.svelte',
-                    '.py', '.pyx', '.pyi',
-                    '.java', '.scala', '.kotlin', '.groovy',
-                    '.cpp', '.c', '.h', '.hpp', '.cc', '.cxx',
-                    '.cs', '.vb', '.fs',
-                    '.go', '.rs', '.swift', '.dart',
-                    '.php', '.rb', '.pl', '.pm',
-                    '.html', '.htm', '.css', '.scss', '.sass', '.less',
-                    '.sql', '.graphql', '.gql',
-                    '.sh', '.bash', '.zsh', '.fish', '.ps1', '.bat', '.cmd'
-                ])
+                is_source_file = file_lower.endswith(SOURCE_FILE_EXTENSIONS)
                 
                 should_include = (
                     file_extension_match or 
@@ -320,15 +323,16 @@ class RepoHandler:
             'schema.prisma', 'schema.graphql', '.env.schema'
         }
         
-        all_extensions = code_extensions + config_extensions + doc_extensions + web_extensions + data_extensions + build_extensions
+        # Lowercased once, so each file is matched with a single endswith call
+        all_extensions = tuple(ext.lower() for ext in
+                               code_extensions + config_extensions + doc_extensions + web_extensions + data_extensions + build_extensions)
         
         def process_item(item):
             if item.type == "file":
                 file_lower = item.name.lower()
                 
                 # Include file if it matches extensions or is an important file
-                file_extension_match = any(item.name.lower().endswith(ext.lower())
-                                          for ext in all_extensions)
+                file_extension_match = file_lower.endswith(all_extensions)
                 important_file_match = file_lower in important_files
                 env_file_match = item.name.startswith('.env')
                 docker_file_match = 'dockerfile' in file_lower
@@ -336,18 +340,7 @@ class RepoHandler:
                 requirements_match = 'requirements' in file_lower
                 
                 # Additional checks for common source files
-                is_source_file = any(file_lower.endswith(ext) for ext in [
-                    '.js', '.jsx', '.ts', '.tsx', '.vue', '.svelte',
-                    '.py', '.pyx', '.pyi',
-                    '.java', '.scala', '.kotlin', '.groovy',
-                    '.cpp', '.c', '.h', '.hpp', '.cc', '.cxx',
-                    '.cs', '.vb', '.fs',
-                    '.go', '.rs', '.swift', '.dart',
-                    '.php', '.rb', '.pl', '.pm',
-                    '.html', '.htm', '.css', '.scss', '.sass', '.less',
-                    '.sql', '.graphql', '.gql',
-                    '.sh', '.bash', '.zsh', '.fish', '.ps1', '.bat', '.cmd'
-                ])
+                is_source_file = file_lower.endswith(SOURCE_FILE_EXTENSIONS)
                 
                 should_include = (
                     file_extension_match or
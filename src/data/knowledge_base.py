@@ -1,18 +1,297 @@
 import sqlite3
+import io
 import json
-from typing import Dict
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import ItemsView, Mapping
+from contextlib import contextmanager
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
 import hashlib
 
+import orjson
+
+from ..utils.embeddings import embed_texts
+from ..utils.token_budget import count_tokens, truncate_to_tokens
+
+# Files quoted in prompts: these extensions, plus any path
+# containing one of the well-known config file names
+PROMPT_FILE_EXTENSIONS = frozenset(('.js', '.ts', '.jsx', '.tsx', '.py', '.java', '.go', '.rs', '.php', '.rb', '.json', '.yaml', '.yml', '.toml', '.md', '.txt', '.html', '.css', '.scss', '.sql'))
+PROMPT_CONFIG_FILES = ('package.json', 'requirements.txt', 'cargo.toml', 'go.mod', 'pom.xml', 'build.gradle', 'tsconfig.json', 'dockerfile', 'docker-compose.yml', '.env.example', 'readme.md', 'license', 'makefile')
+_PROMPT_CONFIG_RE = re.compile("|".join(map(re.escape, PROMPT_CONFIG_FILES)))
+# Words of a question matched against file paths and contents when picking files
+_QUESTION_TERM_RE = re.compile(r"[a-z0-9_]{3,}")
+PROMPT_TREE_FILES = 200
+PROMPT_EXCERPT_CHARS = 1500
+# Most excerpts one repository can contribute to a multi-repository prompt
+MAX_PROMPT_EXCERPTS = 20
+# Tokens quoted from each file in single-repository prompts
+PROMPT_FILE_TOKENS = 500
+# Token budget for the file tree and file contents of a single-repository prompt
+MAX_PROMPT_TOKENS = 24000
+# Bump when build_prompt_fragments changes, so stored fragments are rebuilt
+PROMPT_FRAGMENTS_VERSION = 3
+
+# Latest repositories whose summaries are kept in the organization context
+ORG_SUMMARY_REPOS = 5
+
+# Repositories whose decoded prompt fragments are kept in memory
+FRAGMENT_MEMO_SIZE = 16
+
+# Repositories whose decoded knowledge (file structure, analysis) is kept in memory
+KNOWLEDGE_MEMO_SIZE = 32
+
+# Seconds a write waits on another worker process's lock before failing
+SQLITE_BUSY_TIMEOUT = 30.0
+
+# Page cache per pooled connection, in KiB; one connection is open per worker thread
+SQLITE_CACHE_KIB = 16384
+
+# Paths per IN (...) query, below SQLite's default bound-parameter limit
+FETCH_BATCH_SIZE = 500
+
+# Leading characters of a file embedded with its path; MiniLM reads ~256 tokens
+FILE_EMBED_CHARS = 1000
+# Files embedded per read/update round trip at ingest
+FILE_EMBED_ROWS = 256
+# Files ranked by embedding similarity for each question
+RANKED_FILES = 20
+
+
+def quote_identifier(name: str) -> str:
+    """SQL identifier quoted so any table or column name is taken literally"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def is_prompt_file(path: str) -> bool:
+    """Whether a file is worth quoting in a prompt, by extension or config file name"""
+    path_lower = path.lower()
+    _, dot, ext = path_lower.rpartition('.')
+    return (bool(dot) and '.' + ext in PROMPT_FILE_EXTENSIONS) or _PROMPT_CONFIG_RE.search(path_lower) is not None
+
+
+def _file_section(file_path: str, file_type: str, full_content: str) -> List:
+    """[path, section text, tokens] for one prompt-worthy file, cut to PROMPT_FILE_TOKENS"""
+    content, tokens = truncate_to_tokens(full_content, PROMPT_FILE_TOKENS)
+    section = f"\n--- {file_path} ({file_type}) ---\n{content}"
+    if len(content) < len(full_content):
+        section += "\n... (content truncated)"
+    return [file_path, section + "\n", tokens]
+
+
+def select_files_context(fragments: Dict, question: str, max_tokens: int = MAX_PROMPT_TOKENS,
+                         ranked_paths: List[str] = ()) -> str:
+    """
+    File tree plus the file sections most relevant to the question, filled
+    greedily until max_tokens. ranked_paths (most similar first, from
+    KnowledgeBase.rank_files) come first; the rest are ordered by question
+    terms, path hits above content hits, ties keeping the stored order.
+    """
+    terms = set(_QUESTION_TERM_RE.findall(question.lower()))
+    ranks = {path: rank for rank, path in enumerate(ranked_paths)}
+    
+    def relevance(section):
+        path, text = section[0].lower(), section[1].lower()
+        return (ranks.get(section[0], len(ranks)),
+                -sum(3 if term in path else 1 if term in text else 0 for term in terms))
+    
+    files_buffer = io.StringIO()
+    files_buffer.writelines((fragments['files_tree'], "\n**File Contents:**\n"))
+    budget = max_tokens - fragments['files_tree_tokens']
+    for _, section, tokens in sorted(fragments['file_sections'], key=relevance):
+        if tokens <= budget:
+            files_buffer.write(section)
+            budget -= tokens
+    return files_buffer.getvalue()
+
+
+def build_prompt_fragments(file_structure: List[str], file_contents: Dict) -> Dict:
+    """
+    Prompt pieces that depend only on a stored repository: its file tree and
+    important-file excerpts, and the complete tree and token-capped file sections
+    for single-repository prompts
+    """
+    # One pass over the files builds both the excerpts and the token-capped sections
+    excerpts = []
+    file_sections = []
+    for fpath, finfo in file_contents.items():
+        if is_prompt_file(fpath):
+            content = finfo.get('content', '')
+            ftype = finfo.get('type', 'unknown')
+            if len(excerpts) < MAX_PROMPT_EXCERPTS:
+                excerpts.append(f"\n--- {fpath} ({ftype}) ---\n{content[:PROMPT_EXCERPT_CHARS]}")
+            file_sections.append(_file_section(fpath, ftype, content))
+    
+    # One sort serves both trees: its head for multi-repository prompts, all of it
+    # for single-repository prompts, where file sections are picked per question
+    paths_sorted = sorted(file_structure)
+    tree = io.StringIO()
+    tree.write("**File Tree:**")
+    tree.writelines(f"\n- {p}" for p in islice(paths_sorted, PROMPT_TREE_FILES))
+    
+    files_tree = io.StringIO()
+    files_tree.write("**COMPLETE FILE STRUCTURE AND CONTENTS:**\n\n**File Tree:**\n")
+    files_tree.writelines(f"- {file_path}\n" for file_path in paths_sorted)
+    files_tree = files_tree.getvalue()
+    return {
+        'version': PROMPT_FRAGMENTS_VERSION,
+        'file_tree': tree.getvalue(),
+        'excerpts': excerpts,
+        'files_tree': files_tree,
+        'files_tree_tokens': count_tokens(files_tree),
+        'file_sections': file_sections
+    }
+
+
+class _PooledConnection(sqlite3.Connection):
+    """Connection kept open for reuse; close() only discards uncommitted changes"""
+
+    def close(self):
+        self.rollback()
+
+
+def _file_info(file_type: str, size: int, content: str) -> Dict:
+    """File entry in the shape repository handlers produce"""
+    return {'content': content, 'type': file_type, 'size': size}
+
+
+class _RepositoryFileItems(ItemsView):
+    """(path, file info) pairs read with a single query instead of one per file"""
+
+    def __iter__(self):
+        files = self._mapping
+        with files._knowledge_base.connection() as conn:
+            rows = conn.execute('''
+                SELECT path, type, size, content FROM repo_files WHERE repo_name = ? ORDER BY id
+            ''', (files.repo_name,))
+            for path, file_type, size, content in rows:
+                yield path, _file_info(file_type, size, content)
+
+
+class RepositoryFiles(Mapping):
+    """
+    Read-only view of one repository's stored files, keyed by path. Only the
+    paths are held in memory; contents are read from SQLite when accessed.
+    """
+
+    def __init__(self, knowledge_base: 'KnowledgeBase', repo_name: str, paths: List[str]):
+        self._knowledge_base = knowledge_base
+        self.repo_name = repo_name
+        self._paths = dict.fromkeys(paths)
+
+    def __getitem__(self, path: str) -> Dict:
+        if path not in self._paths:
+            raise KeyError(path)
+        with self._knowledge_base.connection() as conn:
+            row = conn.execute('''
+                SELECT type, size, content FROM repo_files WHERE repo_name = ? AND path = ?
+            ''', (self.repo_name, path)).fetchone()
+        if row is None:
+            raise KeyError(path)
+        return _file_info(*row)
+
+    def __contains__(self, path) -> bool:
+        return path in self._paths
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def items(self) -> _RepositoryFileItems:
+        return _RepositoryFileItems(self)
+
+    def metadata(self) -> Dict[str, Tuple[str, int]]:
+        """(type, size) of every file in one query, reading content only where no size was recorded"""
+        with self._knowledge_base.connection() as conn:
+            rows = conn.execute('''
+                SELECT path, type, COALESCE(size, length(content)) FROM repo_files WHERE repo_name = ? ORDER BY id
+            ''', (self.repo_name,))
+            return {path: (file_type or 'unknown', size or 0) for path, file_type, size in rows}
+
+    def fetch(self, paths) -> Dict[str, Dict]:
+        """Contents of the given paths, bulk-read in batches; unknown paths are skipped"""
+        wanted = [path for path in paths if path in self._paths]
+        files = {}
+        with self._knowledge_base.connection() as conn:
+            for start in range(0, len(wanted), FETCH_BATCH_SIZE):
+                batch = wanted[start:start + FETCH_BATCH_SIZE]
+                rows = conn.execute(f'''
+                    SELECT path, type, size, content FROM repo_files
+                    WHERE repo_name = ? AND path IN ({",".join("?" * len(batch))})
+                ''', (self.repo_name, *batch))
+                for path, file_type, size, content in rows:
+                    files[path] = _file_info(file_type, size, content)
+        # Requested order rather than row order
+        return {path: files[path] for path in wanted if path in files}
+
 
 class KnowledgeBase:
     def __init__(self, db_path: str = "knowledge_base.db"):
         self.db_path = db_path
+        # One open connection per thread, reused across calls
+        self._local = threading.local()
+        # (repositories version, organization context) built by get_org_context
+        self._org_context = None
+        self._org_context_lock = threading.Lock()
+        # (repo_name, repo_hash) -> decoded prompt fragments, oldest evicted first
+        self._fragment_memo = OrderedDict()
+        self._fragment_memo_lock = threading.Lock()
+        # (repo_name, repo_hash, generation) -> decoded repository knowledge, least recently
+        # used evicted first. Re-analyzing unchanged files keeps repo_hash but rewrites
+        # analysis, so store_repository bumps the repository's generation.
+        self._knowledge_memo = OrderedDict()
+        self._knowledge_memo_lock = threading.Lock()
+        self._knowledge_generations: Dict[str, int] = {}
+        self._knowledge_epoch = 0
+        # repo_name -> (repo_hash, paths, normalized embedding matrix) used by rank_files
+        self._file_vectors = OrderedDict()
+        self._file_vectors_lock = threading.Lock()
+        # table name -> PRAGMA table_info rows, read by table_columns
+        self._table_columns = {}
         self.init_database()
         self.migrate_database()
     
+    def connect(self) -> sqlite3.Connection:
+        """
+        This thread's connection to the database, opened on first use. WAL mode
+        lets worker processes read while another one writes.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT, factory=_PooledConnection)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # WAL only needs syncing at checkpoints to stay consistent after a crash
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_KIB}')
+            self._local.conn = conn
+        elif conn.in_transaction:
+            # Left open by a call that raised before committing
+            conn.rollback()
+        return conn
+    
+    def open_reader(self) -> sqlite3.Connection:
+        """
+        A separate read-only connection usable from any thread, for long reads
+        such as streamed exports. The caller closes it.
+        """
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True,
+                               timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+    
+    @contextmanager
+    def connection(self):
+        """This thread's connection, discarding uncommitted changes when the block exits"""
+        conn = self.connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
     def migrate_database(self):
         """Migrate database schema to include file_contents if needed"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         # Check if repositories table exists first
@@ -38,12 +317,32 @@ class KnowledgeBase:
             cursor.execute('ALTER TABLE repositories ADD COLUMN file_structure TEXT')
             print("Database migration completed.")
         
+        if 'prompt_fragments' not in columns:
+            # Filled in lazily by get_prompt_fragments for existing rows
+            cursor.execute('ALTER TABLE repositories ADD COLUMN prompt_fragments TEXT')
+        
+        cursor.execute("PRAGMA table_info(repo_files)")
+        if 'embedding' not in [column[1] for column in cursor.fetchall()]:
+            # Filled in by embed_repository_files
+            cursor.execute('ALTER TABLE repo_files ADD COLUMN embedding BLOB')
+        
+        # File contents used to be one JSON blob per repository; move them into repo_files
+        cursor.execute("SELECT repo_name FROM repositories WHERE file_contents IS NOT NULL")
+        legacy_repos = [row[0] for row in cursor.fetchall()]
+        if legacy_repos:
+            print(f"Migrating file contents of {len(legacy_repos)} repositories to repo_files...")
+            for repo_name in legacy_repos:
+                cursor.execute("SELECT file_contents FROM repositories WHERE repo_name = ?", (repo_name,))
+                self._write_files(cursor, repo_name, json.loads(cursor.fetchone()[0] or '{}'))
+                cursor.execute("UPDATE repositories SET file_contents = NULL WHERE repo_name = ?", (repo_name,))
+            print("Database migration completed.")
+        
         conn.commit()
         conn.close()
 
     def init_database(self):
         """Initialize SQLite database for knowledge storage"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -55,10 +354,24 @@ class KnowledgeBase:
                 file_contents TEXT,
                 analysis TEXT,
                 mermaid_diagram TEXT,
+                prompt_fragments TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
         
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS repo_files (
+                id INTEGER PRIMARY KEY,
+                repo_name TEXT,
+                path TEXT,
+                type TEXT,
+                size INTEGER,
+                content TEXT,
+                embedding BLOB,
+                UNIQUE (repo_name, path)
+            )
+        ''')
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS features (
                 id INTEGER PRIMARY KEY,
@@ -69,6 +382,7 @@ class KnowledgeBase:
                 FOREIGN KEY (repo_id) REFERENCES repositories (id)
             )
         ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_features_repo_id ON features (repo_id)')
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS chat_history (
@@ -82,13 +396,16 @@ class KnowledgeBase:
                 metadata TEXT
             )
         ''')
+        # Serve a conversation's newest messages, and its count, from the index
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_repo ON chat_history (repo_name, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_session ON chat_history (repo_name, session_id, id)')
         
         conn.commit()
         conn.close()
     
     def store_repository(self, repo_name: str, repo_data: Dict, analysis: Dict, mermaid: str):
         """Store repository analysis with full file contents in knowledge base"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         repo_hash = hashlib.md5(
@@ -98,57 +415,271 @@ class KnowledgeBase:
         # Extract file structure (paths only) and file contents separately
         file_structure = list(repo_data.keys())
         file_contents = repo_data
+        prompt_fragments = build_prompt_fragments(file_structure, file_contents)
         
+        # File contents go to repo_files, one row per file, so readers load only what they need
         cursor.execute('''
             INSERT OR REPLACE INTO repositories 
-            (repo_name, repo_hash, file_structure, file_contents, analysis, mermaid_diagram)
-            VALUES (?, ?, ?, ?, ?, ?)
+            (repo_name, repo_hash, file_structure, file_contents, analysis, mermaid_diagram, prompt_fragments)
+            VALUES (?, ?, ?, NULL, ?, ?, ?)
         ''', (repo_name, repo_hash, json.dumps(file_structure), 
-              json.dumps(file_contents), json.dumps(analysis), mermaid))
+              json.dumps(analysis), mermaid, json.dumps(prompt_fragments)))
+        self._write_files(cursor, repo_name, file_contents)
         
         conn.commit()
         conn.close()
+        self.forget_knowledge(repo_name)
+    
+    def forget_knowledge(self, repo_name: Optional[str] = None) -> None:
+        """
+        Drop memoized knowledge of a repository, or of all of them, including any
+        read in flight before the write
+        """
+        with self._knowledge_memo_lock:
+            if repo_name is None:
+                self._knowledge_epoch += 1
+                self._knowledge_memo.clear()
+                return
+            self._knowledge_generations[repo_name] = self._knowledge_generations.get(repo_name, 0) + 1
+            for key in [key for key in self._knowledge_memo if key[0] == repo_name]:
+                del self._knowledge_memo[key]
+    
+    def _knowledge_generation(self, repo_name: str) -> Tuple[int, int]:
+        """Changes whenever forget_knowledge drops the repository; call holding _knowledge_memo_lock"""
+        return self._knowledge_epoch, self._knowledge_generations.get(repo_name, 0)
+    
+    @staticmethod
+    def _write_files(cursor: sqlite3.Cursor, repo_name: str, file_contents: Dict) -> None:
+        """Replace a repository's rows in repo_files"""
+        cursor.execute("DELETE FROM repo_files WHERE repo_name = ?", (repo_name,))
+        cursor.executemany('''
+            INSERT OR REPLACE INTO repo_files (repo_name, path, type, size, content) VALUES (?, ?, ?, ?, ?)
+        ''', (
+            (repo_name, path, info.get('type', 'unknown'), info.get('size', len(info.get('content', ''))), info.get('content', ''))
+            for path, info in file_contents.items()
+        ))
+    
+    def embed_repository_files(self, repo_name: str) -> int:
+        """
+        Store a normalized embedding of each of a repository's files that has none
+        yet, from its path and leading content. Returns how many were embedded;
+        0 when no embedding model is available.
+        """
+        conn = self.connect()
+        cursor = conn.cursor()
+        embedded = 0
+        last_id = 0
+        while True:
+            cursor.execute('''
+                SELECT id, path, substr(content, 1, ?) FROM repo_files
+                WHERE repo_name = ? AND embedding IS NULL AND id > ? ORDER BY id LIMIT ?
+            ''', (FILE_EMBED_CHARS, repo_name, last_id, FILE_EMBED_ROWS))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            vectors = embed_texts([f"{path}\n{content}" for _, path, content in rows])
+            if vectors is None:
+                break
+            cursor.executemany('UPDATE repo_files SET embedding = ? WHERE id = ?',
+                               ((vector.tobytes(), row[0]) for row, vector in zip(rows, vectors)))
+            conn.commit()
+            embedded += len(rows)
+            last_id = rows[-1][0]
+        conn.close()
+        
+        with self._file_vectors_lock:
+            self._file_vectors.pop(repo_name, None)
+        return embedded
+    
+    def rank_files(self, repo_name: str, question: str, limit: int = RANKED_FILES) -> List[str]:
+        """
+        Paths of the repository's files most similar to the question, best first.
+        Empty when the files have no embeddings or no embedding model is available.
+        """
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT repo_hash FROM repositories WHERE repo_name = ?", (repo_name,))
+        row = cursor.fetchone()
+        if row is None:
+            conn.close()
+            return []
+        
+        with self._file_vectors_lock:
+            memo = self._file_vectors.get(repo_name)
+        if memo is None or memo[0] != row[0]:
+            cursor.execute('''
+                SELECT path, embedding FROM repo_files
+                WHERE repo_name = ? AND embedding IS NOT NULL ORDER BY id
+            ''', (repo_name,))
+            rows = cursor.fetchall()
+            paths = [path for path, _ in rows]
+            matrix = None
+            if rows:
+                # Embeddings only exist when sentence-transformers, and so numpy, is installed
+                import numpy as np
+                matrix = np.vstack([np.frombuffer(blob, dtype='float32') for _, blob in rows])
+            memo = (row[0], paths, matrix)
+            with self._file_vectors_lock:
+                self._file_vectors[repo_name] = memo
+                while len(self._file_vectors) > FRAGMENT_MEMO_SIZE:
+                    self._file_vectors.popitem(last=False)
+        conn.close()
+        
+        _, paths, matrix = memo
+        if matrix is None:
+            return []
+        query = embed_texts([question])
+        if query is None:
+            return []
+        scores = matrix @ query[0]
+        top = scores.argsort()[::-1][:limit]
+        return [paths[i] for i in top]
     
     def get_repository_knowledge(self, repo_name: str) -> Dict:
-        """Retrieve full repository knowledge including file contents"""
-        conn = sqlite3.connect(self.db_path)
+        """
+        Retrieve repository knowledge; file_contents is a RepositoryFiles view read on access.
+        Decoded rows are kept in memory until the repository is stored again.
+        """
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        # Generation is taken before reading, so a row read just before a store is never kept under the new one
+        with self._knowledge_memo_lock:
+            generation = self._knowledge_generation(repo_name)
+        cursor.execute("SELECT repo_hash FROM repositories WHERE repo_name = ?", (repo_name,))
+        row = cursor.fetchone()
+        if not row:
+            conn.close()
+            return {}
+        
+        memo_key = (repo_name, row[0], generation)
+        with self._knowledge_memo_lock:
+            knowledge = self._knowledge_memo.get(memo_key)
+            if knowledge is not None:
+                self._knowledge_memo.move_to_end(memo_key)
+        
+        if knowledge is None:
+            cursor.execute('''
+                SELECT file_structure, analysis, mermaid_diagram 
+                FROM repositories 
+                WHERE repo_name = ?
+            ''', (repo_name,))
+            result = cursor.fetchone()
+            
+            file_structure = orjson.loads(result[0])
+            knowledge = {
+                'file_structure': file_structure,
+                'file_contents': RepositoryFiles(self, repo_name, file_structure),
+                'analysis': orjson.loads(result[1]),
+                'mermaid_diagram': result[2]
+            }
+            with self._knowledge_memo_lock:
+                if generation == self._knowledge_generation(repo_name):
+                    self._knowledge_memo[memo_key] = knowledge
+                while len(self._knowledge_memo) > KNOWLEDGE_MEMO_SIZE:
+                    self._knowledge_memo.popitem(last=False)
+        conn.close()
+        
+        # Each caller gets its own top-level dict; the decoded values are shared
+        return dict(knowledge)
+    
+    def get_prompt_fragments(self, repo_name: str) -> Dict:
+        """
+        Precomputed prompt fragments (file_tree, excerpts, files_tree, file_sections) plus the
+        analysis and mermaid_diagram, without loading the repository's file contents.
+        Fragments stored by an older build_prompt_fragments are rebuilt on first use.
+        """
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT file_structure, file_contents, analysis, mermaid_diagram 
-            FROM repositories 
-            WHERE repo_name = ?
+            SELECT repo_hash, analysis, mermaid_diagram FROM repositories WHERE repo_name = ?
         ''', (repo_name,))
-        
         result = cursor.fetchone()
+        if not result:
+            conn.close()
+            return {}
+        
+        # Fragments depend only on the file contents, which repo_hash identifies
+        memo_key = (repo_name, result[0])
+        with self._fragment_memo_lock:
+            fragments = self._fragment_memo.get(memo_key)
+        
+        if fragments is None:
+            cursor.execute('''
+                SELECT prompt_fragments FROM repositories WHERE repo_name = ?
+            ''', (repo_name,))
+            stored = cursor.fetchone()[0]
+            fragments = orjson.loads(stored) if stored else {}
+            if fragments.get('version') != PROMPT_FRAGMENTS_VERSION:
+                cursor.execute('''
+                    SELECT file_structure FROM repositories WHERE repo_name = ?
+                ''', (repo_name,))
+                file_structure = json.loads(cursor.fetchone()[0] or '[]')
+                fragments = build_prompt_fragments(file_structure, RepositoryFiles(self, repo_name, file_structure))
+                cursor.execute('''
+                    UPDATE repositories SET prompt_fragments = ? WHERE repo_name = ?
+                ''', (json.dumps(fragments), repo_name))
+                conn.commit()
+            
+            with self._fragment_memo_lock:
+                self._fragment_memo[memo_key] = fragments
+                while len(self._fragment_memo) > FRAGMENT_MEMO_SIZE:
+                    self._fragment_memo.popitem(last=False)
         conn.close()
         
-        if result:
-            return {
-                'file_structure': json.loads(result[0]),
-                'file_contents': json.loads(result[1]),
-                'analysis': json.loads(result[2]),
-                'mermaid_diagram': result[3]
-            }
-        return {}
-    
+        return {
+            **fragments,
+            'analysis': orjson.loads(result[1]),
+            'mermaid_diagram': result[2]
+        }
+
     def has_repository(self, repo_name: str) -> bool:
         """Check if repository exists in knowledge base"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
+        # One probe of the repo_name unique index
         cursor.execute('''
-            SELECT COUNT(*) FROM repositories WHERE repo_name = ?
+            SELECT 1 FROM repositories WHERE repo_name = ? LIMIT 1
         ''', (repo_name,))
         
+        found = cursor.fetchone() is not None
+        conn.close()
+        
+        return found
+
+    def count_repositories(self) -> int:
+        """Number of repositories in the knowledge base"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT COUNT(*) FROM repositories")
         count = cursor.fetchone()[0]
         conn.close()
         
-        return count > 0
+        return count
+
+    def get_repository_hashes(self, repo_names: List[str]) -> Dict[str, str]:
+        """Content hash of each stored repository, changing whenever it is re-analyzed"""
+        if not repo_names:
+            return {}
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        placeholders = ','.join('?' * len(repo_names))
+        cursor.execute(f'''
+            SELECT repo_name, repo_hash FROM repositories WHERE repo_name IN ({placeholders})
+        ''', list(repo_names))
+        
+        hashes = dict(cursor.fetchall())
+        conn.close()
+        
+        return hashes
 
     def list_repositories(self):
         """List all repositories in the knowledge base"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -161,11 +692,11 @@ class KnowledgeBase:
     
     def get_all_repositories_knowledge(self) -> Dict:
         """Get knowledge from ALL repositories for cross-repo analysis"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT repo_name, file_structure, file_contents, analysis, mermaid_diagram 
+            SELECT repo_name, file_structure, analysis, mermaid_diagram 
             FROM repositories 
             ORDER BY created_at DESC
         ''')
@@ -176,19 +707,22 @@ class KnowledgeBase:
         all_repos = {}
         for result in results:
             repo_name = result[0]
+            file_structure = orjson.loads(result[1])
             all_repos[repo_name] = {
-                'file_structure': json.loads(result[1]),
-                'file_contents': json.loads(result[2]),
-                'analysis': json.loads(result[3]),
-                'mermaid_diagram': result[4]
+                'file_structure': file_structure,
+                'file_contents': RepositoryFiles(self, repo_name, file_structure),
+                'analysis': orjson.loads(result[2]),
+                'mermaid_diagram': result[3]
             }
         
         return all_repos
 
     def get_organization_patterns(self) -> Dict:
         """Analyze patterns across all repositories in the organization"""
-        all_repos = self.get_all_repositories_knowledge()
-        
+        return self._organization_patterns(self.get_all_repositories_knowledge())
+    
+    @staticmethod
+    def _organization_patterns(all_repos: Dict) -> Dict:
         patterns = {
             'languages': {},
             'frameworks': {},
@@ -216,9 +750,69 @@ class KnowledgeBase:
         
         return patterns
     
+    def table_columns(self, table_name: str):
+        """
+        PRAGMA table_info rows of a table, or None if there is no such table.
+        Read once; an unknown name re-reads sqlite_master in case it was created since.
+        """
+        columns = self._table_columns.get(table_name)
+        if columns is None:
+            conn = self.connect()
+            names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+            self._table_columns = {
+                name: conn.execute(f"PRAGMA table_info({quote_identifier(name)})").fetchall() for name in names
+            }
+            conn.close()
+            columns = self._table_columns.get(table_name)
+        return columns
+    
+    def _repositories_version(self) -> tuple:
+        """Row ids and content hashes of all repositories, changing on every store"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, repo_hash FROM repositories ORDER BY id")
+        version = tuple(cursor.fetchall())
+        conn.close()
+        return version
+    
+    def get_org_context(self) -> Dict:
+        """
+        Organization-wide prompt context: repository count, preformatted pattern
+        lines and the latest repositories' summaries. Rebuilt only when the
+        repositories table changes, including stores by other worker processes.
+        """
+        version = self._repositories_version()
+        cached = self._org_context
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
+        with self._org_context_lock:
+            cached = self._org_context
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            
+            all_repos = self.get_all_repositories_knowledge()
+            patterns = self._organization_patterns(all_repos)
+            pattern_lines = "\n".join([
+                f"- Common Languages: {', '.join(f'{lang} ({count} repos)' for lang, count in islice(patterns['languages'].items(), 5))}",
+                f"- Common Frameworks: {', '.join(f'{fw} ({count} repos)' for fw, count in islice(patterns['frameworks'].items(), 5))}",
+                f"- File Extensions Used: {', '.join(f'.{ext} ({count} files)' for ext, count in islice(patterns['file_patterns'].items(), 10))}",
+            ])
+            context = {
+                'repo_count': len(all_repos),
+                'pattern_lines': pattern_lines,
+                # (name, summary excerpt), newest first
+                'summaries': [
+                    (name, data['analysis'].get('architecture_summary', 'No summary')[:100])
+                    for name, data in islice(all_repos.items(), ORG_SUMMARY_REPOS)
+                ]
+            }
+            self._org_context = (version, context)
+            return context
+    
     def store_chat_message(self, repo_name: str, session_id: str, message_id: str, role: str, content: str, metadata: Dict = None):
         """Store a chat message in the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -230,28 +824,38 @@ class KnowledgeBase:
         conn.commit()
         conn.close()
     
-    def get_chat_history(self, repo_name: str, session_id: str = None):
-        """Retrieve chat history for a repository"""
-        conn = sqlite3.connect(self.db_path)
+    def get_chat_history(self, repo_name: str, session_id: str = None, limit: Optional[int] = None):
+        """
+        Retrieve chat history for a repository, oldest first. With limit only the
+        newest limit messages are read, walking the index backwards from the end.
+        """
+        conn = self.connect()
         cursor = conn.cursor()
         
-        if session_id:
-            cursor.execute('''
+        where = 'repo_name = ? AND session_id = ?' if session_id else 'repo_name = ?'
+        params = (repo_name, session_id) if session_id else (repo_name,)
+        # Ids follow insertion order, unlike timestamps which tie within a second
+        if limit is not None:
+            cursor.execute(f'''
                 SELECT message_id, role, content, timestamp, metadata
                 FROM chat_history 
-                WHERE repo_name = ? AND session_id = ?
-                ORDER BY timestamp ASC
-            ''', (repo_name, session_id))
+                WHERE {where}
+                ORDER BY id DESC
+                LIMIT ?
+            ''', params + (limit,))
+            rows = cursor.fetchall()
+            rows.reverse()
         else:
-            cursor.execute('''
+            cursor.execute(f'''
                 SELECT message_id, role, content, timestamp, metadata
                 FROM chat_history 
-                WHERE repo_name = ?
-                ORDER BY timestamp ASC
-            ''', (repo_name,))
+                WHERE {where}
+                ORDER BY id ASC
+            ''', params)
+            rows = cursor.fetchall()
         
         messages = []
-        for row in cursor.fetchall():
+        for row in rows:
             messages.append({
                 'message_id': row[0],
                 'role': row[1],
@@ -263,9 +867,29 @@ class KnowledgeBase:
         conn.close()
         return messages
     
+    def get_chat_summary(self, repo_name: str, session_id: str = None) -> Tuple[int, Optional[str]]:
+        """Number of stored messages for a repository and the first one's timestamp"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        if session_id:
+            cursor.execute('''
+                SELECT COUNT(*), MIN(timestamp) FROM chat_history
+                WHERE repo_name = ? AND session_id = ?
+            ''', (repo_name, session_id))
+        else:
+            cursor.execute('''
+                SELECT COUNT(*), MIN(timestamp) FROM chat_history
+                WHERE repo_name = ?
+            ''', (repo_name,))
+        count, first_timestamp = cursor.fetchone()
+        
+        conn.close()
+        return count, first_timestamp
+    
     def clear_chat_history(self, repo_name: str, session_id: str = None):
         """Clear chat history for a repository"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         if session_id:
@@ -278,7 +902,7 @@ class KnowledgeBase:
     
     def get_all_chat_sessions(self, repo_name: str = None):
         """Get all chat sessions, optionally filtered by repository"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         if repo_name:
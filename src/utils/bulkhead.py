@@ -0,0 +1,35 @@
+"""
+Per-provider bulkheads so one slow provider can't starve calls to the others
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class BulkheadFull(Exception):
+    """Raised when no call slot frees up within the bulkhead's wait limit"""
+
+
+class Bulkhead:
+    """Caps concurrent calls to one provider, shedding calls that queue too long"""
+
+    __slots__ = ('name', 'max_concurrent', 'max_wait', '_semaphore')
+
+    def __init__(self, name: str, max_concurrent: int = 8, max_wait: float = 5.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait  # seconds to queue for a slot before shedding the call
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one call slot, raising BulkheadFull if none frees up in time"""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            raise BulkheadFull(
+                f"{self.name} bulkhead full ({self.max_concurrent} calls in flight)"
+            ) from None
+        try:
+            yield
+        finally:
+            self._semaphore.release()
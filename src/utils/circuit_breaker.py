@@ -0,0 +1,58 @@
+"""
+Per-provider circuit breaker so known-down models are skipped instead of timing out
+"""
+import random
+import time
+
+
+class CircuitBreaker:
+    """Three-state (closed / open / half_open) breaker for a single provider"""
+
+    __slots__ = ('failure_threshold', 'reset_after', 'jitter', 'fails', 'opened_at',
+                 'cooldown', 'probe_started', 'state')
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30.0, jitter: float = 0.2):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.jitter = jitter  # fraction of reset_after added at random to each cooldown
+        self.fails = 0
+        self.opened_at = 0.0
+        self.cooldown = reset_after
+        self.probe_started = 0.0
+        self.state = 'closed'
+
+    def allow_request(self) -> bool:
+        """
+        Return False while open. After the cooldown a single probe request is let
+        through; if it never reports back (e.g. it was cancelled) another probe is
+        allowed once the cooldown has passed again.
+        """
+        now = time.monotonic()
+        if self.state == 'open':
+            if now - self.opened_at < self.cooldown:
+                return False
+            self.state = 'half_open'
+            self.probe_started = now
+            return True
+        if self.state == 'half_open':
+            if now - self.probe_started < self.cooldown:
+                return False
+            self.probe_started = now
+        return True
+
+    def record_success(self):
+        """Close the breaker after a successful call"""
+        self.fails = 0
+        self.state = 'closed'
+
+    def record_failure(self, weight: int = 1):
+        """
+        Count a failure, opening the breaker at the threshold or on a failed probe.
+        Heavier failures (e.g. timeouts) can count for more than one.
+        """
+        self.fails += weight
+        if self.state == 'half_open' or self.fails >= self.failure_threshold:
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+            # Jittered cooldown so breakers in several workers don't all probe at once
+            self.cooldown = self.reset_after * (1 + random.uniform(0, self.jitter))
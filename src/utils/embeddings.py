@@ -0,0 +1,33 @@
+"""
+Shared sentence-transformers model loading and batched text embedding
+"""
+import functools
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Texts per model.encode batch; small enough for CPU inference
+EMBED_BATCH_SIZE = 32
+
+
+@functools.lru_cache(maxsize=None)
+def load_model(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """Load an embedding model once per process, shared by every caller using it"""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def embed_texts(texts: List[str], model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """
+    Normalized float32 embeddings of texts, one row each, so cosine similarity
+    is an inner product. None when sentence-transformers is not available.
+    """
+    try:
+        model = load_model(model_name)
+    except Exception as e:
+        logger.debug("Embedding model unavailable: %s", e)
+        return None
+    return model.encode(texts, batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True).astype('float32')
@@ -2,9 +2,13 @@
 Enhanced error handling and context management for AI model failures
 """
 import logging
+import time
 from typing import Optional, Dict, Any
 from datetime import datetime
 
+# A model counts as healthy again once it has gone this long without an error
+HEALTHY_AFTER_SECONDS = 600
+
 
 class ModelErrorHandler:
     """Handles errors and provides contextual fallbacks for AI model failures"""
@@ -12,6 +16,8 @@ class ModelErrorHandler:
     def __init__(self):
         self.error_count = {}
         self.last_errors = {}
+        # model name -> monotonic time of its last error, so health checks don't parse timestamps
+        self._last_error_at = {}
         self.logger = logging.getLogger(__name__)
     
     def record_error(self, model_name: str, error: Exception, context: Dict[str, Any] = None):
@@ -28,6 +34,7 @@ class ModelErrorHandler:
             'timestamp': datetime.now().isoformat(),
             'context': context or {}
         }
+        self._last_error_at[model_name] = time.monotonic()
         
         self.logger.warning(f"Model {model_name} error: {error}")
     
@@ -71,12 +78,14 @@ class ModelErrorHandler:
         if model_name not in self.last_errors:
             return True
         
-        last_error = self.last_errors[model_name]
-        error_time = datetime.fromisoformat(last_error['timestamp'])
-        
         # Consider model healthy if no errors in last 10 minutes
-        time_since_error = (datetime.now() - error_time).total_seconds()
-        return time_since_error > 600
+        return time.monotonic() - self._last_error_at.get(model_name, float('-inf')) > HEALTHY_AFTER_SECONDS
+    
+    def clear(self):
+        """Forget all recorded errors"""
+        self.error_count.clear()
+        self.last_errors.clear()
+        self._last_error_at.clear()
     
     def generate_contextual_fallback(self, prompt: str, failed_models: list) -> str:
         """Generate a contextual fallback response based on the prompt and failed models"""
@@ -1,16 +1,51 @@
 import hashlib
 import json
+import logging
 import os
-from typing import Dict, Optional, Any
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Tuple
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
+# Number of write locks; keys map onto them so unrelated writes don't contend
+LOCK_STRIPES = 16
+
+# Parsed entries kept in memory so repeat hits skip reading and decoding the file
+MEMORY_ENTRIES = 256
+
+# Context markers compared by _is_conversation_relevant on every cache hit
+_REPO_MARKER_RE = re.compile(r"(?:repository|repo)['\s]*[\"'`]?([a-zA-Z0-9\-_]+/[a-zA-Z0-9\-_]+)[\"'`]?")
+_USER_MARKER_RE = re.compile(r"user[_\s]*id['\s]*[\"'`]?([a-zA-Z0-9\-_]+)[\"'`]?")
+_PROJECT_MARKER_RE = re.compile(r"[\"'`]([a-zA-Z0-9\-_]{3,})[\"'`]")
+
 
 class PromptCache:
     """Simple file-based cache for AI responses to avoid redundant API calls"""
     
-    def __init__(self, cache_dir: str = "cache", ttl_hours: int = 24):
+    # Cache directories that already have a janitor thread in this process
+    _janitor_dirs = set()
+    _janitor_dirs_lock = threading.Lock()
+    
+    def __init__(self, cache_dir: str = "cache", ttl_hours: int = 24, soft_ttl_hours: Optional[float] = None):
         self.cache_dir = cache_dir
         self.ttl = timedelta(hours=ttl_hours)
+        # Entries older than soft_ttl are still served by lookup() but flagged stale
+        self.soft_ttl = timedelta(hours=soft_ttl_hours) if soft_ttl_hours is not None else self.ttl
+        # Serialize writes and removals per key stripe; reads take no lock and
+        # rely on writes being atomic renames
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # cache key -> ((mtime_ns, size), timestamp, entry); validated against the
+        # file's stat on every lookup, so writes and removals by other processes are seen.
+        # Evicted in insertion order, hits don't reorder. Every access holds
+        # _memory_lock; the stripe locks only guard file I/O.
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
         
         # Create cache directory if it doesn't exist
         os.makedirs(cache_dir, exist_ok=True)
@@ -24,39 +59,91 @@ class PromptCache:
         """Get the file path for a cache key"""
         return os.path.join(self.cache_dir, f"{cache_key}.json")
     
+    def _lock_for(self, cache_key: str) -> threading.Lock:
+        """Write lock stripe guarding a cache key"""
+        return self._locks[hash(cache_key) % LOCK_STRIPES]
+    
+    def _remove(self, cache_key: str) -> bool:
+        """Remove a cache file, returning False if it was already gone"""
+        with self._lock_for(cache_key):
+            with self._memory_lock:
+                self._memory.pop(cache_key, None)
+            try:
+                os.remove(self._get_cache_path(cache_key))
+                return True
+            except FileNotFoundError:
+                return False
+    
+    @staticmethod
+    def _file_version(cache_path: str) -> Tuple[int, int]:
+        """Modification time and size identifying one write of a cache file"""
+        stat = os.stat(cache_path)
+        return stat.st_mtime_ns, stat.st_size
+    
+    def _remember(self, cache_key: str, version: Tuple[int, int], cached_time: datetime, cache_data: Dict) -> None:
+        """Keep a parsed entry in memory, evicting the oldest beyond MEMORY_ENTRIES"""
+        with self._memory_lock:
+            self._memory[cache_key] = (version, cached_time, cache_data)
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+    
     def get(self, prompt: str, model: str = "default") -> Optional[str]:
         """Retrieve cached response if available and not expired"""
+        response, _ = self.lookup(prompt, model)
+        return response
+    
+    def lookup(self, prompt: str, model: str = "default") -> Tuple[Optional[str], bool]:
+        """
+        Retrieve a cached response and whether it is past the soft TTL, for
+        stale-while-revalidate callers. Past the hard TTL it is a miss.
+        """
         try:
             cache_key = self._get_cache_key(prompt, model)
             cache_path = self._get_cache_path(cache_key)
             
-            if not os.path.exists(cache_path):
-                return None
+            try:
+                version = self._file_version(cache_path)
+            except FileNotFoundError:
+                with self._memory_lock:
+                    self._memory.pop(cache_key, None)
+                self.misses += 1
+                return None, False
             
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
+            with self._memory_lock:
+                remembered = self._memory.get(cache_key)
+            if remembered is not None and remembered[0] == version:
+                _, cached_time, cache_data = remembered
+            else:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    cache_data = json.load(f)
+                cached_time = datetime.fromisoformat(cache_data['timestamp'])
+                self._remember(cache_key, version, cached_time, cache_data)
             
             # Check if cache is expired
-            cached_time = datetime.fromisoformat(cache_data['timestamp'])
-            if datetime.now() - cached_time > self.ttl:
+            age = datetime.now() - cached_time
+            if age > self.ttl:
                 # Cache expired, remove file
-                os.remove(cache_path)
-                return None
+                self._remove(cache_key)
+                self.misses += 1
+                return None, False
             
             # Check if the cached prompt is actually relevant to the current one
             cached_prompt = cache_data.get('prompt', '')
             
-            # For conversation-based prompts, check if they're from the same context
-            if self._is_conversation_relevant(prompt, cached_prompt):
-                print(f"Cache hit for prompt: {prompt[:50]}...")
-                return cache_data['response']
+            # For conversation-based prompts, check if they're from the same context.
+            # The key hashes the prompt, so an identical prompt needs no marker scan
+            if cached_prompt == prompt or self._is_conversation_relevant(prompt, cached_prompt):
+                logger.info("Cache hit for prompt: %s...", prompt[:50])
+                self.hits += 1
+                return cache_data['response'], age > self.soft_ttl
             else:
-                print(f"Cache found but not relevant for current context: {prompt[:50]}...")
-                return None
+                logger.info("Cache found but not relevant for current context: %s...", prompt[:50])
+                self.misses += 1
+                return None, False
             
         except Exception as e:
-            print(f"Error reading cache: {e}")
-            return None
+            logger.error("Error reading cache: %s", e)
+            return None, False
     
     def _is_conversation_relevant(self, current_prompt: str, cached_prompt: str) -> bool:
         """Check if cached response is relevant to current prompt context"""
@@ -65,20 +152,16 @@ class PromptCache:
         def extract_context_markers(prompt: str):
             markers = set()
             
+            lowered = prompt.lower()
+            
             # Look for repository names
-            import re
-            repo_pattern = r"(?:repository|repo)['\s]*[\"'`]?([a-zA-Z0-9\-_]+/[a-zA-Z0-9\-_]+)[\"'`]?"
-            repo_matches = re.findall(repo_pattern, prompt.lower())
-            markers.update(repo_matches)
+            markers.update(_REPO_MARKER_RE.findall(lowered))
             
             # Look for user IDs
-            user_pattern = r"user[_\s]*id['\s]*[\"'`]?([a-zA-Z0-9\-_]+)[\"'`]?"
-            user_matches = re.findall(user_pattern, prompt.lower())
-            markers.update(user_matches)
+            markers.update(_USER_MARKER_RE.findall(lowered))
             
             # Look for specific project names
-            project_pattern = r"[\"'`]([a-zA-Z0-9\-_]{3,})[\"'`]"
-            project_matches = re.findall(project_pattern, prompt)
+            project_matches = _PROJECT_MARKER_RE.findall(prompt)
             markers.update([m.lower() for m in project_matches if len(m) > 3])
             
             return markers
@@ -106,26 +189,34 @@ class PromptCache:
             # Limit response size to prevent huge cache files
             max_response_size = 50000  # 50KB limit
             if len(response) > max_response_size:
-                print(f"Response too large for cache ({len(response)} chars), truncating...")
+                logger.warning("Response too large for cache (%d chars), truncating...", len(response))
                 response = response[:max_response_size] + "\n\n[Response truncated for caching...]"
             
             cache_key = self._get_cache_key(prompt, model)
             cache_path = self._get_cache_path(cache_key)
             
+            cached_time = datetime.now()
             cache_data = {
                 'prompt': prompt,
                 'response': response,
                 'model': model,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': cached_time.isoformat()
             }
             
-            with open(cache_path, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, indent=2, ensure_ascii=False)
+            serialized = json.dumps(cache_data, indent=2, ensure_ascii=False)
             
-            print(f"Cached response for prompt: {prompt[:50]}...")
+            # Write to a temp file and rename so readers never see a partial file
+            tmp_path = f"{cache_path}.tmp"
+            with self._lock_for(cache_key):
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(serialized)
+                os.replace(tmp_path, cache_path)
+                self._remember(cache_key, self._file_version(cache_path), cached_time, cache_data)
+            
+            logger.info("Cached response for prompt: %s...", prompt[:50])
             
         except Exception as e:
-            print(f"Error writing cache: {e}")
+            logger.error("Error writing cache: %s", e)
     
     def clear_expired(self) -> int:
         """Remove expired cache files and return count of removed files"""
@@ -139,35 +230,57 @@ class PromptCache:
                             cache_data = json.load(f)
                         
                         cached_time = datetime.fromisoformat(cache_data['timestamp'])
-                        if datetime.now() - cached_time > self.ttl:
-                            os.remove(filepath)
-                            removed_count += 1
+                        expired = datetime.now() - cached_time > self.ttl
                     except Exception:
                         # If we can't read the file, remove it
-                        os.remove(filepath)
+                        expired = True
+                    
+                    if expired and self._remove(filename[:-len('.json')]):
                         removed_count += 1
         except Exception as e:
-            print(f"Error clearing expired cache: {e}")
+            logger.error("Error clearing expired cache: %s", e)
         
         if removed_count > 0:
-            print(f"Removed {removed_count} expired cache files")
+            logger.info("Removed %d expired cache files", removed_count)
         
         return removed_count
     
+    def start_janitor(self, interval_seconds: float = 60.0) -> None:
+        """
+        Clear expired entries from a daemon thread every interval_seconds, so
+        requests never pay for the directory scan. One thread per cache directory.
+        """
+        with PromptCache._janitor_dirs_lock:
+            cache_dir = os.path.abspath(self.cache_dir)
+            if cache_dir in PromptCache._janitor_dirs:
+                return
+            PromptCache._janitor_dirs.add(cache_dir)
+        
+        thread = threading.Thread(target=self._janitor_loop, args=(interval_seconds,),
+                                  name="prompt-cache-janitor", daemon=True)
+        thread.start()
+    
+    def _janitor_loop(self, interval_seconds: float) -> None:
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                self.clear_expired()
+            except Exception:
+                logger.exception("Prompt cache janitor failed")
+    
     def clear_all(self) -> int:
         """Remove all cache files and return count of removed files"""
         removed_count = 0
         try:
             for filename in os.listdir(self.cache_dir):
                 if filename.endswith('.json'):
-                    filepath = os.path.join(self.cache_dir, filename)
-                    os.remove(filepath)
-                    removed_count += 1
+                    if self._remove(filename[:-len('.json')]):
+                        removed_count += 1
         except Exception as e:
-            print(f"Error clearing cache: {e}")
+            logger.error("Error clearing cache: %s", e)
         
         if removed_count > 0:
-            print(f"Removed {removed_count} cache files")
+            logger.info("Removed %d cache files", removed_count)
         
         return removed_count
     
@@ -184,8 +297,11 @@ class PromptCache:
                 'total_entries': len(cache_files),
                 'total_size_bytes': total_size,
                 'total_size_mb': round(total_size / (1024 * 1024), 2),
+                'memory_entries': len(self._memory),
+                'hits': self.hits,
+                'misses': self.misses,
                 'cache_dir': self.cache_dir
             }
         except Exception as e:
-            print(f"Error getting cache stats: {e}")
+            logger.error("Error getting cache stats: %s", e)
             return {'error': str(e)}
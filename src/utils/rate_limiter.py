@@ -0,0 +1,36 @@
+"""
+Token-bucket rate limiting to pace provider calls below their request limits
+"""
+import time
+
+
+class TokenBucket:
+    """Token bucket that reserves tokens and reports how long the caller must wait"""
+
+    __slots__ = ('capacity', 'refill_rate', 'tokens', 'last')
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate  # tokens per second
+        self.tokens = capacity
+        self.last = time.monotonic()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: float) -> 'TokenBucket':
+        """Bucket allowing a burst of one minute's quota, refilled evenly"""
+        return cls(capacity=requests_per_minute, refill_rate=requests_per_minute / 60.0)
+
+    def take(self, n: float = 1) -> float:
+        """
+        Reserve n tokens and return the seconds to wait before using them.
+
+        Tokens are reserved even when the bucket is short, so concurrent callers
+        queue up behind each other instead of all waking at the same moment.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.refill_rate)
+        self.last = now
+        self.tokens -= n
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_rate
@@ -0,0 +1,117 @@
+"""
+Embedding-similarity cache that sits in front of the exact-match PromptCache
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .embeddings import DEFAULT_EMBEDDING_MODEL, load_model
+
+logger = logging.getLogger(__name__)
+
+# Prompt embeddings kept per cache, so a repeated prompt and the set() after a
+# miss don't run the model again
+EMBEDDING_MEMO_SIZE = 512
+
+
+class SemanticCache:
+    """
+    In-memory cache returning a stored response when a new prompt's embedding
+    is close enough (cosine similarity) to a previously answered one.
+
+    The embedding model is loaded on first use. If sentence-transformers is not
+    installed the cache disables itself and every lookup is a miss.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL,
+                 threshold: float = 0.95, max_entries: int = 1024,
+                 ttl_hours: int = 24, max_prompt_chars: int = 1000):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_hours * 3600
+        # MiniLM only sees the first ~256 tokens; longer prompts could look
+        # identical while differing further in, so they bypass this tier
+        self.max_prompt_chars = max_prompt_chars
+
+        self._model = None
+        self._disabled = False
+        self._lock = threading.Lock()
+        self._vectors = None  # (n, dim) float32 matrix of normalized embeddings
+        self._entries = []    # (namespace, response, timestamp) aligned with _vectors rows
+        # prompt -> embedding, least recently used evicted first
+        self._embeddings = OrderedDict()
+
+    def _get_model(self):
+        """Load the embedding model lazily"""
+        if self._model is None and not self._disabled:
+            try:
+                self._model = load_model(self.model_name)
+            except Exception as e:
+                logger.warning("Semantic cache disabled: %s", e)
+                self._disabled = True
+        return self._model
+
+    def _embed(self, prompt: str):
+        if len(prompt) > self.max_prompt_chars:
+            return None
+        with self._lock:
+            vector = self._embeddings.get(prompt)
+            if vector is not None:
+                self._embeddings.move_to_end(prompt)
+                return vector
+        model = self._get_model()
+        if model is None:
+            return None
+        vector = model.encode([prompt], normalize_embeddings=True)[0].astype('float32')
+        with self._lock:
+            self._embeddings[prompt] = vector
+            if len(self._embeddings) > EMBEDDING_MEMO_SIZE:
+                self._embeddings.popitem(last=False)
+        return vector
+
+    def get(self, prompt: str, namespace: str = "default") -> Optional[str]:
+        """Return the response of the most similar cached prompt above the threshold"""
+        query = self._embed(prompt)
+        if query is None:
+            return None
+
+        with self._lock:
+            if self._vectors is None or not self._entries:
+                return None
+            scores = self._vectors @ query
+            now = time.time()
+            for idx in scores.argsort()[::-1]:
+                if scores[idx] < self.threshold:
+                    break
+                entry_namespace, response, timestamp = self._entries[idx]
+                if entry_namespace == namespace and now - timestamp <= self.ttl_seconds:
+                    logger.info("Semantic cache hit (similarity %.3f)", scores[idx])
+                    return response
+        return None
+
+    def set(self, prompt: str, response: str, namespace: str = "default") -> None:
+        """Store a response under the prompt's embedding, evicting the oldest when full"""
+        vector = self._embed(prompt)
+        if vector is None:
+            return
+
+        import numpy as np
+        now = time.time()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = vector[None, :]
+            else:
+                self._vectors = np.vstack([self._vectors, vector])
+            self._entries.append((namespace, response, now))
+
+            # Entries are in insertion order, so expired ones and any overflow
+            # beyond max_entries are a prefix of the list
+            drop = max(0, len(self._entries) - self.max_entries)
+            while drop < len(self._entries) and now - self._entries[drop][2] > self.ttl_seconds:
+                drop += 1
+            if drop:
+                self._vectors = self._vectors[drop:]
+                self._entries = self._entries[drop:]
@@ -0,0 +1,53 @@
+"""
+Token counting and token-bounded truncation for prompt budgets
+"""
+import functools
+import logging
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=1)
+def token_encoder():
+    """tiktoken's cl100k encoder, or None when tiktoken isn't installed"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("⚠️ tiktoken unavailable, estimating tokens from length: %s", e)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text, estimated at ~4 characters each without tiktoken"""
+    encoder = token_encoder()
+    if encoder is None:
+        return len(text) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> Tuple[str, int]:
+    """
+    Cut text to at most max_tokens, backing up to the last line break so the
+    excerpt ends on a whole line. Returns the text and its token count.
+    Without tiktoken, tokens are estimated at ~4 characters each.
+    """
+    encoder = token_encoder()
+    if encoder is None:
+        if len(text) <= max_tokens * 4:
+            return text, len(text) // 4
+        truncated = text[:max_tokens * 4]
+        tokens = max_tokens
+    else:
+        # Tokens rarely average more than 8 characters, so only a prefix is encoded
+        tokens_list = encoder.encode(text[:max_tokens * 8], disallowed_special=())
+        if len(tokens_list) <= max_tokens and len(text) <= max_tokens * 8:
+            return text, len(tokens_list)
+        truncated = encoder.decode(tokens_list[:max_tokens])
+        tokens = min(len(tokens_list), max_tokens)
+
+    line_end = truncated.rfind("\n")
+    if line_end > 0:
+        truncated = truncated[:line_end + 1]
+    return truncated, tokens